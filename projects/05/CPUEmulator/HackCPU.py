@@ -0,0 +1,248 @@
+from array import array
+import sys
+
+ROM_SIZE = 32768
+RAM_SIZE = 32768
+SCREEN = 16384
+KBD = 24576
+
+# compビット(a c1..c6) -> 式. xはD, yはAまたはM
+COMP_EXPRS = {
+    0b0101010: "0",
+    0b0111111: "1",
+    0b0111010: "0xffff",
+    0b0001100: "{x}",
+    0b0110000: "{y}",
+    0b0001101: "({x} ^ 0xffff)",
+    0b0110001: "({y} ^ 0xffff)",
+    0b0001111: "(-{x} & 0xffff)",
+    0b0110011: "(-{y} & 0xffff)",
+    0b0011111: "(({x} + 1) & 0xffff)",
+    0b0110111: "(({y} + 1) & 0xffff)",
+    0b0001110: "(({x} - 1) & 0xffff)",
+    0b0110010: "(({y} - 1) & 0xffff)",
+    0b0000010: "(({x} + {y}) & 0xffff)",
+    0b0010011: "(({x} - {y}) & 0xffff)",
+    0b0000111: "(({y} - {x}) & 0xffff)",
+    0b0000000: "({x} & {y})",
+    0b0010101: "({x} | {y})",
+}
+for _c, _expr in list(COMP_EXPRS.items()):
+    COMP_EXPRS[_c | 0b1000000] = _expr
+
+# jumpビット -> 計算結果vに対する条件式 (vは符号なし16bit)
+JUMP_EXPRS = {
+    0b001: "0 < {v} < 0x8000",
+    0b010: "{v} == 0",
+    0b011: "{v} < 0x8000",
+    0b100: "{v} >= 0x8000",
+    0b101: "{v} != 0",
+    0b110: "{v} == 0 or {v} >= 0x8000",
+    0b111: "True",
+}
+
+# 1ブロックに含める最大命令数
+MAX_BLOCK_SIZE = 64
+
+
+def alu(x: int, y: int, c: int) -> int:
+    """
+    ALUの制御ビット(zx nx zy ny f no)に従って計算する
+    """
+    if c & 0b100000:
+        x = 0
+    if c & 0b010000:
+        x ^= 0xffff
+    if c & 0b001000:
+        y = 0
+    if c & 0b000100:
+        y ^= 0xffff
+    out = (x + y) & 0xffff if c & 0b000010 else x & y
+    if c & 0b000001:
+        out ^= 0xffff
+    return out
+
+
+def jumps(v: int, j: int) -> bool:
+    """
+    計算結果vでjumpビットjの条件が成立するか
+    """
+    if v == 0:
+        return bool(j & 0b010)
+    elif v & 0x8000:
+        return bool(j & 0b100)
+    else:
+        return bool(j & 0b001)
+
+
+class HackCPU():
+    """
+    Hackコンピュータのエミュレータ
+    step()は1命令ずつビットをデコードする参照実装,
+    run()はROMを基本ブロックごとにPython関数へコンパイルして実行する
+    """
+
+    def __init__(self, words=None):
+        self.rom = array('H', bytes(2 * ROM_SIZE))
+        self.ram = array('H', bytes(2 * RAM_SIZE))
+        self.A = 0
+        self.D = 0
+        self.PC = 0
+        self.cycles = 0
+        self.blocks = [None] * ROM_SIZE
+        if words is not None:
+            self.load(words)
+
+    def load(self, words):
+        """
+        機械語の列をROMの先頭に書き込みリセット
+        """
+        if len(words) > ROM_SIZE:
+            raise Exception("Error: program too large: {} words".format(len(words)))
+        self.rom[:len(words)] = array('H', words)
+        self.rom[len(words):] = array('H', bytes(2 * (ROM_SIZE - len(words))))
+        self.blocks = [None] * ROM_SIZE
+        self.reset()
+
+    def loadHack(self, filename: str):
+        """
+        .hack(1行1命令の2進テキスト)を読み込む
+        """
+        with open(filename, "r") as f:
+            self.load([int(line, 2) for line in f if line.strip()])
+
+    def loadBinary(self, filename: str):
+        """
+        Assembler --binary の出力(ビッグエンディアン2byte/命令)を読み込む
+        """
+        words = array('H')
+        with open(filename, "rb") as f:
+            words.frombytes(f.read())
+        if sys.byteorder == 'little':
+            words.byteswap()
+        self.load(words)
+
+    def reset(self):
+        """
+        PCとサイクル数を0に戻す (RAMはそのまま)
+        """
+        self.PC = 0
+        self.cycles = 0
+
+    def step(self):
+        """
+        1命令をデコードして実行
+        """
+        inst = self.rom[self.PC]
+        if not inst & 0x8000:
+            self.A = inst
+            self.PC += 1
+        else:
+            a = self.A
+            y = self.ram[a] if inst & 0x1000 else a
+            v = alu(self.D, y, (inst >> 6) & 0b111111)
+            if inst & 0b001000:
+                self.ram[a] = v
+            if inst & 0b010000:
+                self.D = v
+            if inst & 0b100000:
+                self.A = v
+            if inst & 0b111 and jumps(v, inst & 0b111):
+                self.PC = a
+            else:
+                self.PC += 1
+        self.cycles += 1
+
+    def run(self, cycles: int, breakpoints: set = None) -> bool:
+        """
+        cyclesだけ命令を実行する
+        ブロック単位で実行し, 残りがブロックに満たない分はstep()で進める
+        breakpointsを指定した場合, そのアドレスから始まるブロックに入る前に止まりTrueを返す
+        """
+        limit = self.cycles + cycles
+        blocks = self.blocks
+        count = self.cycles
+        pc, a, d = self.PC, self.A, self.D
+        try:
+            while True:
+                if breakpoints is not None and pc in breakpoints:
+                    return True
+                block = blocks[pc]
+                if block is None:
+                    block = self.compileBlock(pc)
+                func, n = block
+                if count + n > limit:
+                    break
+                pc, a, d = func(a, d)
+                count += n
+        except IndexError:
+            raise Exception("Error: illegal address at block PC={}".format(pc))
+        finally:
+            self.PC, self.A, self.D = pc, a, d
+            self.cycles = count
+        while self.cycles < limit:
+            if breakpoints is not None and self.PC in breakpoints:
+                return True
+            self.step()
+        return False
+
+    def compileBlock(self, start: int):
+        """
+        startから分岐命令(またはMAX_BLOCK_SIZE)までを1つの関数にする
+        関数は (a, d) を受け取り (次のPC, a, d) を返す
+        """
+        lines = []
+        known_a = None  # ブロック内で静的に分かっているAの値
+        pc = start
+        next_pc = None
+        while pc < ROM_SIZE and pc - start < MAX_BLOCK_SIZE:
+            inst = self.rom[pc]
+            pc += 1
+            if not inst & 0x8000:
+                known_a = inst
+                continue
+
+            a_expr = "a" if known_a is None else str(known_a)
+            m_expr = "ram[{}]".format(a_expr)
+            c = (inst >> 6) & 0b1111111
+            if c in COMP_EXPRS:
+                expr = COMP_EXPRS[c].format(x="d", y=m_expr if c & 0b1000000 else a_expr)
+            else:
+                expr = "alu(d, {}, {})".format(
+                    m_expr if c & 0b1000000 else a_expr, c & 0b111111)
+            j = inst & 0b111
+            if known_a is not None and inst & 0b100000:
+                # Aを書き換える前に確定値を反映
+                lines.append("a = {}".format(known_a))
+            lines.append("v = {}".format(expr))
+            if inst & 0b001000:
+                lines.append("{} = v".format(m_expr))
+            if j:
+                lines.append("t = {}".format(a_expr))
+            if inst & 0b010000:
+                lines.append("d = v")
+            if inst & 0b100000:
+                lines.append("a = v")
+                known_a = None
+            if j:
+                if known_a is not None:
+                    lines.append("a = {}".format(known_a))
+                if j == 0b111:
+                    lines.append("return t, a, d")
+                else:
+                    lines.append("return (t if {} else {}), a, d".format(
+                        JUMP_EXPRS[j].format(v="v"), pc))
+                next_pc = pc
+                break
+
+        if next_pc is None:
+            if known_a is not None:
+                lines.append("a = {}".format(known_a))
+            lines.append("return {}, a, d".format(pc))
+        source = "def block(a, d, ram=ram, alu=alu):\n" + \
+            "".join("    {}\n".format(l) for l in lines)
+        namespace = {'ram': self.ram, 'alu': alu}
+        exec(compile(source, "<rom {}>".format(start), "exec"), namespace)
+        block = (namespace['block'], pc - start)
+        self.blocks[start] = block
+        return block
@@ -0,0 +1,281 @@
+import HackCPU
+import argparse
+import os
+import random
+import re
+import sys
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.append(os.path.join(PROJECT_DIR, '08', 'VMtranslator'))
+import ModuleLoader  # noqa: E402
+
+SourceMap = ModuleLoader.load(os.path.join(PROJECT_DIR, '06', 'assember'), 'SourceMap')
+
+# どの関数にも属さないコード (ブートストラップ, 共有のcall/returnルーチン) の名前
+NO_FUNCTION = '(runtime)'
+# フレームをたどる最大の深さ (壊れたフレームで止まらないように)
+MAX_DEPTH = 1024
+# --sampleの既定の平均サンプル間隔 [cycle]
+SAMPLE_INTERVAL = 10000
+
+
+class Profile():
+    """
+    計測結果
+    stacks: コールスタック (関数名のタプル, 外側から順) -> サイクル数
+    lines: (.vmのファイル名, 行番号) -> サイクル数. VMコマンドより前のコードは (None, None)
+    calls: 関数名 -> 呼び出し回数 (サンプリングでは数えない)
+    """
+
+    def __init__(self):
+        self.stacks = {}
+        self.lines = {}
+        self.calls = {}
+        self.cycles = 0
+        self.samples = 0
+
+    def exclusive(self) -> dict:
+        """
+        関数 -> その関数自身のコードで使ったサイクル数
+        """
+        result = {}
+        for stack, n in self.stacks.items():
+            name = stack[-1]
+            result[name] = result.get(name, 0) + n
+        return result
+
+    def inclusive(self) -> dict:
+        """
+        関数 -> 呼び出した関数の分も含めたサイクル数 (再帰は1回だけ数える)
+        """
+        result = {}
+        for stack, n in self.stacks.items():
+            for name in set(stack):
+                result[name] = result.get(name, 0) + n
+        return result
+
+    def collapsed(self) -> str:
+        """
+        flamegraph.plの入力形式 ("外側;...;内側 サイクル数" の行)
+        """
+        return "".join("{} {}\n".format(';'.join(stack), n)
+                       for stack, n in sorted(self.stacks.items()))
+
+    def report(self, top: int = 20) -> str:
+        total = self.cycles or 1
+        exclusive = self.exclusive()
+        inclusive = self.inclusive()
+        out = ["{} cycles{}".format(self.cycles, ", {} samples".format(self.samples)
+                                    if self.samples else ""),
+               "{:>12} {:>6} {:>12} {:>6} {:>8}  function".format(
+                   'exclusive', '%', 'inclusive', '%', 'calls')]
+        for name, n in sorted(exclusive.items(), key=lambda item: -item[1])[:top]:
+            out.append("{:>12} {:>6.1f} {:>12} {:>6.1f} {:>8}  {}".format(
+                n, n * 100 / total, inclusive[name], inclusive[name] * 100 / total,
+                self.calls.get(name, '-'), name))
+        out.append("{:>12} {:>6}  line".format('cycles', '%'))
+        for (filename, line), n in sorted(self.lines.items(), key=lambda item: -item[1])[:top]:
+            location = "{}:{}".format(filename, line) if filename is not None else NO_FUNCTION
+            out.append("{:>12} {:>6.1f}  {}".format(n, n * 100 / total, location))
+        return "\n".join(out)
+
+
+class Profiler():
+    """
+    HackCPUで実行しながら, ソースマップを使ってVMの関数と行ごとにサイクル数を数える
+    profile(): ブロックごとにコールスタックを追う (関数の先頭に入ったらpush, 戻りアドレスに来たらpop)
+    sample(): 一定サイクルごとに, LCLからフレームをたどってスタックを得る
+    """
+
+    def __init__(self, cpu: HackCPU.HackCPU, source_map: SourceMap.SourceMap):
+        self.cpu = cpu
+        self.source_map = source_map
+        self.entries = dict(zip(source_map.function_addresses, source_map.function_names))
+        # 最初の関数より前はブートストラップと共有のcall/returnルーチン
+        self.first_function = source_map.function_addresses[0] \
+            if source_map.function_addresses else len(source_map.asm_lines)
+        self.result = Profile()
+        self.frames = []   # 呼び出し元の (スタック, 戻りアドレス, LCL)
+        self.stack = ()
+        self.ret = None
+        self.lcl = None    # 今の関数から戻った時のLCL (呼び出し元のLCL)
+        self.hits = {}     # ブロックの先頭アドレス -> 実行回数
+
+    def profile(self, cycles: int) -> Profile:
+        """
+        cyclesを超えない範囲でブロック単位に実行する
+        関数の先頭はcallからしか来ないので, そこに入った時のRAM[LCL-5]がその呼び出しの戻りアドレス,
+        RAM[LCL-4]が呼び出し元のLCL. 戻りアドレスで, LCLも戻っていればreturnとみなす
+        (ブートストラップの戻りアドレスは共有のcallルーチンの先頭と重なることがある)
+        関数の外のコードは, スタックの先に NO_FUNCTION を付けて数える
+        """
+        cpu = self.cpu
+        ram = cpu.ram
+        blocks = cpu.blocks
+        entries = self.entries
+        frames = self.frames
+        stacks = self.result.stacks
+        calls = self.result.calls
+        hits = self.hits
+        first_function = self.first_function
+        stack, ret, lcl = self.stack, self.ret, self.lcl
+        start = cpu.cycles
+        limit = start + cycles
+        count = start
+        pc, a, d = cpu.PC, cpu.A, cpu.D
+        try:
+            while True:
+                block = blocks[pc]
+                if block is None:
+                    block = cpu.compileBlock(pc)
+                func, n = block
+                if count + n > limit:
+                    break
+                if pc in entries:
+                    name = entries[pc]
+                    frames.append((stack, ret, lcl))
+                    stack = stack + (name,)
+                    ret = ram[ram[1] - 5]
+                    lcl = ram[ram[1] - 4]
+                    calls[name] = calls.get(name, 0) + 1
+                elif pc == ret and ram[1] == lcl:
+                    stack, ret, lcl = frames.pop()
+                hits[pc] = hits.get(pc, 0) + 1
+                key = stack if pc >= first_function else stack + (NO_FUNCTION,)
+                stacks[key] = stacks.get(key, 0) + n
+                pc, a, d = func(a, d)
+                count += n
+        except IndexError:
+            raise Exception("Error: illegal address at block PC={}".format(pc))
+        finally:
+            cpu.PC, cpu.A, cpu.D = pc, a, d
+            cpu.cycles = count
+            self.stack, self.ret, self.lcl = stack, ret, lcl
+        self.result.cycles += count - start
+        self.countLines()
+        return self.result
+
+    def countLines(self):
+        """
+        ブロックの実行回数を, ブロック内の命令が属するVMの行に配る
+        """
+        lines = self.result.lines
+        source_map = self.source_map
+        for start, count in self.hits.items():
+            for address in range(start, start + self.cpu.blocks[start][1]):
+                location = source_map.vmLocation(address) or (None, None)
+                lines[location] = lines.get(location, 0) + count
+        self.hits.clear()
+
+    def sample(self, cycles: int, interval: int = SAMPLE_INTERVAL, seed: int = 0) -> Profile:
+        """
+        profileと同じくブロック単位で実行し, 平均intervalサイクルごとに, そのサイクルを含むブロックの
+        先頭でのスタックと, 実行中の命令のVMの行を記録する. 記録には直前のサンプルからのサイクル数を数える
+        ループとの周期の重なりを避けるため, 間隔はinterval/2からinterval*3/2の間で揺らす
+        """
+        cpu = self.cpu
+        blocks = cpu.blocks
+        rand = random.Random(seed)
+        low, high = interval // 2, interval * 3 // 2
+        start = cpu.cycles
+        limit = start + cycles
+        count = last = start
+        next_sample = count + rand.randint(low, high)
+        # ブロックごとの比較を1回にするため, 次のサンプルと終わりの近い方を見る
+        check = min(next_sample, limit)
+        pc, a, d = cpu.PC, cpu.A, cpu.D
+        try:
+            while True:
+                block = blocks[pc]
+                if block is None:
+                    block = cpu.compileBlock(pc)
+                func, n = block
+                if count + n > check:
+                    if count + n > limit:
+                        break
+                    while count + n > next_sample:
+                        # このブロックのnext_sample - count番目の命令を実行中にサンプルする
+                        self.record(pc, pc + next_sample - count, next_sample - last)
+                        last = next_sample
+                        next_sample += rand.randint(low, high)
+                    check = min(next_sample, limit)
+                pc, a, d = func(a, d)
+                count += n
+        except IndexError:
+            raise Exception("Error: illegal address at block PC={}".format(pc))
+        finally:
+            cpu.PC, cpu.A, cpu.D = pc, a, d
+            cpu.cycles = count
+        if count > last:
+            self.record(pc, pc, count - last)
+        self.result.cycles += count - start
+        return self.result
+
+    def record(self, pc: int, address: int, n: int):
+        """
+        ブロックの先頭pcでのスタックと, ブロック内で実行中のaddressの行にnサイクルを足す
+        """
+        stack = self.walk(pc)
+        stacks = self.result.stacks
+        stacks[stack] = stacks.get(stack, 0) + n
+        location = self.source_map.vmLocation(address) or (None, None)
+        self.result.lines[location] = self.result.lines.get(location, 0) + n
+        self.result.samples += 1
+
+    def walk(self, pc: int) -> tuple:
+        """
+        pcの関数と, LCLから戻りアドレス (LCL-5) と呼び出し元のLCL (LCL-4) をたどったスタック
+        """
+        ram = self.cpu.ram
+        source_map = self.source_map
+        size = len(source_map.asm_lines)
+        names = []
+        leaf = source_map.function(pc) if pc < size else None
+        lcl = ram[1]
+        while lcl >= 5 and len(names) < MAX_DEPTH:
+            ret = ram[lcl - 5]
+            caller = source_map.function(ret) if ret < size else None
+            if caller is None:
+                break
+            names.append(caller)
+            lcl = ram[lcl - 4]
+        names.reverse()
+        names.append(leaf if leaf is not None else NO_FUNCTION)
+        return tuple(names)
+
+
+def profile():
+    arg_parser = argparse.ArgumentParser(
+        description='Profile a translated VM program per function and VM line.')
+    arg_parser.add_argument('program', type=str, help='.hack or .bin file')
+    arg_parser.add_argument('--map', type=str, default=None,
+                            help='source map from Assembler --source-map (default: same name .map)')
+    arg_parser.add_argument('--cycles', type=int, default=10000000)
+    arg_parser.add_argument('--sample', type=int, nargs='?', const=SAMPLE_INTERVAL, default=None,
+                            metavar='INTERVAL',
+                            help='sample the call stack every INTERVAL cycles on average '
+                                 '(default: {})'.format(SAMPLE_INTERVAL))
+    arg_parser.add_argument('--top', type=int, default=20)
+    arg_parser.add_argument('--collapsed', type=str, default=None,
+                            help='write collapsed stacks for flamegraph.pl')
+    args = arg_parser.parse_args()
+
+    cpu = HackCPU.HackCPU()
+    if args.program.endswith('.bin'):
+        cpu.loadBinary(args.program)
+    else:
+        cpu.loadHack(args.program)
+    map_file = args.map if args.map is not None else re.sub(r"\.(hack|bin)$", ".map", args.program)
+    profiler = Profiler(cpu, SourceMap.SourceMap.load(map_file))
+    if args.sample is not None:
+        result = profiler.sample(args.cycles, args.sample)
+    else:
+        result = profiler.profile(args.cycles)
+    print(result.report(args.top))
+    if args.collapsed is not None:
+        with open(args.collapsed, "w") as f:
+            f.write(result.collapsed())
+
+
+if __name__ == "__main__":
+    profile()
@@ -0,0 +1,307 @@
+import HackCPU
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import glob
+import os
+import re
+import sys
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.append(os.path.join(PROJECT_DIR, '08', 'VMtranslator'))
+import ModuleLoader  # noqa: E402
+
+# 06/assemberと08/VMtranslatorはどちらもParserモジュールを持つので, Assemblerは別名で読み込む
+Assembler = ModuleLoader.load(os.path.join(PROJECT_DIR, '06', 'assember'), 'Assembler')
+
+TOKEN_REGREP = re.compile(r'//[^\n]*|/\*.*?\*/|([,;{}])|("[^"]*"|[^\s,;{}"]+)', re.S)
+OUTPUT_FORMAT_REGREP = re.compile(r"^([^%]+)%([BXDS])(\d+)\.(\d+)\.(\d+)$")
+RAM_REGREP = re.compile(r"^RAM\[(\d+)\]$")
+CONDITION_REGREP = re.compile(r"^(.+?)(<>|<=|>=|=|<|>)(.+)$")
+
+
+class ComparisonFailure(Exception):
+    pass
+
+
+class TestScript():
+    """
+    CPUエミュレータ用の.tstスクリプトをHackCPU上で実行する
+    対応コマンド: load, output-file, compare-to, output-list, set,
+                  ticktock, tick, tock, output, echo, clear-echo, repeat, while
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.dirname = os.path.dirname(os.path.abspath(filename))
+        with open(filename, "r") as f:
+            self.commands = self.parse(self.tokenize(f.read()))
+        self.cpu = HackCPU.HackCPU()
+        self.output_file = None
+        self.output_list = []
+        self.outputs = []
+        self.compare_lines = None
+
+    @staticmethod
+    def tokenize(source: str):
+        for m in TOKEN_REGREP.finditer(source):
+            if m.group(1) is not None:
+                yield m.group(1)
+            elif m.group(2) is not None:
+                yield m.group(2)
+
+    @classmethod
+    def parse(cls, tokens) -> list:
+        """
+        トークン列をコマンドのリストにする
+        コマンドは単語のリスト, repeatは ('repeat', 回数, 本体),
+        whileは ('while', (変数, 比較, 値), 本体)
+        """
+        commands = []
+        words = []
+        tokens = iter(tokens)
+        for token in tokens:
+            if token in [',', ';']:
+                if words:
+                    commands.append(words)
+                words = []
+            elif token == '{':
+                if words and words[0] == 'repeat':
+                    count = int(words[1]) if len(words) > 1 else -1
+                    commands.append(('repeat', count, cls.parse(tokens)))
+                elif words and words[0] == 'while':
+                    m = CONDITION_REGREP.match(''.join(words[1:]))
+                    if m is None:
+                        raise Exception("Unsupported condition: {}".format(' '.join(words)))
+                    commands.append(('while', m.groups(), cls.parse(tokens)))
+                else:
+                    raise Exception("Unsupported block: {}".format(' '.join(words)))
+                words = []
+            elif token == '}':
+                break
+            else:
+                words.append(token)
+        if words:
+            commands.append(words)
+        return commands
+
+    def run(self):
+        """
+        スクリプトを実行し, compare-toがあれば出力を比較する
+        """
+        try:
+            self.execute(self.commands)
+        finally:
+            if self.output_file is not None:
+                with open(self.output_file, "w") as f:
+                    f.write(''.join(l + '\n' for l in self.outputs))
+
+    def execute(self, commands: list):
+        for command in commands:
+            if command[0] == 'repeat':
+                _, count, body = command
+                if count < 0:
+                    raise Exception("Unsupported: repeat without count")
+                if all(c == ['ticktock'] for c in body):
+                    self.cpu.run(count * len(body))
+                else:
+                    for _ in range(count):
+                        self.execute(body)
+            elif command[0] == 'while':
+                _, condition, body = command
+                while self.condition(condition):
+                    self.execute(body)
+            else:
+                self.executeCommand(command)
+
+    def condition(self, condition: tuple) -> bool:
+        """
+        whileの条件. 値は16bitの符号付きとして比べる
+        """
+        variable, op, value = condition
+        left = self.toSigned(self.get(variable))
+        right = self.toSigned(self.parseValue(value))
+        if op == '=':
+            return left == right
+        elif op == '<>':
+            return left != right
+        elif op == '<':
+            return left < right
+        elif op == '>':
+            return left > right
+        elif op == '<=':
+            return left <= right
+        return left >= right
+
+    @staticmethod
+    def toSigned(value: int) -> int:
+        value &= 0xffff
+        return value - 0x10000 if value & 0x8000 else value
+
+    def executeCommand(self, words: list):
+        name, args = words[0], words[1:]
+        if name == 'load':
+            self.load(os.path.join(self.dirname, args[0]))
+        elif name == 'output-file':
+            self.output_file = os.path.join(self.dirname, args[0])
+        elif name == 'compare-to':
+            with open(os.path.join(self.dirname, args[0]), "r") as f:
+                self.compare_lines = [l.rstrip('\r\n') for l in f]
+        elif name == 'output-list':
+            self.output_list = [self.parseOutputFormat(a) for a in args]
+            self.writeOutput('|' + ''.join(self.formatHeader(*o) for o in self.output_list))
+        elif name == 'set':
+            self.set(args[0], self.parseValue(args[1]))
+        elif name == 'ticktock':
+            self.cpu.run(1)
+        elif name in ['tick', 'tock']:
+            # tickとtockで1サイクル
+            if name == 'tock':
+                self.cpu.run(1)
+        elif name == 'output':
+            self.writeOutput('|' + ''.join(self.formatValue(*o) for o in self.output_list))
+        elif name in ['echo', 'clear-echo', 'breakpoint', 'clear-breakpoints']:
+            pass
+        else:
+            raise Exception("Unsupported command: {}".format(' '.join(words)))
+
+    def load(self, path: str):
+        if path.endswith('.asm'):
+            self.cpu.load(Assembler.assembleSinglePass(path))
+        elif path.endswith('.hack'):
+            self.cpu.loadHack(path)
+        else:
+            raise Exception("Unsupported program: {}".format(path))
+
+    def set(self, variable: str, value: int):
+        value &= 0xffff
+        m = RAM_REGREP.match(variable)
+        if m is not None:
+            self.cpu.ram[int(m.group(1))] = value
+        elif variable == 'PC':
+            self.cpu.PC = value
+        elif variable == 'A':
+            self.cpu.A = value
+        elif variable == 'D':
+            self.cpu.D = value
+        else:
+            raise Exception("Unsupported variable: {}".format(variable))
+
+    def get(self, variable: str) -> int:
+        m = RAM_REGREP.match(variable)
+        if m is not None:
+            return self.cpu.ram[int(m.group(1))]
+        elif variable == 'PC':
+            return self.cpu.PC
+        elif variable == 'A':
+            return self.cpu.A
+        elif variable == 'D':
+            return self.cpu.D
+        elif variable == 'time':
+            return self.cpu.cycles
+        else:
+            raise Exception("Unsupported variable: {}".format(variable))
+
+    @staticmethod
+    def parseValue(value: str) -> int:
+        if value.startswith('%B'):
+            return int(value[2:], 2)
+        elif value.startswith('%X'):
+            return int(value[2:], 16)
+        elif value.startswith('%D'):
+            return int(value[2:])
+        return int(value)
+
+    @staticmethod
+    def parseOutputFormat(item: str) -> tuple:
+        m = OUTPUT_FORMAT_REGREP.match(item)
+        if m is None:
+            raise Exception("Unsupported output format: {}".format(item))
+        variable, fmt, pad_left, length, pad_right = m.groups()
+        return variable, fmt, int(pad_left), int(length), int(pad_right)
+
+    @staticmethod
+    def formatHeader(variable: str, fmt: str, pad_left: int, length: int, pad_right: int) -> str:
+        width = pad_left + length + pad_right
+        name = variable[:width]
+        left = (width - len(name)) // 2
+        return ' ' * left + name + ' ' * (width - len(name) - left) + '|'
+
+    def formatValue(self, variable: str, fmt: str, pad_left: int, length: int, pad_right: int) -> str:
+        value = self.get(variable)
+        if fmt == 'D':
+            text = str(self.toSigned(value))
+        elif fmt == 'X':
+            text = "{:04X}".format(value)
+        elif fmt == 'B':
+            text = "{:016b}".format(value)[-length:]
+        else:
+            text = str(value)
+        return ' ' * pad_left + text.rjust(length) + ' ' * pad_right + '|'
+
+    def writeOutput(self, line: str):
+        self.outputs.append(line)
+        if self.compare_lines is not None:
+            n = len(self.outputs)
+            if n > len(self.compare_lines) or not self.matches(self.compare_lines[n - 1], line):
+                raise ComparisonFailure(
+                    "Comparison failure at line {}".format(n))
+
+    @staticmethod
+    def matches(expected: str, line: str) -> bool:
+        """
+        .cmpの '*' は任意の1文字に一致する (Java版と同じ)
+        """
+        if expected == line:
+            return True
+        return len(expected) == len(line) and \
+            all(e == '*' or e == c for e, c in zip(expected, line))
+
+
+def runTest(filename: str) -> tuple:
+    """
+    1つの.tstを実行し (ファイル名, 結果, メッセージ) を返す
+    結果は 'passed' / 'failed' / 'error'
+    """
+    try:
+        TestScript(filename).run()
+        return filename, 'passed', ''
+    except ComparisonFailure as e:
+        return filename, 'failed', str(e)
+    except Exception as e:
+        return filename, 'error', "{}: {}".format(type(e).__name__, e)
+
+
+def findTests(paths: list) -> list:
+    """
+    パスから.tstを集める. ディレクトリの場合はVMエミュレータ用(*VME.tst)を除く
+    """
+    tests = []
+    for path in paths:
+        if os.path.isdir(path):
+            tests += sorted(f for f in glob.glob(os.path.join(path, '**', '*.tst'), recursive=True)
+                            if not f.endswith('VME.tst'))
+        else:
+            tests.append(path)
+    return tests
+
+
+def runTests(tests: list, workers: int = 1) -> list:
+    if workers <= 1:
+        return [runTest(t) for t in tests]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(runTest, tests))
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(
+        description='Run CPU emulator test scripts (.tst) without the JVM.')
+    arg_parser.add_argument('paths', type=str, nargs='+', help='tst file or directory')
+    arg_parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(),
+                            help='number of worker processes')
+    args = arg_parser.parse_args()
+
+    results = runTests(findTests(args.paths), args.workers)
+    for filename, status, message in results:
+        print("{:<7} {} {}".format(status, filename, message))
+    if any(status != 'passed' for _, status, _ in results):
+        sys.exit(1)
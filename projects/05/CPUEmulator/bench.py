@@ -0,0 +1,219 @@
+import HackCPU
+import Profiler
+import TestScript
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+ASSEMBLER_DIR = os.path.join(PROJECT_DIR, '06', 'assember')
+VMTRANSLATOR_DIR = os.path.join(PROJECT_DIR, '08', 'VMtranslator')
+VMTRANSLATOR_07_DIR = os.path.join(PROJECT_DIR, '07', 'VMtranslator')
+CPU_EMULATOR_SH = os.path.join(PROJECT_DIR, '..', 'tools', 'CPUEmulator.sh')
+PONG_ASM = os.path.join(PROJECT_DIR, '06', 'pong', 'Pong.asm')
+JACK_COMPILER_DIR = os.path.join(PROJECT_DIR, '11', 'JackCompiler')
+OS_DIR = os.path.join(PROJECT_DIR, '..', 'tools', 'OS')
+FUNCTION_CALLS = [
+    os.path.join(PROJECT_DIR, '08', 'FunctionCalls', name)
+    for name in ['FibonacciElement', 'NestedCall', 'StaticsTest']
+]
+
+# TestScriptが08/VMtranslatorをsys.pathに追加している
+import ModuleLoader  # noqa: E402
+
+Assembler = ModuleLoader.load(ASSEMBLER_DIR, 'Assembler')
+SourceMap = ModuleLoader.load(ASSEMBLER_DIR, 'SourceMap')
+
+
+def translate(program_dir: str, tmp: str, options: list = ()) -> str:
+    """
+    program_dirの.vmファイルを08/VMtranslatorで変換し, .asmのパスを返す
+    .jackがあればJackCompilerで.vmにしてOSと合わせる
+    """
+    dst_dir = os.path.join(tmp, os.path.basename(os.path.normpath(program_dir)))
+    os.makedirs(dst_dir)
+    jack_files = glob.glob(os.path.join(program_dir, '*.jack'))
+    for f in glob.glob(os.path.join(program_dir, '*.vm')) + jack_files:
+        shutil.copy(f, dst_dir)
+    if jack_files:
+        subprocess.run([sys.executable, 'JackCompiler.py', dst_dir],
+                       cwd=JACK_COMPILER_DIR, check=True)
+        for f in glob.glob(os.path.join(OS_DIR, '*.vm')):
+            shutil.copy(f, dst_dir)
+    subprocess.run([sys.executable, 'VMtranslator.py', dst_dir] + list(options),
+                   cwd=VMTRANSLATOR_DIR, check=True, stdout=subprocess.DEVNULL)
+    return dst_dir + '.asm'
+
+
+def prepareSuite(tmp: str) -> list:
+    """
+    07, 08のテストディレクトリをtmpにコピーして.asmを生成し, .tstのリストを返す
+    07は07/VMtranslator (ブートストラップなし), 08は08/VMtranslatorで変換する
+    08でもSys.vmのないテストはブートストラップなしを前提にしているので--no-bootstrapを付ける
+    """
+    for project, translator in [('07', VMTRANSLATOR_07_DIR), ('08', VMTRANSLATOR_DIR)]:
+        for tst in TestScript.findTests([os.path.join(PROJECT_DIR, project)]):
+            src_dir = os.path.dirname(tst)
+            dst_dir = os.path.join(tmp, os.path.relpath(src_dir, PROJECT_DIR))
+            shutil.copytree(src_dir, dst_dir)
+            options = []
+            if project == '07':
+                target = glob.glob(os.path.join(dst_dir, '*.vm'))[0]
+            else:
+                target = dst_dir
+                if not os.path.exists(os.path.join(dst_dir, 'Sys.vm')):
+                    options = ['--no-bootstrap']
+            subprocess.run([sys.executable, 'VMtranslator.py', target] + options,
+                           cwd=translator, check=True, stdout=subprocess.DEVNULL)
+            if project == '08':
+                shutil.move(dst_dir + '.asm', dst_dir)
+    return TestScript.findTests([tmp])
+
+
+def benchSuite(args):
+    """
+    07/08のテストスイートを逐次/プロセスプールで実行 (javaがあればJava版とも比較)
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        tests = prepareSuite(tmp)
+        results = None
+        for workers in [1, args.workers]:
+            start = time.perf_counter()
+            results = TestScript.runTests(tests, workers)
+            elapsed = time.perf_counter() - start
+            print("python -j{:<3} {:>3} tests {:>10.1f} ms".format(
+                workers, len(tests), elapsed * 1000))
+        for filename, status, message in results:
+            print("  {:<7} {} {}".format(status, os.path.relpath(filename, tmp), message))
+
+        if shutil.which('java') is None:
+            print("java not found: skip CPUEmulator.sh")
+        else:
+            start = time.perf_counter()
+            for tst in tests:
+                subprocess.run([CPU_EMULATOR_SH, tst], stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+            elapsed = time.perf_counter() - start
+            print("java {:>11} tests {:>10.1f} ms".format(len(tests), elapsed * 1000))
+        failed = [f for f, status, _ in results if status != 'passed']
+        if failed:
+            sys.exit("{} of {} tests failed".format(len(failed), len(results)))
+
+
+def runCycles(words, cycles: int, engine: str) -> HackCPU.HackCPU:
+    cpu = HackCPU.HackCPU(words)
+    if engine == 'step':
+        for _ in range(cycles):
+            cpu.step()
+    else:
+        cpu.run(cycles)
+    return cpu
+
+
+def benchCycles(args):
+    """
+    1命令ずつのデコード実行とブロックコンパイル実行のcycles/secを比較
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        programs = [PONG_ASM] + [translate(d, tmp) for d in FUNCTION_CALLS]
+        for asm in programs:
+            words = Assembler.assembleSinglePass(asm)
+            print("{} ({} words)".format(os.path.basename(asm), len(words)))
+            for engine, cycles in [('step', args.step_cycles), ('run', args.cycles)]:
+                start = time.perf_counter()
+                runCycles(words, cycles, engine)
+                elapsed = time.perf_counter() - start
+                print("{:<8} {:>10} cycles {:>10.1f} ms {:>12.0f} cycles/s".format(
+                    engine, cycles, elapsed * 1000, cycles / elapsed))
+
+            # 同じサイクル数で両エンジンの状態が一致するか
+            expected = runCycles(words, args.step_cycles, 'step')
+            actual = runCycles(words, args.step_cycles, 'run')
+            if (expected.PC, expected.A, expected.D, expected.ram) != \
+                    (actual.PC, actual.A, actual.D, actual.ram):
+                raise Exception("Error: engine mismatch on {}".format(asm))
+
+
+def benchProfile(args):
+    """
+    プロファイラなし/ブロックごとの計測/サンプリングで同じサイクル数を実行し, オーバーヘッドを比較
+    """
+    # Pong + OSはそのままでは32K命令に収まらないので, call/returnを共有し未使用の関数を除く
+    programs = [(os.path.join(PROJECT_DIR, '08', 'FunctionCalls', 'FibonacciElement'), []),
+                (os.path.join(PROJECT_DIR, '11', 'Pong'), ['--trampoline', '--link'])]
+    with tempfile.TemporaryDirectory() as tmp:
+        for program_dir, options in programs:
+            asm = translate(program_dir, tmp, options)
+            source_map = SourceMap.SourceMap()
+            words = Assembler.assembleSinglePass(asm, source_map=source_map)
+            print("{} {} ({} words, {} functions, {} cycles)".format(
+                os.path.basename(program_dir), ' '.join(options), len(words),
+                len(source_map.function_names), args.cycles))
+
+            def runPlain():
+                HackCPU.HackCPU(words).run(args.cycles)
+
+            def runExact():
+                return Profiler.Profiler(HackCPU.HackCPU(words), source_map).profile(args.cycles)
+
+            def runSampling(interval: int):
+                return Profiler.Profiler(HackCPU.HackCPU(words), source_map).sample(
+                    args.cycles, interval)
+
+            base = measureTime(runPlain, args.repeat)
+            print("{:<16} {:>10.1f} ms".format('run', base * 1000))
+            for name, func, fargs in [('exact', runExact, ()),
+                                      ('sample 1000', runSampling, (1000,)),
+                                      ('sample {}'.format(Profiler.SAMPLE_INTERVAL), runSampling,
+                                       (Profiler.SAMPLE_INTERVAL,))]:
+                elapsed = measureTime(lambda: func(*fargs), args.repeat)
+                print("{:<16} {:>10.1f} ms {:>+8.1f} %".format(
+                    name, elapsed * 1000, (elapsed / base - 1) * 100))
+
+            exact = runExact()
+            sampled = runSampling(1000)
+            # サンプリングの関数ごとの割合が正確な計測からどれだけずれるか
+            exclusive = exact.exclusive()
+            estimate = sampled.exclusive()
+            error = max(abs(estimate.get(name, 0) - n) for name, n in exclusive.items())
+            print("sample 1000 max exclusive error {:.2f} % of cycles".format(
+                error * 100 / exact.cycles))
+            print(exact.report(args.top))
+
+
+def measureTime(func, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='CPU emulator benchmarks.')
+    subparsers = arg_parser.add_subparsers(dest='bench', required=True)
+
+    cycles = subparsers.add_parser('cycles', help=benchCycles.__doc__)
+    cycles.add_argument('--cycles', type=int, default=5000000)
+    cycles.add_argument('--step-cycles', type=int, default=200000)
+    cycles.set_defaults(func=benchCycles)
+
+    suite = subparsers.add_parser('suite', help=benchSuite.__doc__)
+    suite.add_argument('--workers', type=int, default=os.cpu_count())
+    suite.set_defaults(func=benchSuite)
+
+    profile = subparsers.add_parser('profile', help=benchProfile.__doc__)
+    profile.add_argument('--cycles', type=int, default=10000000)
+    profile.add_argument('--repeat', type=int, default=3)
+    profile.add_argument('--top', type=int, default=10)
+    profile.set_defaults(func=benchProfile)
+
+    args = arg_parser.parse_args()
+    args.func(args)
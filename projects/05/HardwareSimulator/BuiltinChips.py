@@ -0,0 +1,204 @@
+import os
+
+# tools/builtInChipsの.hdlはピンの宣言だけを持ち, 動作はここでゲートとメモリに展開する
+BUILTIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '..', '..', '..', 'tools', 'builtInChips')
+
+
+def fullAdder(builder, a: str, b: str, c: str) -> tuple:
+    """
+    (sum, carry)
+    """
+    t = builder.gate('xor', a, b)
+    return builder.gate('xor', t, c), builder.gate('or', builder.gate('and', a, b),
+                                                   builder.gate('and', t, c))
+
+
+def add(builder, a: list, b: list, carry: str) -> list:
+    out = []
+    for x, y in zip(a, b):
+        s, carry = fullAdder(builder, x, y, carry)
+        out.append(s)
+    return out
+
+
+def increment(builder, a: list) -> list:
+    out = []
+    carry = builder.TRUE
+    for x in a:
+        out.append(builder.gate('xor', x, carry))
+        carry = builder.gate('and', x, carry)
+    return out
+
+
+def mux(builder, a: list, b: list, sel: str) -> list:
+    return [builder.gate('mux', x, y, sel) for x, y in zip(a, b)]
+
+
+def muxTree(builder, ins: list, sel: list) -> list:
+    """
+    sel[0]から順に隣り合う入力の組を選ぶ
+    """
+    for s in sel:
+        ins = [mux(builder, ins[i], ins[i + 1], s) for i in range(0, len(ins), 2)]
+    return ins[0]
+
+
+def dmuxTree(builder, x: str, sel: list) -> list:
+    """
+    selが上位ビットから順に出力を半分ずつに分ける
+    """
+    outs = [x]
+    for s in reversed(sel):
+        # 下の桁を付け足すので, 出力の番号はselの値の順になる
+        outs = [g for o in outs for g in (builder.gate('andn', o, s), builder.gate('and', o, s))]
+    return outs
+
+
+def orTree(builder, ins: list) -> str:
+    while len(ins) > 1:
+        ins = [builder.gate('or', ins[i], ins[i + 1]) if i + 1 < len(ins) else ins[i]
+               for i in range(0, len(ins), 2)]
+    return ins[0]
+
+
+def bitwise(op: str):
+    def expand(builder, ins: dict) -> dict:
+        return {'out': [builder.gate(op, x, y) for x, y in zip(ins['a'], ins['b'])]}
+    return expand
+
+
+def expandNot(builder, ins: dict) -> dict:
+    return {'out': [builder.gate('not', x) for x in ins['in']]}
+
+
+def expandMux(builder, ins: dict) -> dict:
+    return {'out': mux(builder, ins['a'], ins['b'], ins['sel'][0])}
+
+
+def muxWay(names: str):
+    def expand(builder, ins: dict) -> dict:
+        return {'out': muxTree(builder, [ins[n] for n in names], ins['sel'])}
+    return expand
+
+
+def dmuxWay(names: str):
+    def expand(builder, ins: dict) -> dict:
+        outs = dmuxTree(builder, ins['in'][0], ins['sel'])
+        return {n: [o] for n, o in zip(names, outs)}
+    return expand
+
+
+def expandOr8Way(builder, ins: dict) -> dict:
+    return {'out': [orTree(builder, ins['in'])]}
+
+
+def expandHalfAdder(builder, ins: dict) -> dict:
+    s, carry = fullAdder(builder, ins['a'][0], ins['b'][0], builder.FALSE)
+    return {'sum': [s], 'carry': [carry]}
+
+
+def expandFullAdder(builder, ins: dict) -> dict:
+    s, carry = fullAdder(builder, ins['a'][0], ins['b'][0], ins['c'][0])
+    return {'sum': [s], 'carry': [carry]}
+
+
+def expandAdd16(builder, ins: dict) -> dict:
+    return {'out': add(builder, ins['a'], ins['b'], builder.FALSE)}
+
+
+def expandInc16(builder, ins: dict) -> dict:
+    return {'out': increment(builder, ins['in'])}
+
+
+def expandALU(builder, ins: dict) -> dict:
+    x = [builder.gate('xor', builder.gate('andn', b, ins['zx'][0]), ins['nx'][0]) for b in ins['x']]
+    y = [builder.gate('xor', builder.gate('andn', b, ins['zy'][0]), ins['ny'][0]) for b in ins['y']]
+    f = ins['f'][0]
+    total = add(builder, x, y, builder.FALSE)
+    out = [builder.gate('xor', builder.gate('mux', builder.gate('and', a, b), s, f), ins['no'][0])
+           for a, b, s in zip(x, y, total)]
+    return {'out': out, 'zr': [builder.gate('not', orTree(builder, out))], 'ng': [out[15]]}
+
+
+def expandDFF(builder, ins: dict) -> dict:
+    return {'out': builder.memory(1, [], ins['in'], builder.TRUE)}
+
+
+def expandRegister(builder, ins: dict) -> dict:
+    return {'out': builder.memory(1, [], ins['in'], ins['load'][0])}
+
+
+def expandRAM(builder, ins: dict) -> dict:
+    address = ins['address']
+    return {'out': builder.memory(1 << len(address), address, ins['in'], ins['load'][0])}
+
+
+def expandPC(builder, ins: dict) -> dict:
+    # 出力を先に作り, 次の値の計算につなぐ
+    out = [builder.net() for _ in ins['in']]
+    nxt = mux(builder, out, increment(builder, out), ins['inc'][0])
+    nxt = mux(builder, nxt, ins['in'], ins['load'][0])
+    nxt = [builder.gate('andn', b, ins['reset'][0]) for b in nxt]
+    for target, source in zip(out, builder.memory(1, [], nxt, builder.TRUE)):
+        builder.copy(target, source)
+    return {'out': out}
+
+
+def expandROM32K(builder, ins: dict) -> dict:
+    # 内容は.tstの "ROM32K load Prog.hack" で書き込む
+    return {'out': builder.memory(1 << len(ins['address']), ins['address'],
+                                  [builder.FALSE] * 16, builder.FALSE)}
+
+
+def expandKeyboard(builder, ins: dict) -> dict:
+    # 押しているキーは.tstの実行側が書き込む (押していなければ0)
+    return {'out': builder.memory(1, [], [builder.FALSE] * 16, builder.FALSE)}
+
+
+EXPANDERS = {
+    'Nand':      bitwise('nand'),
+    'And':       bitwise('and'),
+    'And16':     bitwise('and'),
+    'Or':        bitwise('or'),
+    'Or16':      bitwise('or'),
+    'Xor':       bitwise('xor'),
+    'Not':       expandNot,
+    'Not16':     expandNot,
+    'Mux':       expandMux,
+    'Mux16':     expandMux,
+    'Mux4Way16': muxWay('abcd'),
+    'Mux8Way16': muxWay('abcdefgh'),
+    'DMux':      dmuxWay('ab'),
+    'DMux4Way':  dmuxWay('abcd'),
+    'DMux8Way':  dmuxWay('abcdefgh'),
+    'Or8Way':    expandOr8Way,
+    'HalfAdder': expandHalfAdder,
+    'FullAdder': expandFullAdder,
+    'Add16':     expandAdd16,
+    'Inc16':     expandInc16,
+    'ALU':       expandALU,
+    'DFF':       expandDFF,
+    'Bit':       expandRegister,
+    'Register':  expandRegister,
+    'ARegister': expandRegister,
+    'DRegister': expandRegister,
+    'PC':        expandPC,
+    'RAM8':      expandRAM,
+    'RAM64':     expandRAM,
+    'RAM512':    expandRAM,
+    'RAM4K':     expandRAM,
+    'RAM16K':    expandRAM,
+    'Screen':    expandRAM,
+    'ROM32K':    expandROM32K,
+    'Keyboard':  expandKeyboard,
+}
+
+
+def builtinFile(name: str) -> str:
+    """
+    組み込みチップのピンを宣言した.hdlのパス. 展開できないチップならNone
+    """
+    if name not in EXPANDERS:
+        return None
+    return os.path.join(BUILTIN_DIR, name + '.hdl')
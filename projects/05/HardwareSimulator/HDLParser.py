@@ -0,0 +1,199 @@
+import os
+import re
+
+TOKEN_REGREP = re.compile(r"//[^\n]*|/\*.*?\*/|(\.\.|[{}()\[\],;=:])|(\w+)|(\S)", re.S)
+
+
+class Connection():
+    """
+    部品のピン (の一部) と配線 (の一部) の接続: pin[pin_lo..pin_hi]=wire[wire_lo..wire_hi]
+    範囲がない場合はloとhiがNone
+    """
+
+    def __init__(self, pin: str, pin_lo: int, pin_hi: int, wire: str, wire_lo: int, wire_hi: int):
+        self.pin = pin
+        self.pin_lo = pin_lo
+        self.pin_hi = pin_hi
+        self.wire = wire
+        self.wire_lo = wire_lo
+        self.wire_hi = wire_hi
+
+
+class Part():
+    def __init__(self, chip: str, connections: list, line: int):
+        self.chip = chip
+        self.connections = connections
+        self.line = line
+
+
+class ChipDef():
+    """
+    .hdlファイル1つ分のチップの定義
+    inputs, outputsは (ピン名, 幅) のリスト. builtinはBUILTINのチップ名 (なければNone)
+    """
+
+    def __init__(self, name: str, filename: str = None):
+        self.name = name
+        self.filename = filename
+        self.inputs = []
+        self.outputs = []
+        self.parts = []
+        self.builtin = None
+        self.clocked = []
+
+    def pinWidths(self) -> dict:
+        return dict(self.inputs + self.outputs)
+
+
+class HDLParser():
+    """
+    .hdlを読み, ChipDefを作る
+    """
+
+    def __init__(self, text: str, filename: str = None):
+        self.text = text
+        self.filename = filename
+        self.tokens = [(m.group(m.lastindex), m.start()) for m in TOKEN_REGREP.finditer(text)
+                       if m.lastindex is not None]
+        self.pos = 0
+
+    def error(self, expected: str):
+        if self.pos < len(self.tokens):
+            token, offset = self.tokens[self.pos]
+        else:
+            token, offset = 'end of file', len(self.text)
+        raise Exception("Error: expected {} but got {!r} ({}: line {})".format(
+            expected, token, self.filename, self.line(offset)))
+
+    def line(self, offset: int) -> int:
+        return self.text.count('\n', 0, offset) + 1
+
+    def peek(self) -> str:
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def take(self) -> str:
+        token = self.peek()
+        if token is None:
+            self.error('token')
+        self.pos += 1
+        return token
+
+    def expect(self, value: str) -> str:
+        if self.peek() != value:
+            self.error(repr(value))
+        return self.take()
+
+    def expectName(self) -> str:
+        token = self.peek()
+        if token is None or not (token[0].isalpha() or token[0] == '_'):
+            self.error('name')
+        return self.take()
+
+    def expectNumber(self) -> int:
+        token = self.peek()
+        if token is None or not token.isdigit():
+            self.error('number')
+        return int(self.take())
+
+    def parse(self) -> ChipDef:
+        """
+        'CHIP' name '{' ('IN' pins ';')? ('OUT' pins ';')?
+        ('PARTS' ':' part* | 'BUILTIN' name ';' ('CLOCKED' names ';')?) '}'
+        """
+        self.expect('CHIP')
+        chip = ChipDef(self.expectName(), self.filename)
+        self.expect('{')
+        if self.peek() == 'IN':
+            self.take()
+            chip.inputs = self.parsePins()
+        if self.peek() == 'OUT':
+            self.take()
+            chip.outputs = self.parsePins()
+        if self.peek() == 'BUILTIN':
+            self.take()
+            chip.builtin = self.expectName()
+            self.expect(';')
+            if self.peek() == 'CLOCKED':
+                self.take()
+                chip.clocked.append(self.expectName())
+                while self.peek() == ',':
+                    self.take()
+                    chip.clocked.append(self.expectName())
+                self.expect(';')
+        else:
+            self.expect('PARTS')
+            self.expect(':')
+            while self.peek() != '}':
+                chip.parts.append(self.parsePart())
+        self.expect('}')
+        return chip
+
+    def parsePins(self) -> list:
+        pins = [self.parsePin()]
+        while self.peek() == ',':
+            self.take()
+            pins.append(self.parsePin())
+        self.expect(';')
+        return pins
+
+    def parsePin(self) -> tuple:
+        name = self.expectName()
+        width = 1
+        if self.peek() == '[':
+            self.take()
+            width = self.expectNumber()
+            self.expect(']')
+        return name, width
+
+    def parsePart(self) -> Part:
+        """
+        chip '(' connection (',' connection)* ')' ';'
+        """
+        line = self.line(self.tokens[self.pos][1])
+        chip = self.expectName()
+        self.expect('(')
+        connections = [self.parseConnection()]
+        while self.peek() == ',':
+            self.take()
+            connections.append(self.parseConnection())
+        self.expect(')')
+        self.expect(';')
+        return Part(chip, connections, line)
+
+    def parseConnection(self) -> Connection:
+        pin, pin_lo, pin_hi = self.parseSubBus()
+        self.expect('=')
+        wire, wire_lo, wire_hi = self.parseSubBus()
+        return Connection(pin, pin_lo, pin_hi, wire, wire_lo, wire_hi)
+
+    def parseSubBus(self) -> tuple:
+        """
+        name ('[' n ('..' m)? ']')?
+        """
+        name = self.expectName()
+        if self.peek() != '[':
+            return name, None, None
+        self.take()
+        lo = hi = self.expectNumber()
+        if self.peek() == '..':
+            self.take()
+            hi = self.expectNumber()
+        self.expect(']')
+        return name, lo, hi
+
+
+# (絶対パス, mtime, サイズ) -> ChipDef. 同じプロセスで実行する.tstの間で部品の.hdlを共有する
+PARSED_FILES = {}
+
+
+def parseFile(filename: str) -> ChipDef:
+    """
+    .hdlを読んでChipDefを返す. ChipDefは変更しないので, 内容が変わっていなければ前の結果を返す
+    """
+    st = os.stat(filename)
+    key = (os.path.abspath(filename), st.st_mtime_ns, st.st_size)
+    if key not in PARSED_FILES:
+        # tools/builtInChipsのコメントにはcp1252の文字があるので, Java版と同じくバイトのまま読む
+        with open(filename, "r", encoding='latin-1') as f:
+            PARSED_FILES[key] = HDLParser(f.read(), filename).parse()
+    return PARSED_FILES[key]
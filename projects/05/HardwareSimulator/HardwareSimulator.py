@@ -0,0 +1,270 @@
+import Netlist
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import glob
+import os
+import re
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'CPUEmulator'))
+import TestScript  # noqa: E402
+
+LOAD_HDL_REGREP = re.compile(r"^\s*load\s+([^\s,;]+\.hdl)", re.M)
+# 組み込みチップの記憶素子: ARegister[], RAM16K[0] など
+STATE_REGREP = re.compile(r"^(\w+)\[(\d*)\]$")
+# 1つのwhileを回す上限. 条件が変わらないスクリプトで止まらないように
+MAX_WHILE = 10000
+
+
+def readScript(filename: str) -> str:
+    # Java版と同じく, .tstはバイトのまま読む
+    with open(filename, "r", encoding='latin-1') as f:
+        return f.read()
+
+
+class HDLTestScript(TestScript.TestScript):
+    """
+    ハードウェアシミュレータ用の.tstスクリプトをNetlist上で実行する
+    対応コマンド: load, output-file, compare-to, output-list, set, eval,
+                  tick, tock, ticktock, output, echo, clear-echo, repeat, while,
+                  ROM32K load
+    記憶素子のないチップでは, evalで入力を記録するだけにして, 記録した行を
+    出力やwhileの条件で値が必要になったときにまとめて評価する (batch=Falseならevalごとに評価する)
+    keysはこのスクリプトだけで使うキー. キー入力を待つwhile (Memory.tstなど) に入るたびに
+    1つずつKeyboardに設定する
+    """
+
+    def __init__(self, filename: str, batch: bool = True, keys: list = ()):
+        self.filename = filename
+        self.dirname = os.path.dirname(os.path.abspath(filename))
+        self.commands = self.parse(self.tokenize(readScript(filename)))
+        self.batch = batch
+        self.keys = list(keys)
+        self.netlist = None
+        self.values = {}     # ピン -> 値 (入力はset, 出力は最後の評価の結果)
+        self.time = 0
+        self.half = False    # tickの後, tockの前
+        self.writes = []
+        self.rows = []       # 記録したevalの入力
+        self.pending = []    # まだ書いていないoutput: (ピンの値, 評価する行)
+        self.output_file = None
+        self.output_list = []
+        self.outputs = []
+        self.compare_lines = None
+
+    def run(self):
+        try:
+            self.execute(self.commands)
+            self.flush()
+        finally:
+            if self.output_file is not None:
+                with open(self.output_file, "w") as f:
+                    f.write(''.join(l + '\n' for l in self.outputs))
+
+    def execute(self, commands: list):
+        for command in commands:
+            if command[0] == 'repeat':
+                _, count, body = command
+                if count < 0:
+                    raise Exception("Unsupported: repeat without count")
+                for _ in range(count):
+                    self.execute(body)
+            elif command[0] == 'while':
+                _, condition, body = command
+                count = 0
+                self.flush()
+                while self.condition(condition):
+                    if count == 0 and self.keys:
+                        self.pressKey(self.keys.pop(0))
+                    elif count >= MAX_WHILE:
+                        raise Exception("Error: while loop did not finish: {}".format(
+                            ' '.join(condition)))
+                    self.execute(body)
+                    self.flush()
+                    count += 1
+            else:
+                self.executeCommand(command)
+
+    def executeCommand(self, words: list):
+        name, args = words[0], words[1:]
+        if name == 'load':
+            self.flush()
+            self.netlist = Netlist.Netlist(os.path.join(self.dirname, args[0]))
+            self.batch = self.batch and not self.netlist.sequential
+            self.values = {pin: 0 for pin, _ in self.netlist.inputs + self.netlist.outputs}
+        elif name == 'output-list':
+            self.flush()
+            super().executeCommand(words)
+        elif name == 'ROM32K' and args[:1] == ['load']:
+            self.loadROM(os.path.join(self.dirname, args[1]))
+        elif name == 'eval':
+            inputs = self.inputValues()
+            if self.batch:
+                self.rows.append(inputs)
+            else:
+                self.values.update(self.netlist.evaluate(inputs))
+        elif name == 'tick':
+            outputs, self.writes = self.netlist.latch(self.inputValues())
+            self.values.update(outputs)
+            self.half = True
+        elif name == 'tock':
+            self.netlist.commit(self.writes)
+            self.writes = []
+            self.values.update(self.netlist.evaluate(self.inputValues()))
+            self.time += 1
+            self.half = False
+        elif name == 'ticktock':
+            self.executeCommand(['tick'])
+            self.executeCommand(['tock'])
+        elif name == 'output':
+            if self.batch:
+                self.pending.append((dict(self.values), len(self.rows) - 1))
+            else:
+                self.writeRow()
+        else:
+            super().executeCommand(words)
+
+    def flush(self):
+        """
+        記録した行をまとめて評価し, 保留していたoutputを書く
+        最後の行の出力は, 以降のコマンドから見えるように現在の値にも反映する
+        """
+        if not self.rows and not self.pending:
+            return
+        results = self.netlist.evaluateRows(self.rows)
+        current = self.values
+        for values, row in self.pending:
+            self.values = values
+            if row >= 0:
+                self.values.update(results[row])
+            self.writeRow()
+        self.values = current
+        if results:
+            self.values.update(results[-1])
+        self.rows = []
+        self.pending = []
+
+    def writeRow(self):
+        self.writeOutput('|' + ''.join(self.formatValue(*o) for o in self.output_list))
+
+    def pressKey(self, key: int):
+        if 'Keyboard' not in self.netlist.stores:
+            raise Exception("Error: --keys given but the chip has no Keyboard: {}".format(
+                self.filename))
+        self.netlist.setWord('Keyboard', 0, key)
+
+    def loadROM(self, path: str):
+        """
+        .hackの命令をROM32Kの先頭から書き込む
+        """
+        with open(path, "r") as f:
+            words = [int(line.strip(), 2) for line in f if line.strip()]
+        for address, word in enumerate(words):
+            self.netlist.setWord('ROM32K', address, word)
+
+    def inputValues(self) -> dict:
+        return {pin: self.values[pin] for pin, _ in self.netlist.inputs}
+
+    def set(self, variable: str, value: int):
+        m = STATE_REGREP.match(variable)
+        if m is not None:
+            self.netlist.setWord(m.group(1), int(m.group(2) or 0), value & 0xffff)
+            return
+        widths = dict(self.netlist.inputs)
+        if variable not in widths:
+            raise Exception("Unsupported variable: {}".format(variable))
+        self.values[variable] = value & ((1 << widths[variable]) - 1)
+
+    def get(self, variable: str):
+        if variable == 'time':
+            return "{}{}".format(self.time, '+' if self.half else '')
+        m = STATE_REGREP.match(variable)
+        if m is not None:
+            return self.netlist.word(m.group(1), int(m.group(2) or 0), self.writes)
+        if variable not in self.values:
+            raise Exception("Unsupported variable: {}".format(variable))
+        return self.values[variable]
+
+    def formatValue(self, variable: str, fmt: str, pad_left: int, length: int, pad_right: int) -> str:
+        if fmt != 'S':
+            return super().formatValue(variable, fmt, pad_left, length, pad_right)
+        text = str(self.get(variable))
+        return ' ' * pad_left + text.ljust(length) + ' ' * pad_right + '|'
+
+
+def runTest(filename: str, batch: bool = True, keys: dict = None) -> tuple:
+    """
+    1つの.tstを実行し (ファイル名, 結果, メッセージ) を返す
+    keysは.tstのファイル名 (Memory.tstなど) -> そのスクリプトで押すキーのリスト
+    """
+    try:
+        script_keys = (keys or {}).get(os.path.basename(filename), ())
+        HDLTestScript(filename, batch, script_keys).run()
+        return filename, 'passed', ''
+    except TestScript.ComparisonFailure as e:
+        return filename, 'failed', str(e)
+    except Exception as e:
+        return filename, 'error', "{}: {}".format(type(e).__name__, e)
+
+
+def findTests(paths: list) -> list:
+    """
+    パスから.hdlを読み込む.tstを集める
+    """
+    tests = []
+    for path in paths:
+        if os.path.isdir(path):
+            for f in sorted(glob.glob(os.path.join(path, '**', '*.tst'), recursive=True)):
+                if LOAD_HDL_REGREP.search(readScript(f)):
+                    tests.append(f)
+        else:
+            tests.append(path)
+    return tests
+
+
+def runTests(tests: list, workers: int = 1, batch: bool = True, keys: dict = None) -> list:
+    if workers <= 1:
+        return [runTest(t, batch, keys) for t in tests]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(runTest, tests, [batch] * len(tests), [keys] * len(tests)))
+
+
+def keyCode(key: str) -> int:
+    """
+    1文字ならその文字コード, それ以外は数値 (Hackのキーコード)
+    """
+    return ord(key) if len(key) == 1 else int(key)
+
+
+def parseKeys(specs: list) -> dict:
+    """
+    "Memory.tst=K,Y" のリストを .tstのファイル名 -> キーコードのリスト にする
+    """
+    keys = {}
+    for spec in specs:
+        script, sep, codes = spec.partition('=')
+        if not sep or not script or not codes:
+            raise Exception("Error: --keys should be SCRIPT=KEY,KEY,...: {}".format(spec))
+        keys[script] = [keyCode(k) for k in codes.split(',')]
+    return keys
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(
+        description='Run hardware simulator test scripts (.tst) on compiled netlists.')
+    arg_parser.add_argument('paths', type=str, nargs='+', help='tst file or directory')
+    arg_parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(),
+                            help='number of worker processes')
+    arg_parser.add_argument('--no-batch', action='store_true',
+                            help='evaluate each eval separately instead of all rows at once')
+    arg_parser.add_argument('--keys', type=str, action='append', default=[],
+                            help='SCRIPT=KEY,KEY,...: keys (characters or codes) that SCRIPT '
+                                 '(e.g. Memory.tst) holds down, one for each while loop it enters')
+    args = arg_parser.parse_args()
+
+    results = runTests(findTests(args.paths), args.workers, not args.no_batch,
+                       parseKeys(args.keys))
+    for filename, status, message in results:
+        print("{:<7} {} {}".format(status, filename, message))
+    if any(status != 'passed' for _, status, _ in results):
+        sys.exit(1)
@@ -0,0 +1,535 @@
+import BuiltinChips
+import HDLParser
+import os
+
+FALSE = '0'
+TRUE = 'M'
+
+# ゲートの種類 -> 式. 各配線の値はテストの行ごとに1ビットを並べた整数で, Mは全ての行が1のマスク
+# 記憶素子を含むチップは1行ずつ評価するので, M = 1
+GATE_EXPRS = {
+    'not':  "{0} ^ M",
+    'and':  "{0} & {1}",
+    'or':   "{0} | {1}",
+    'xor':  "{0} ^ {1}",
+    'nand': "({0} & {1}) ^ M",
+    'andn': "{0} & ({1} ^ M)",
+    'mux':  "{0} ^ (({0} ^ {1}) & {2})",
+}
+COMMUTATIVE = frozenset(['and', 'or', 'xor', 'nand'])
+
+
+class Memory():
+    """
+    クロックで書き込む記憶素子 (DFF, Register, RAM, ROM32K, Keyboard)
+    addressが空なら1語のレジスタで, 出力はaddressの語 (addressだけが組み合わせ回路の入力)
+    chipは展開した組み込みチップの名前 (.tstのARegister[], RAM16K[0]などで参照する)
+    """
+
+    def __init__(self, words: int, address: list, data: list, load: str, out: list):
+        self.words = words
+        self.address = address
+        self.data = data
+        self.load = load
+        self.out = out
+        self.chip = None
+
+
+class Builder():
+    """
+    チップの階層を展開しながら, 1ビットのゲートと記憶素子を集める
+    配線の名前はn1, n2, ...で, 定数はFALSE, TRUE
+    """
+    FALSE = FALSE
+    TRUE = TRUE
+
+    def __init__(self):
+        self.count = 0
+        self.gates = []      # (出力, 種類, 入力のタプル)
+        self.copies = {}     # 配線 -> 同じ値を持つ配線
+        self.memories = []
+
+    def net(self) -> str:
+        self.count += 1
+        return "n{}".format(self.count)
+
+    def gate(self, op: str, *inputs) -> str:
+        out = self.net()
+        self.gates.append((out, op, inputs))
+        return out
+
+    def copy(self, target: str, source: str):
+        if target in self.copies:
+            raise Exception("Error: wire has multiple drivers")
+        self.copies[target] = source
+
+    def memory(self, words: int, address: list, data: list, load: str) -> list:
+        out = [self.net() for _ in data]
+        self.memories.append(Memory(words, address, data, load, out))
+        return out
+
+
+class Loader():
+    """
+    部品の.hdlはトップのチップと同じディレクトリから探し, なければ組み込みチップを使う
+    (Java版のHardwareSimulatorと同じ)
+    """
+
+    def __init__(self, search_dir: str):
+        self.search_dir = search_dir
+        self.defs = {}
+
+    def chipDef(self, name: str) -> HDLParser.ChipDef:
+        if name not in self.defs:
+            path = os.path.join(self.search_dir, name + '.hdl')
+            if not os.path.isfile(path):
+                path = BuiltinChips.builtinFile(name)
+                if path is None:
+                    raise Exception("Error: chip not found: {}".format(name))
+            self.defs[name] = HDLParser.parseFile(path)
+        return self.defs[name]
+
+    def instantiate(self, builder: Builder, chip: HDLParser.ChipDef, ins: dict) -> dict:
+        """
+        入力ピン -> 配線のリスト (下位ビットから) を受け取り, 出力ピン -> 配線のリストを返す
+        """
+        if chip.builtin is not None:
+            if chip.name not in BuiltinChips.EXPANDERS:
+                raise Exception("Error: unsupported builtin chip: {}".format(chip.name))
+            count = len(builder.memories)
+            outs = BuiltinChips.EXPANDERS[chip.name](builder, ins)
+            for m in builder.memories[count:]:
+                m.chip = chip.name
+            return outs
+
+        env = dict(ins)
+        for name, width in chip.outputs:
+            env[name] = [builder.net() for _ in range(width)]
+        # 内部の配線の幅は, 接続する部品の出力ピンの幅で決まる
+        for part in chip.parts:
+            part_outputs = dict(self.chipDef(part.chip).outputs)
+            for c in part.connections:
+                if c.pin in part_outputs and c.wire not in env:
+                    if c.wire_lo is not None:
+                        self.error(chip, part, "sub bus of internal pin: {}".format(c.wire))
+                    lo, hi = self.pinRange(chip, part, c, part_outputs[c.pin])
+                    env[c.wire] = [builder.net() for _ in range(hi - lo + 1)]
+
+        for part in chip.parts:
+            part_def = self.chipDef(part.chip)
+            widths = part_def.pinWidths()
+            part_ins = {name: [FALSE] * width for name, width in part_def.inputs}
+            targets = []
+            for c in part.connections:
+                if c.pin not in widths:
+                    self.error(chip, part, "unknown pin: {}".format(c.pin))
+                lo, hi = self.pinRange(chip, part, c, widths[c.pin])
+                if c.pin in part_ins:
+                    part_ins[c.pin][lo:hi + 1] = self.source(chip, part, env, c, hi - lo + 1)
+                else:
+                    targets.append((c, lo, hi))
+            outs = self.instantiate(builder, part_def, part_ins)
+            for c, lo, hi in targets:
+                if c.wire in ins or c.wire in ['true', 'false']:
+                    self.error(chip, part, "cannot drive: {}".format(c.wire))
+                bits = self.wireBits(chip, part, env, c)
+                if len(bits) != hi - lo + 1:
+                    self.error(chip, part, "width mismatch: {}".format(c.wire))
+                for target, source in zip(bits, outs[c.pin][lo:hi + 1]):
+                    builder.copy(target, source)
+        return {name: env[name] for name, _ in chip.outputs}
+
+    def source(self, chip, part, env: dict, c: HDLParser.Connection, width: int) -> list:
+        if c.wire == 'true':
+            return [TRUE] * width
+        elif c.wire == 'false':
+            return [FALSE] * width
+        bits = self.wireBits(chip, part, env, c)
+        if len(bits) != width:
+            self.error(chip, part, "width mismatch: {}".format(c.wire))
+        return bits
+
+    def wireBits(self, chip, part, env: dict, c: HDLParser.Connection) -> list:
+        if c.wire not in env:
+            self.error(chip, part, "undefined wire: {}".format(c.wire))
+        bits = env[c.wire]
+        if c.wire_lo is None:
+            return bits
+        if not 0 <= c.wire_lo <= c.wire_hi < len(bits):
+            self.error(chip, part, "bad sub bus: {}".format(c.wire))
+        return bits[c.wire_lo:c.wire_hi + 1]
+
+    def pinRange(self, chip, part, c: HDLParser.Connection, width: int) -> tuple:
+        if c.pin_lo is None:
+            return 0, width - 1
+        if not 0 <= c.pin_lo <= c.pin_hi < width:
+            self.error(chip, part, "bad sub bus: {}".format(c.pin))
+        return c.pin_lo, c.pin_hi
+
+    @staticmethod
+    def error(chip, part, message: str):
+        raise Exception("Error: {} ({}: line {})".format(message, chip.filename, part.line))
+
+
+def fold(op: str, ins: tuple):
+    """
+    定数や同じ入力のゲートを簡単にする. 配線名か (種類, 入力) を返す
+    """
+    if op == 'not':
+        a, = ins
+        if a in (FALSE, TRUE):
+            return TRUE if a == FALSE else FALSE
+        return op, ins
+    if op == 'mux':
+        a, b, s = ins
+        if s == FALSE or a == b:
+            return a
+        if s == TRUE:
+            return b
+        if a == FALSE:
+            return fold('and', (b, s))
+        if b == FALSE:
+            return fold('andn', (a, s))
+        if b == TRUE:
+            return fold('or', (a, s))
+        return op, ins
+    a, b = ins
+    if op == 'and':
+        if FALSE in ins:
+            return FALSE
+        if a == TRUE or a == b:
+            return b
+        if b == TRUE:
+            return a
+    elif op == 'or':
+        if TRUE in ins:
+            return TRUE
+        if a == FALSE or a == b:
+            return b
+        if b == FALSE:
+            return a
+    elif op == 'xor':
+        if a == b:
+            return FALSE
+        if a == FALSE:
+            return b
+        if b == FALSE:
+            return a
+        if a == TRUE:
+            return fold('not', (b,))
+        if b == TRUE:
+            return fold('not', (a,))
+    elif op == 'nand':
+        if FALSE in ins:
+            return TRUE
+        if a == TRUE or a == b:
+            return fold('not', (b,))
+        if b == TRUE:
+            return fold('not', (a,))
+    elif op == 'andn':
+        if a == FALSE or b == TRUE or a == b:
+            return FALSE
+        if b == FALSE:
+            return a
+        if a == TRUE:
+            return fold('not', (b,))
+    if op in COMMUTATIVE and a > b:
+        ins = (b, a)
+    return op, ins
+
+
+def packExpr(bits: list) -> str:
+    """
+    1行の場合に, ビットの配線から語の値を作る式
+    """
+    terms = [b if i == 0 else "{} << {}".format(b, i)
+             for i, b in enumerate(bits) if b != FALSE]
+    return ' | '.join(terms) if terms else '0'
+
+
+class Netlist():
+    """
+    .hdlのチップを1ビットのゲートまで展開し, トポロジカル順に並べた評価関数にコンパイルする
+    組み合わせ回路は各配線の値を行ごとのビットを並べた整数にして, テストの複数の行を一度に評価する
+    記憶素子を含むチップは1行ずつ評価し, latchで書き込みを集めてcommitで反映する
+    記憶素子は出力につながっていなくても残す (.tstから名前で読み書きするため)
+    """
+
+    def __init__(self, filename: str):
+        self.chip = HDLParser.parseFile(filename)
+        self.inputs = self.chip.inputs
+        self.outputs = self.chip.outputs
+        loader = Loader(os.path.dirname(os.path.abspath(filename)))
+        builder = Builder()
+        ins = {name: [builder.net() for _ in range(width)] for name, width in self.inputs}
+        outs = loader.instantiate(builder, self.chip, ins)
+        self.input_bits = [b for name, _ in self.inputs for b in ins[name]]
+        self.compile(builder, outs)
+
+    @property
+    def sequential(self) -> bool:
+        return bool(self.memories)
+
+    def compile(self, builder: Builder, outs: dict):
+        copies = builder.copies
+        driven = set(self.input_bits) | {g[0] for g in builder.gates} | \
+            {b for m in builder.memories for b in m.out}
+        subst = {}   # 配線 -> 置き換える配線 (コピーと簡単にしたゲート)
+
+        def resolve(net: str) -> str:
+            path = []
+            while True:
+                if net in subst:
+                    nxt = subst[net]
+                elif net in copies:
+                    nxt = copies[net]
+                else:
+                    break
+                path.append(net)
+                if len(path) > len(copies) + len(subst):
+                    raise Exception("Error: combinational loop")
+                net = nxt
+            if net not in driven and net not in (FALSE, TRUE):
+                # どこからも駆動されない配線は0
+                net = FALSE
+            for p in path:
+                subst[p] = net
+            return net
+
+        producers = {g[0]: g for g in builder.gates}
+        readers = {b: m for m in builder.memories for b in m.out}
+        roots = [b for name, _ in self.outputs for b in outs[name]]
+        for m in builder.memories:
+            roots += m.out + m.address + m.data + [m.load]
+
+        # 深さ優先でトポロジカル順に並べる (記憶素子の出力はaddressにだけ依存する)
+        order = []
+        state = {}
+        for root in roots:
+            stack = [(resolve(root), False)]
+            while stack:
+                net, done = stack.pop()
+                if done:
+                    state[net] = 2
+                    order.append(net)
+                    continue
+                if net in state:
+                    if state[net] == 1:
+                        raise Exception("Error: combinational loop")
+                    continue
+                if net in producers:
+                    deps = producers[net][2]
+                elif net in readers:
+                    deps = readers[net].address
+                else:
+                    continue
+                state[net] = 1
+                stack.append((net, True))
+                stack += [(resolve(d), False) for d in deps]
+
+        # 定数の伝播と共通部分式の削除
+        body = []
+        seen = {}
+        reads = set()
+        for net in order:
+            if net in readers:
+                m = readers[net]
+                if m not in reads:
+                    reads.add(m)
+                    body.append(('read', m))
+                continue
+            _, op, ins = producers[net]
+            folded = fold(op, tuple(resolve(i) for i in ins))
+            if isinstance(folded, str):
+                subst[net] = resolve(folded)
+            elif folded in seen:
+                subst[net] = seen[folded]
+            else:
+                seen[folded] = net
+                body.append(('gate', net, folded[0], folded[1]))
+
+        # 出力から逆にたどり, 使われないゲートと記憶素子を除く
+        # 使われる記憶素子の入力も使われるので, 増えなくなるまで繰り返す
+        self.output_bits = [[resolve(b) for b in outs[name]] for name, _ in self.outputs]
+        used = {b for bits in self.output_bits for b in bits}
+        used.update(b for m in builder.memories for b in m.out)
+        while True:
+            size = len(used)
+            live = []
+            for item in reversed(body):
+                if item[0] == 'gate':
+                    if item[1] in used:
+                        live.append(item)
+                        used.update(item[3])
+                elif any(b in used for b in item[1].out):
+                    m = item[1]
+                    live.append(item)
+                    used.update(resolve(b) for b in m.address + m.data + [m.load])
+            if len(used) == size:
+                break
+        live.reverse()
+        self.gates = [item for item in live if item[0] == 'gate']
+        self.memories = [item[1] for item in live if item[0] == 'read']
+        self.generate(live, used, resolve)
+
+    def generate(self, live: list, used: set, resolve):
+        """
+        評価関数evaluate(M, 入力ビット..., writes=None)を作る
+        writesにリストを渡すと, 記憶素子への書き込みも集める (latch用)
+        evaluateとlatchで同じ本体を2回コンパイルしないように, 1つの関数にしている
+        1語の記憶素子はregs, それ以外はm0, m1, ...のリストに値を持つ
+        """
+        self.regs = []
+        self.rams = []
+        self.stores = {}  # 組み込みチップの名前 -> (値のリスト, 1語ならその位置)
+        stores = {}
+        for m in self.memories:
+            if m.words == 1:
+                stores[m] = ('regs', len(self.regs))
+                self.stores.setdefault(m.chip, (self.regs, len(self.regs)))
+                self.regs.append(0)
+            else:
+                stores[m] = ("m{}".format(len(self.rams)), None)
+                self.rams.append([0] * m.words)
+                self.stores.setdefault(m.chip, (self.rams[-1], None))
+
+        lines = []
+        for item in live:
+            if item[0] == 'gate':
+                _, net, op, ins = item
+                lines.append("    {} = {}".format(net, GATE_EXPRS[op].format(*ins)))
+                continue
+            m = item[1]
+            store, slot = stores[m]
+            word = "w{}".format(m.out[0])
+            index = slot if slot is not None else packExpr([resolve(b) for b in m.address])
+            lines.append("    {} = {}[{}]".format(word, store, index))
+            for i, b in enumerate(m.out):
+                if b in used:
+                    lines.append("    {} = {} >> {} & 1".format(b, word, i) if i else
+                                 "    {} = {} & 1".format(b, word))
+
+        writes = []
+        for m in self.memories:
+            store, slot = stores[m]
+            load = resolve(m.load)
+            if load == FALSE:
+                continue
+            index = slot if slot is not None else packExpr([resolve(b) for b in m.address])
+            append = "writes.append(({}, {}, {}))".format(
+                store, index, packExpr([resolve(b) for b in m.data]))
+            writes.append("        " + append if load == TRUE else
+                          "        if {}:\n            {}".format(load, append))
+        if writes:
+            lines.append("    if writes is not None:")
+            lines += writes
+
+        outputs = [b for bits in self.output_bits for b in bits]
+        params = ['M'] + self.input_bits + ['writes=None', 'regs=regs'] + \
+            ["m{0}=m{0}".format(i) for i in range(len(self.rams))]
+        result = "({},)".format(', '.join(outputs)) if outputs else "()"
+        source = "def evaluate({}):\n{}\n    return {}\n".format(
+            ', '.join(params), '\n'.join(lines), result)
+        namespace = {'regs': self.regs}
+        namespace.update(("m{}".format(i), ram) for i, ram in enumerate(self.rams))
+        exec(compile(source, "<chip {}>".format(self.chip.name), "exec"), namespace)
+        self.source = source
+        self.evaluateBits = namespace['evaluate']
+
+    def pack(self, values: dict) -> list:
+        """
+        1行の入力ピンの値を入力ビットのリストにする
+        """
+        return [values.get(name, 0) >> i & 1 for name, width in self.inputs for i in range(width)]
+
+    def unpack(self, bits: tuple) -> dict:
+        values = {}
+        pos = 0
+        for name, width in self.outputs:
+            value = 0
+            for i in range(width):
+                value |= bits[pos + i] << i
+            values[name] = value
+            pos += width
+        return values
+
+    def packRows(self, rows: list) -> list:
+        """
+        行ごとの入力ピンの値を, 入力ビットごとに行を並べた整数 (k行目がkビット目) にする
+        値を2進の文字列にして連結し, 1ビットごとのスライスで転置してintで読む
+        """
+        bits = []
+        for name, width in self.inputs:
+            fmt = "0{}b".format(width)
+            # 最後の行から並べると, スライスの先頭が最上位の行になる
+            text = ''.join([format(row.get(name, 0), fmt) for row in reversed(rows)])
+            bits += [int(text[width - 1 - i::width], 2) for i in range(width)]
+        return bits
+
+    def unpackRows(self, bits: tuple, lanes: int) -> list:
+        rows = [{} for _ in range(lanes)]
+        fmt = "0{}b".format(lanes)
+        pos = 0
+        for name, width in self.outputs:
+            # 上位ビットから, 0行目を先頭にした文字列を連結する. k行目の値はk文字目から1行分ずつ
+            text = ''.join([format(b, fmt)[::-1] for b in reversed(bits[pos:pos + width])])
+            pos += width
+            for k, row in enumerate(rows):
+                row[name] = int(text[k::lanes], 2)
+        return rows
+
+    def evaluate(self, values: dict) -> dict:
+        """
+        1行の入力ピンの値から出力ピンの値を計算する
+        """
+        return self.unpack(self.evaluateBits(1, *self.pack(values)))
+
+    def evaluateRows(self, rows: list) -> list:
+        """
+        各行の入力ピンの値 (dict) から出力ピンの値 (dict) を一度に計算する
+        記憶素子を含むチップは1行ずつしか評価できない
+        """
+        if self.sequential:
+            raise Exception("Error: sequential chip evaluates one row at a time")
+        if not rows:
+            return []
+        lanes = len(rows)
+        return self.unpackRows(self.evaluateBits((1 << lanes) - 1, *self.packRows(rows)), lanes)
+
+    def latch(self, values: dict) -> tuple:
+        """
+        クロックの立ち上がり: (出力ピンの値, 記憶素子への書き込みのリスト)
+        """
+        writes = []
+        bits = self.evaluateBits(1, *self.pack(values), writes=writes)
+        return self.unpack(bits), writes
+
+    def word(self, chip: str, index: int, writes: list = ()) -> int:
+        """
+        組み込みチップchipの記憶素子のindex番目の語 (1語のレジスタならindexは無視する)
+        writesはlatchで集めてまだcommitしていない書き込み. Java版と同じく, tickの後は
+        出力より先に内部の値が変わって見える
+        """
+        store, slot = self.store(chip)
+        index = slot if slot is not None else index
+        for target, i, word in reversed(writes):
+            if target is store and i == index:
+                return word
+        return store[index]
+
+    def setWord(self, chip: str, index: int, value: int):
+        store, slot = self.store(chip)
+        store[slot if slot is not None else index] = value
+
+    def store(self, chip: str) -> tuple:
+        if chip not in self.stores:
+            raise Exception("Error: no builtin chip with state: {}".format(chip))
+        return self.stores[chip]
+
+    @staticmethod
+    def commit(writes: list):
+        """
+        クロックの立ち下がり: latchで集めた書き込みを反映する
+        """
+        for store, index, word in writes:
+            store[index] = word
@@ -0,0 +1,107 @@
+import HardwareSimulator
+import Netlist
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+HARDWARE_SIMULATOR_SH = os.path.join(PROJECT_DIR, '..', 'tools', 'HardwareSimulator.sh')
+SUITE = ['01', '02', '03', '05']
+# .tst -> whileが待つキー (05/Memory.tstは 'K', 'Y' を押し続ける)
+KEYS = {'Memory.tst': [ord('K'), ord('Y')]}
+# vectorsで評価する組み合わせ回路
+VECTOR_CHIPS = ['01/Mux8Way16.hdl', '02/Add16.hdl', '02/ALU.hdl']
+
+
+def prepareSuite(tmp: str) -> list:
+    """
+    SUITEのディレクトリをtmpにコピーし (.outがリポジトリに書き込まれないように), .tstのリストを返す
+    """
+    for project in SUITE:
+        shutil.copytree(os.path.join(PROJECT_DIR, project), os.path.join(tmp, project))
+    return HardwareSimulator.findTests([os.path.join(tmp, project) for project in SUITE])
+
+
+def benchSuite(args):
+    """
+    01-03, 05のテストを行ごとの評価と全行の一括評価, 逐次/プロセスプールで実行
+    (javaがあればJava版とも比較)
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        tests = prepareSuite(tmp)
+        for test in tests:
+            # 展開したゲートと記憶素子の数
+            hdl = HardwareSimulator.LOAD_HDL_REGREP.search(
+                HardwareSimulator.readScript(test)).group(1)
+            netlist = Netlist.Netlist(os.path.join(os.path.dirname(test), hdl))
+            print("  {:<28} {:>6} gates {:>6} memories".format(
+                os.path.relpath(test, tmp), len(netlist.gates), len(netlist.memories)))
+
+        results = None
+        for batch in [False, True]:
+            for workers in sorted({1, args.workers}):
+                start = time.perf_counter()
+                results = HardwareSimulator.runTests(tests, workers, batch, KEYS)
+                elapsed = time.perf_counter() - start
+                print("python {:<6} -j{:<3} {:>3} tests {:>10.1f} ms".format(
+                    'batch' if batch else 'row', workers, len(tests), elapsed * 1000))
+        for filename, status, message in results:
+            if status != 'passed':
+                print("  {:<7} {} {}".format(status, os.path.relpath(filename, tmp), message))
+
+        if shutil.which('java') is None:
+            print("java not found: skip HardwareSimulator.sh")
+        else:
+            start = time.perf_counter()
+            for tst in tests:
+                subprocess.run([HARDWARE_SIMULATOR_SH, tst], stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+            elapsed = time.perf_counter() - start
+            print("java {:>18} tests {:>10.1f} ms".format(len(tests), elapsed * 1000))
+        failed = [f for f, status, _ in results if status != 'passed']
+        if failed:
+            sys.exit("{} of {} tests failed".format(len(failed), len(results)))
+
+
+def benchVectors(args):
+    """
+    組み合わせ回路にランダムな入力を与え, 行ごとの評価と全行の一括評価の時間を比較する
+    (ネットリストの構築は含めない)
+    """
+    rand = random.Random(0)
+    for chip in VECTOR_CHIPS:
+        netlist = Netlist.Netlist(os.path.join(PROJECT_DIR, chip))
+        rows = [{name: rand.getrandbits(width) for name, width in netlist.inputs}
+                for _ in range(args.rows)]
+        start = time.perf_counter()
+        expected = [netlist.evaluate(row) for row in rows]
+        row_time = time.perf_counter() - start
+        start = time.perf_counter()
+        results = netlist.evaluateRows(rows)
+        batch_time = time.perf_counter() - start
+        if results != expected:
+            raise Exception("Error: batch evaluation differs: {}".format(chip))
+        print("{:<20} {:>6} gates {:>7} rows  row {:>8.1f} ms  batch {:>8.1f} ms  x{:.1f}".format(
+            chip, len(netlist.gates), len(rows), row_time * 1000, batch_time * 1000,
+            row_time / batch_time))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Hardware simulator benchmarks.')
+    subparsers = arg_parser.add_subparsers(dest='bench', required=True)
+
+    suite = subparsers.add_parser('suite', help=benchSuite.__doc__)
+    suite.add_argument('--workers', type=int, default=os.cpu_count())
+    suite.set_defaults(func=benchSuite)
+
+    vectors = subparsers.add_parser('vectors', help=benchVectors.__doc__)
+    vectors.add_argument('--rows', type=int, default=4096)
+    vectors.set_defaults(func=benchVectors)
+
+    args = arg_parser.parse_args()
+    args.func(args)
@@ -1,76 +1,226 @@
+import AssemblyCache
 import Code
 import Parser
+import SourceMap
 import SymbolTable
+from array import array
+import argparse
 import sys
 import re
 import logging
 
+# 上位/下位8bitの2進文字列
+BIN8 = ["{:08b}".format(i) for i in range(256)]
+
+
 def assemble():
+    arg_parser = argparse.ArgumentParser(
+        description='Assemble asm file to hack file.')
+    arg_parser.add_argument('src_file', type=str, help='asm file')
+    arg_parser.add_argument('--single-pass', action='store_true',
+                            help='resolve labels by backpatching in one path')
+    arg_parser.add_argument('--binary', action='store_true',
+                            help='write packed big-endian words to .bin instead of .hack')
+    arg_parser.add_argument('--trace', action='store_true',
+                            help='log every parsed line and emitted field')
+    arg_parser.add_argument('--cache', type=str, default=None,
+                            help='file caching encoded chunks for incremental re-assembly')
+    arg_parser.add_argument('--source-map', action='store_true',
+                            help='write a .map file linking ROM addresses to asm and vm lines')
+    args = arg_parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.trace else logging.WARNING)
     logging.debug(sys.argv)
-    if (len(sys.argv) != 2) or (not sys.argv[1].endswith(".asm")):
+    if not args.src_file.endswith(".asm"):
         raise Exception("Usage: {} src_file".format(__file__))
-    parser = Parser.Parser(sys.argv[1])
+
+    source_map = SourceMap.SourceMap() if args.source_map else None
+    if args.cache is not None:
+        if source_map is not None:
+            raise Exception("Error: --source-map cannot be used with --cache")
+        cache = AssemblyCache.AssemblyCache(args.cache)
+        words = cache.assemble(args.src_file)
+        cache.save()
+        logging.info("cache: %s hits, %s misses", cache.hits, cache.misses)
+    elif args.single_pass:
+        words = assembleSinglePass(args.src_file, source_map=source_map)
+    else:
+        words = assembleTwoPass(args.src_file, source_map)
+
+    if args.binary:
+        writeBinary(words, re.sub("\.asm$", ".bin", args.src_file))
+    else:
+        writeHack(words, re.sub("\.asm$", ".hack", args.src_file))
+    if source_map is not None:
+        source_map.save(re.sub("\.asm$", ".map", args.src_file))
+
+
+def assembleTwoPass(src_filename: str, source_map: SourceMap.SourceMap = None) -> array:
+    """
+    ソースを2回読んで機械語に変換する
+    (ファイルは1度だけメモリマップし, 同じマップを2回読む)
+    source_mapを渡すと, 2nd Pathでアドレスと.asm/.vmの行の対応を記録する
+    """
+    source = Parser.MappedSource(src_filename)
+    parser = Parser.Parser(source)
     code = Code.Code()
     symbol_table = SymbolTable.SymbolTable()
-    dst_file = open(re.sub("\.asm$", ".hack", sys.argv[1]), "w")
+    words = array('H')
+    trace = logging.getLogger().isEnabledFor(logging.DEBUG)
 
     # 1st Path
     ## L_Symbol
     PC = 0
-    while parser.advance():
-        cmd_type = parser.commandType()
-        if cmd_type is parser.A_COMMAND:
+    for inst in parser:
+        if inst.kind is parser.A_COMMAND:
             PC += 1
-        elif cmd_type is parser.L_COMMAND:
-            symbol = parser.symbol()
+        elif inst.kind is parser.L_COMMAND:
+            symbol = inst.symbol
             if not symbol_table.contains(symbol):
                 symbol_table.addEntry(symbol, PC)
             else:
                 raise Exception("Error: Dual Definition of l_symbol: {}".format(symbol))
-        elif cmd_type is parser.C_COMMAND:
+        elif inst.kind is parser.C_COMMAND:
             PC += 1
         else:
             raise Exception("Error")
 
-    parser = Parser.Parser(sys.argv[1])
+    parser = Parser.Parser(source, comments=source_map is not None)
     # 2nd Path
-    while parser.advance():
-        cmd_type = parser.commandType()
-        logging.debug("cmd_type: {}".format(cmd_type))
-        if cmd_type is parser.A_COMMAND:
-            symbol = parser.symbol()
-            try:
-                const_num = int(symbol)
-                ostr = "{:016b}\n".format(const_num)
-                logging.debug("output: {}".format(ostr))
-                dst_file.write(ostr)
-            except ValueError:
-                if symbol_table.contains(symbol):
-                    address = symbol_table.getAddress(symbol)
-                    ostr = "{:016b}\n".format(address)
-                    dst_file.write(ostr)
-                else:
-                    # new local varialble
-                    address = symbol_table.addLocalVar(symbol)
-                    ostr = "{:016b}\n".format(address)
-                    dst_file.write(ostr)
-        elif cmd_type is parser.L_COMMAND:
+    for inst in parser:
+        if trace:
+            logging.debug("cmd_type: %s", inst.kind)
+        if source_map is not None:
+            recordSource(source_map, parser, inst, len(words))
+        if inst.kind is parser.A_COMMAND:
+            symbol = inst.symbol
+            if inst.value is not None:
+                words.append(inst.value)
+            elif symbol_table.contains(symbol):
+                words.append(symbol_table.getAddress(symbol))
+            else:
+                # new local varialble
+                words.append(symbol_table.addLocalVar(symbol))
+        elif inst.kind is parser.L_COMMAND:
             pass
-        elif cmd_type is parser.C_COMMAND:
-            dest = parser.dest()
-            comp = parser.comp()
-            jump = parser.jump()
-            logging.debug("dest: {}, comp: {}, jump: {}".format(dest, comp, jump))
-            ostr = "111{comp}{dest}{jump}\n".format( \
-                comp=code.comp(comp), dest=code.dest(dest), jump=code.jump(jump))
-            logging.debug("output: {}".format(ostr))
-            dst_file.write(ostr)
+        elif inst.kind is parser.C_COMMAND:
+            if trace:
+                logging.debug("dest: %s, comp: %s, jump: %s", inst.dest, inst.comp, inst.jump)
+            words.append(code.cInstruction(inst.dest, inst.comp, inst.jump))
+        else:
+            raise Exception("Error")
+
+    source.close()
+    return words
+
+
+def assembleSinglePass(src_filename,
+                       symbol_table: SymbolTable.SymbolTable = None,
+                       source_map: SourceMap.SourceMap = None) -> array:
+    """
+    ソースを1回だけ読んで機械語に変換する
+    未定義のシンボルはfixupリストに記録し, ラベル定義時にバッファを書き換える
+    最後まで定義されなかったシンボルは変数として初出順にアドレスを割り当てる
+    symbol_tableを渡すと, 解決したラベルと変数がそこに登録される
+    source_mapを渡すと, アドレスと.asm/.vmの行の対応を記録する
+    src_filenameには行のイテラブルも渡せる
+    """
+    parser = Parser.Parser(src_filename, comments=source_map is not None)
+    code = Code.Code()
+    if symbol_table is None:
+        symbol_table = SymbolTable.SymbolTable()
+    words = array('H')
+    fixups = {}  # symbol -> 書き換え待ちの命令位置のリスト
+    trace = logging.getLogger().isEnabledFor(logging.DEBUG)
+
+    for inst in parser:
+        if trace:
+            logging.debug("instruction: %s", inst)
+        if source_map is not None:
+            recordSource(source_map, parser, inst, len(words))
+        if inst.kind is parser.A_COMMAND:
+            if inst.value is not None:
+                words.append(inst.value)
+            elif symbol_table.contains(inst.symbol):
+                words.append(symbol_table.getAddress(inst.symbol))
+            else:
+                fixups.setdefault(inst.symbol, []).append(len(words))
+                words.append(0)
+        elif inst.kind is parser.L_COMMAND:
+            symbol = inst.symbol
+            if symbol_table.contains(symbol):
+                raise Exception("Error: Dual Definition of l_symbol: {}".format(symbol))
+            symbol_table.addEntry(symbol, len(words))
+            for pc in fixups.pop(symbol, []):
+                words[pc] = len(words)
+        elif inst.kind is parser.C_COMMAND:
+            words.append(code.cInstruction(inst.dest, inst.comp, inst.jump))
         else:
             raise Exception("Error")
-    
-    dst_file.close()
+
+    # 残ったシンボルは変数
+    for symbol, pcs in fixups.items():
+        address = symbol_table.addLocalVar(symbol)
+        for pc in pcs:
+            words[pc] = address
+
+    return words
+
+
+def recordSource(source_map: SourceMap.SourceMap, parser: Parser.Parser,
+                 inst: Parser.Instruction, address: int):
+    """
+    parserが読み飛ばしたコメントと, 今の命令 (アドレスはaddress) をsource_mapに記録する
+    """
+    for comment in parser.comments:
+        source_map.comment(comment, address)
+    parser.comments.clear()
+    if inst.kind is parser.L_COMMAND:
+        source_map.label(inst.symbol, address)
+    else:
+        source_map.instruction(parser.line)
+
+
+def assembleSource(source, symbol_table: SymbolTable.SymbolTable = None) -> array:
+    """
+    ファイルを介さずにソース文字列 (または行のイテラブル) をアセンブルする
+    """
+    if isinstance(source, str):
+        source = source.splitlines()
+    return assembleSinglePass(source, symbol_table)
+
+
+def hackText(words: array) -> str:
+    """
+    1行1命令の2進テキスト(.hack)の内容を返す
+    """
+    return "".join([BIN8[w >> 8] + BIN8[w & 0xff] + "\n" for w in words])
+
+
+def binaryBytes(words: array) -> bytes:
+    """
+    1命令2byteのビッグエンディアンのバイト列を返す
+    """
+    if sys.byteorder == 'little':
+        words = array('H', words)
+        words.byteswap()
+    return words.tobytes()
+
+
+def writeHack(words: array, dst_filename: str):
+    """
+    1行1命令の2進テキスト(.hack)として書き出す
+    """
+    with open(dst_filename, "w") as dst_file:
+        dst_file.write(hackText(words))
+
+
+def writeBinary(words: array, dst_filename: str):
+    """
+    1命令2byteのビッグエンディアンで書き出す
+    """
+    with open(dst_filename, "wb") as dst_file:
+        dst_file.write(binaryBytes(words))
 
 
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.DEBUG)
-    assemble()
\ No newline at end of file
+    assemble()
@@ -0,0 +1,216 @@
+import Code
+import Parser
+import SymbolTable
+from array import array
+import hashlib
+import json
+import os
+import re
+
+# 変換結果に影響するソース. どれかが変わればキャッシュは使われない
+ASSEMBLER_SOURCES = ['Code.py', 'Parser.py', 'SymbolTable.py', 'AssemblyCache.py']
+# 1チャンクの最小行数. この行数を超えたら次のラベル定義の行でチャンクを区切る
+CHUNK_LINES = 256
+# キャッシュファイルの先頭のキー. これがないファイルはキャッシュとみなさず, 上書きもしない
+MAGIC = 'hack-assembly-cache'
+WHITESPACE_REGREP = re.compile('[\s]')
+
+
+def assemblerVersion() -> str:
+    """
+    アセンブラのソースのハッシュを返す
+    """
+    h = hashlib.sha256()
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in ASSEMBLER_SOURCES:
+        with open(os.path.join(base_dir, name), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def splitChunks(lines: list) -> list:
+    """
+    ラベル定義の行を区切りにして行のリストをチャンクに分ける
+    区切りが内容だけで決まるので, 行の挿入や削除は前後のチャンクに影響しない
+    """
+    chunks = []
+    start = 0
+    for i, line in enumerate(lines):
+        if i - start >= CHUNK_LINES and line.lstrip().startswith('('):
+            chunks.append(lines[start:i])
+            start = i
+    chunks.append(lines[start:])
+    return chunks
+
+
+class Chunk():
+    """
+    位置に依存しない形でエンコードしたチャンク
+    words: 機械語. 定義済み以外のシンボルを参照するAコマンドは0のまま
+    relocations: (チャンク内の位置, シンボル) のリスト. リンク時に書き換える
+    labels: (ラベル, チャンク内の位置) のリスト
+    """
+    __slots__ = ('words', 'relocations', 'labels')
+
+    def __init__(self, words: array, relocations: list, labels: list):
+        self.words = words
+        self.relocations = relocations
+        self.labels = labels
+
+    def toJSON(self) -> list:
+        return [self.words.tolist(), self.relocations, self.labels]
+
+    @classmethod
+    def fromJSON(cls, entry):
+        """
+        toJSONの値からChunkを作る. 形が違えばTypeError, 値の範囲が違えばValueError
+        """
+        words, relocations, labels = entry
+        if not (isinstance(words, list) and isinstance(relocations, list)
+                and isinstance(labels, list)):
+            raise TypeError("unexpected chunk: {!r}".format(entry)[:80])
+        relocations = [(offset, symbol) for offset, symbol in relocations]
+        labels = [(symbol, offset) for symbol, offset in labels]
+        for offset, symbol in relocations:
+            if not (isinstance(offset, int) and isinstance(symbol, str)):
+                raise TypeError("unexpected relocation: {!r}".format((offset, symbol)))
+            if not 0 <= offset < len(words):
+                raise ValueError("relocation out of chunk: {}".format(offset))
+        for symbol, offset in labels:
+            if not (isinstance(symbol, str) and isinstance(offset, int)):
+                raise TypeError("unexpected label: {!r}".format((symbol, offset)))
+            if not 0 <= offset <= len(words):
+                raise ValueError("label out of chunk: {}".format(offset))
+        # 0..65535以外の値や整数でない値はarrayがOverflowError/TypeErrorにする
+        return cls(array('H', words), relocations, labels)
+
+    @classmethod
+    def encode(cls, lines: list, code: Code.Code):
+        words = array('H')
+        relocations = []
+        labels = []
+        defined_symbols = SymbolTable.SymbolTable.defined_symbols
+        for line in lines:
+            command = WHITESPACE_REGREP.sub('', line)
+            comment = command.find('//')
+            if comment != -1:
+                command = command[:comment]
+            if not command:
+                continue
+            inst = Parser.Parser.parse(command)
+            if inst.kind is Parser.Parser.A_COMMAND:
+                if inst.value is not None:
+                    words.append(inst.value)
+                elif inst.symbol in defined_symbols:
+                    words.append(defined_symbols[inst.symbol])
+                else:
+                    relocations.append((len(words), inst.symbol))
+                    words.append(0)
+            elif inst.kind is Parser.Parser.L_COMMAND:
+                labels.append((inst.symbol, len(words)))
+            else:
+                words.append(code.cInstruction(inst.dest, inst.comp, inst.jump))
+        return cls(words, relocations, labels)
+
+
+def readCache(filename: str):
+    """
+    filenameをキャッシュとして読んで辞書を返す
+    ない, 読めない, JSONでない, MAGICがないファイルはNone
+    """
+    try:
+        with open(filename, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cache, dict) or cache.get('magic') != MAGIC:
+        return None
+    return cache
+
+
+class AssemblyCache():
+    """
+    チャンク (ソースの連続した行) ごとのエンコード結果をファイルに保存し,
+    変更のあったチャンクだけを再エンコードしてアセンブルする
+    ラベルのアドレスと参照の書き換えはリンク時に毎回やり直す
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.version = assemblerVersion()
+        self.chunks = {}  # ソースのハッシュ (16進) -> Chunk
+        self.hits = 0
+        self.misses = 0
+        cache = readCache(filename)
+        if cache is not None and cache.get('version') == self.version \
+                and isinstance(cache.get('chunks'), dict):
+            for key, entry in cache['chunks'].items():
+                # 壊れたチャンクはないものとみなし, 再エンコードする
+                try:
+                    self.chunks[key] = Chunk.fromJSON(entry)
+                except (ValueError, TypeError, OverflowError):
+                    continue
+
+    def save(self):
+        """
+        直前のassembleで使ったチャンクだけを保存する
+        filenameにキャッシュでないファイルがあれば上書きせずにエラーにする
+        """
+        if os.path.exists(self.filename) and readCache(self.filename) is None:
+            raise Exception("Error: not an assembly cache, refusing to overwrite: {}".format(
+                self.filename))
+        tmp_filename = "{}.{}.tmp".format(self.filename, os.getpid())
+        with open(tmp_filename, 'w') as f:
+            json.dump({'magic': MAGIC, 'version': self.version,
+                       'chunks': {key: chunk.toJSON() for key, chunk in self.chunks.items()}}, f)
+        os.replace(tmp_filename, self.filename)
+
+    def assemble(self, src_filename: str,
+                 symbol_table: SymbolTable.SymbolTable = None) -> array:
+        """
+        assembleSinglePassと同じ機械語を返す
+        """
+        with open(src_filename, 'r') as f:
+            lines = f.read().split('\n')
+        code = Code.Code()
+        used = {}
+        chunks = []
+        for chunk_lines in splitChunks(lines):
+            key = hashlib.sha256('\n'.join(chunk_lines).encode()).hexdigest()
+            chunk = used.get(key) or self.chunks.get(key)
+            if chunk is None:
+                chunk = Chunk.encode(chunk_lines, code)
+                self.misses += 1
+            else:
+                self.hits += 1
+            used[key] = chunk
+            chunks.append(chunk)
+        self.chunks = used
+        return self.link(chunks, symbol_table)
+
+    @staticmethod
+    def link(chunks: list, symbol_table: SymbolTable.SymbolTable = None) -> array:
+        """
+        チャンクを連結し, ラベルの位置を決めてから参照を書き換える
+        ラベルでないシンボルは変数として初出順にアドレスを割り当てる
+        """
+        if symbol_table is None:
+            symbol_table = SymbolTable.SymbolTable()
+        words = array('H')
+        bases = []
+        for chunk in chunks:
+            base = len(words)
+            bases.append(base)
+            for symbol, offset in chunk.labels:
+                if symbol_table.contains(symbol):
+                    raise Exception("Error: Dual Definition of l_symbol: {}".format(symbol))
+                symbol_table.addEntry(symbol, base + offset)
+            words.extend(chunk.words)
+
+        for chunk, base in zip(chunks, bases):
+            for offset, symbol in chunk.relocations:
+                if symbol_table.contains(symbol):
+                    words[base + offset] = symbol_table.getAddress(symbol)
+                else:
+                    words[base + offset] = symbol_table.addLocalVar(symbol)
+        return words
@@ -1,4 +1,6 @@
 class Code():
+    C_PREFIX = 0b111 << 13
+
     def __init__(self):
         self.jump_dict = {
             "":    "000",
@@ -41,6 +43,12 @@ class Code():
             "D&M": "1000000",
             "D|M": "1010101",
         }
+
+        # 命令語に直接ORできるようシフト済みの整数
+        self.comp_bits = {k: int(v, 2) << 6 for k, v in self.comp_dict.items()}
+        self.dest_bits = {d: int(self.dest(d), 2) << 3
+                          for d in ["", "M", "D", "MD", "A", "AM", "AD", "AMD"]}
+        self.jump_bits = {k: int(v, 2) for k, v in self.jump_dict.items()}
     
     def dest(self, mnemonic: str):
         """
@@ -62,4 +70,11 @@ class Code():
         """
         destニーモニックのバイナリを返す
         """
-        return self.jump_dict[mnemonic]
\ No newline at end of file
+        return self.jump_dict[mnemonic]
+
+    def cInstruction(self, dest: str, comp: str, jump: str) -> int:
+        """
+        Cコマンドの16bit命令語を返す
+        """
+        return self.C_PREFIX | self.comp_bits[comp] \
+            | self.dest_bits[dest] | self.jump_bits[jump]
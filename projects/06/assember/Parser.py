@@ -1,73 +1,199 @@
+import mmap
+import os
 import re
 import logging
 
+# MappedSourceが1度にデコードする大きさ (この後の最初の改行までを1ブロックにする)
+BLOCK_SIZE = 1 << 16
+# 行から取り除く空白 (改行は行の分割に使う)
+WHITESPACE = b' \t\r\f\v'
+WHITESPACE_REGREP = re.compile('[\s]')
+# Aコマンドに書ける定数の最大値 (最上位bitはCコマンドを表す)
+MAX_CONSTANT = 0x7fff
+
+
+def release(data, end: int):
+    """
+    読み終わったendまでのページをプロセスから外す (ページキャッシュには残る)
+    マップしたページもRSSに数えられるので, 外さないとファイルの大きさだけRSSが増える
+    """
+    if isinstance(data, mmap.mmap) and hasattr(mmap, 'MADV_DONTNEED'):
+        end -= end % mmap.PAGESIZE
+        if end > 0:
+            data.madvise(mmap.MADV_DONTNEED, 0, end)
+
+
+class Instruction():
+    """
+    1行分のパース結果
+    kind: A_COMMAND / C_COMMAND / L_COMMAND
+    symbol: A, Lコマンドのシンボル (数値の場合はその文字列)
+    value: Aコマンドの数値 (シンボルの場合はNone)
+    dest, comp, jump: Cコマンドの各フィールド
+    """
+    __slots__ = ('kind', 'symbol', 'value', 'dest', 'comp', 'jump')
+
+    def __init__(self, kind: int, symbol: str = None, value: int = None,
+                 dest: str = "", comp: str = "", jump: str = ""):
+        self.kind = kind
+        self.symbol = symbol
+        self.value = value
+        self.dest = dest
+        self.comp = comp
+        self.jump = jump
+
+    def __repr__(self):
+        return "Instruction({}, symbol={}, dest={}, comp={}, jump={})".format(
+            self.kind, self.symbol, self.dest, self.comp, self.jump)
+
+
+class MappedSource():
+    """
+    ファイルをメモリマップし, ブロックごとにまとめて空白を除いて行に分割する
+    ファイル全体を読み込まないのでメモリ使用量は一定で, 何度でも先頭から読み直せる
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                self.data = b''
+            else:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __iter__(self):
+        data = self.data
+        size = len(data)
+        start = 0
+        while start < size:
+            end = start + BLOCK_SIZE
+            if end >= size:
+                end = size
+            else:
+                end = data.find(b'\n', end) + 1 or size
+            text = data[start:end].translate(None, WHITESPACE).decode()
+            lines = text.split('\n')
+            if text.endswith('\n'):
+                lines.pop()
+            yield from lines
+            start = end
+            release(data, start)
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+
 class Parser():
     A_COMMAND = 1
     C_COMMAND = 2
     L_COMMAND = 3
 
-    A_COMMAND_REGREP_SYMBOL = re.compile("^@[a-zA-Z][\w\.\$:]*$")
+    A_COMMAND_REGREP_SYMBOL = re.compile("^@[a-zA-Z_\.\$:][\w\.\$:]*$")
     A_COMMAND_REGREP_NUM = re.compile("^@[\d]+$")
     C_COMMAND_REGREP = re.compile("(?:(A?M?D?)=)?([^;]+)(?:;(.+))?")
     L_COMMAND_REGREP = re.compile('^\([\w\.\$:]*\)$')
+    # 上の4つを1回のマッチで判定する
+    COMMAND_REGREP = re.compile(
+        "@(?P<a_symbol>[a-zA-Z_\.\$:][\w\.\$:]*)$"
+        "|@(?P<a_num>[\d]+)$"
+        "|\((?P<l_symbol>[\w\.\$:]*)\)$"
+        "|(?:(?P<dest>A?M?D?)=)?(?P<comp>[^;]+)(?:;(?P<jump>.+))?")
 
-    def __init__(self, filename: str):
+    def __init__(self, filename, comments: bool = False):
+        """
+        filenameにはファイル名, MappedSource, 行のイテラブル (ファイルオブジェクト, 文字列のリストなど) を渡す
+        ファイル名の場合はメモリマップして読む
+        commentsがTrueなら, 読み飛ばしたコメントの本文 (空白を除いたもの) をself.commentsに溜める
+        """
         self.filename = filename
-        self.file = open(filename, "r")
+        if isinstance(filename, str):
+            filename = MappedSource(filename)
+        if isinstance(filename, MappedSource):
+            # 空白はブロック単位で除いてある
+            self.lines = iter(filename)
+        else:
+            self.lines = (WHITESPACE_REGREP.sub('', line) for line in filename)
         self.command = None
+        self.instruction = None
+        self.line = 0
+        self.comments = [] if comments else None
+        self.trace = logging.getLogger().isEnabledFor(logging.DEBUG)
+
+    def __iter__(self):
+        """
+        残りの行をInstructionとして順に返す
+        """
+        while self.advance():
+            yield self.instruction
 
     def hasMoreCommand(self, line: str):
         return True if line != '' else False
 
     def advance(self):
         while True:
-            line = self.file.readline()
-            logging.debug("readline: {}".format(line))
-            if not line:
+            line = next(self.lines, None)
+            self.line += 1
+            if self.trace:
+                logging.debug("readline: %s", line)
+            if line is None:
                 self.command = None
+                self.instruction = None
                 break
 
-            line = re.sub('[\s]', '', line)
             line_fin = line.find('//')
             if line_fin != -1:
+                if self.comments is not None:
+                    self.comments.append(line[line_fin + 2:])
                 line = line[:line_fin]
             if line:
-                logging.debug("set command: {}".format(line))
+                if self.trace:
+                    logging.debug("set command: %s", line)
                 self.command = line
+                self.instruction = self.parse(line, self.line)
                 return True
 
         return False
 
-    def commandType(self):
-        logging.debug("comandType: {}".format(self.command))
-        if self.A_COMMAND_REGREP_SYMBOL.match(self.command) is not None:
-            return self.A_COMMAND
-        elif self.A_COMMAND_REGREP_NUM.match(self.command) is not None:
-            return self.A_COMMAND
-        elif self.L_COMMAND_REGREP.match(self.command) is not None:
-            return self.L_COMMAND
+    @classmethod
+    def parse(cls, command: str, line: int = None) -> Instruction:
+        """
+        空白, コメントを除いた1行をInstructionに変換
+        lineはエラーメッセージに出す行番号
+        """
+        m = cls.COMMAND_REGREP.match(command)
+        if m is None:
+            return Instruction(cls.C_COMMAND)
+        a_symbol, a_num, l_symbol, dest, comp, jump = m.groups()
+        if a_symbol is not None:
+            return Instruction(cls.A_COMMAND, a_symbol)
+        elif a_num is not None:
+            value = int(a_num)
+            if value > MAX_CONSTANT:
+                raise Exception("Error: constant out of range (0..{}){}: {}".format(
+                    MAX_CONSTANT, " at line {}".format(line) if line is not None else "", command))
+            return Instruction(cls.A_COMMAND, a_num, value)
+        elif l_symbol is not None:
+            return Instruction(cls.L_COMMAND, l_symbol)
         else:
-            return self.C_COMMAND
+            return Instruction(cls.C_COMMAND, dest=dest or "",
+                               comp=comp, jump=jump or "")
+
+    def commandType(self):
+        if self.trace:
+            logging.debug("comandType: %s", self.command)
+        return self.instruction.kind
 
     def symbol(self):
-        if self.command[0] is "@":
-            return self.command[1:]
-        elif self.command[0] is "(" and self.command[-1] is ")":
-            return self.command[1:-1]
-        else:
+        if self.instruction.kind is self.C_COMMAND:
             raise Exception()
+        return self.instruction.symbol
 
     def dest(self):
-        d = re.match(self.C_COMMAND_REGREP, self.command)
-        ret = d.group(1) if d is not None else None
-        return ret if ret is not None else ""
+        return self.instruction.dest
 
     def comp(self):
-        d = re.match(self.C_COMMAND_REGREP, self.command)
-        ret = d.group(2) if d is not None else None
-        return ret if ret is not None else ""
+        return self.instruction.comp
 
     def jump(self):
-        d = re.match(self.C_COMMAND_REGREP, self.command)
-        ret = d.group(3) if d is not None else None
-        return ret if ret is not None else ""
\ No newline at end of file
+        return self.instruction.jump
@@ -0,0 +1,124 @@
+from array import array
+from bisect import bisect_right
+import json
+import re
+
+# VMtranslatorが各コマンドの前に書くコメント "Main.vm: push constant 1 (line: 3)"
+# (Parserが空白を除いた後の形で受け取る)
+VM_COMMENT_REGREP = re.compile(r"^(?P<file>[^:]+\.vm):(?P<command>.*)\(line:(?P<line>\d+)\)$")
+
+
+class SourceMap():
+    """
+    ROMアドレス -> .asmの行 -> .vmのファイル/行/関数 の対応
+    asm_lines: アドレスごとの.asmの行番号
+    vm_addresses: VMコマンドの先頭アドレス (昇順). vm_files, vm_linesが同じ位置の
+                  ファイル (filesの番号) と行番号
+    function_addresses: 関数の先頭アドレス (昇順). function_namesが同じ位置の関数名
+    アドレスからはbisectで直前の要素を引く
+    """
+
+    def __init__(self):
+        self.asm_lines = array('I')
+        self.files = []
+        self.vm_addresses = array('I')
+        self.vm_files = array('H')
+        self.vm_lines = array('I')
+        self.function_addresses = array('I')
+        self.function_names = []
+        self.file_index = {}
+        self.pending_function = False
+
+    def instruction(self, asm_line: int):
+        """
+        次のアドレスの命令が.asmのasm_line行目にあることを記録
+        """
+        self.asm_lines.append(asm_line)
+
+    def comment(self, text: str, address: int):
+        """
+        addressの命令の前にあったコメント. VMコマンドのコメントなら記録する
+        同じアドレスに複数のコマンドがある場合 (コードを出さないコマンドや畳み込み) は最後のものを残す
+        """
+        m = VM_COMMENT_REGREP.match(text)
+        if m is None:
+            return
+        filename = m.group('file')
+        index = self.file_index.get(filename)
+        if index is None:
+            index = self.file_index[filename] = len(self.files)
+            self.files.append(filename)
+        if self.vm_addresses and self.vm_addresses[-1] == address:
+            self.vm_files[-1] = index
+            self.vm_lines[-1] = int(m.group('line'))
+        else:
+            self.vm_addresses.append(address)
+            self.vm_files.append(index)
+            self.vm_lines.append(int(m.group('line')))
+        if m.group('command').startswith('function'):
+            # 関数名は続くラベル定義から取る (空白を除いたコメントからは区切れない)
+            self.pending_function = True
+
+    def label(self, symbol: str, address: int):
+        if self.pending_function:
+            self.pending_function = False
+            if self.function_addresses and self.function_addresses[-1] == address:
+                self.function_names[-1] = symbol
+            else:
+                self.function_addresses.append(address)
+                self.function_names.append(symbol)
+
+    def asmLine(self, address: int) -> int:
+        return self.asm_lines[address]
+
+    def vmLocation(self, address: int) -> tuple:
+        """
+        (ファイル名, 行番号). VMコマンドより前 (ブートストラップ) ならNone
+        """
+        i = bisect_right(self.vm_addresses, address) - 1
+        if i < 0:
+            return None
+        return self.files[self.vm_files[i]], self.vm_lines[i]
+
+    def function(self, address: int) -> str:
+        """
+        addressを含む関数名. 最初の関数より前ならNone
+        """
+        i = bisect_right(self.function_addresses, address) - 1
+        if i < 0:
+            return None
+        return self.function_names[i]
+
+    def lookup(self, address: int) -> tuple:
+        """
+        (.asmの行番号, .vmのファイル名, .vmの行番号, 関数名)
+        """
+        location = self.vmLocation(address) or (None, None)
+        return (self.asm_lines[address],) + location + (self.function(address),)
+
+    def save(self, filename: str):
+        with open(filename, "w") as f:
+            json.dump({
+                'asm_lines': self.asm_lines.tolist(),
+                'files': self.files,
+                'vm_addresses': self.vm_addresses.tolist(),
+                'vm_files': self.vm_files.tolist(),
+                'vm_lines': self.vm_lines.tolist(),
+                'function_addresses': self.function_addresses.tolist(),
+                'function_names': self.function_names,
+            }, f, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, filename: str):
+        with open(filename, "r") as f:
+            data = json.load(f)
+        source_map = cls()
+        source_map.asm_lines = array('I', data['asm_lines'])
+        source_map.files = data['files']
+        source_map.file_index = {f: i for i, f in enumerate(source_map.files)}
+        source_map.vm_addresses = array('I', data['vm_addresses'])
+        source_map.vm_files = array('H', data['vm_files'])
+        source_map.vm_lines = array('I', data['vm_lines'])
+        source_map.function_addresses = array('I', data['function_addresses'])
+        source_map.function_names = data['function_names']
+        return source_map
@@ -0,0 +1,93 @@
+import Code
+import Parser
+import SymbolTable
+from array import array
+
+# encodeの結果の種類
+WORD = 0     # そのまま出力する機械語
+SYMBOL = 1   # 未解決かもしれないシンボルを参照するAコマンド
+LABEL = 2    # ラベル定義
+EMPTY = 3    # 空行, コメント行
+
+
+class StreamAssembler():
+    """
+    アセンブリの命令を行のリストで受け取りながら, 1パスで機械語にする
+    CodeWriterの出力先として渡すと, 1つのテキストに連結したり.asmファイルを介したりせずに,
+    CodeWriterが作った行 (文字列) をそのまま受け取る
+    行はテキストのままなので解析は必要だが, 同じ行は最初の1回だけParser.parseで解析し,
+    2回目からはencodedに覚えた結果を使う
+    """
+
+    def __init__(self, symbol_table: SymbolTable.SymbolTable = None):
+        self.symbol_table = symbol_table if symbol_table is not None \
+            else SymbolTable.SymbolTable()
+        self.code = Code.Code()
+        self.words = array('H')
+        self.fixups = {}   # symbol -> 書き換え待ちの命令位置のリスト
+        self.encoded = {}  # 行 -> (種類, 機械語またはシンボル)
+
+    def encode(self, line: str):
+        command = Parser.WHITESPACE_REGREP.sub('', line)
+        comment = command.find('//')
+        if comment != -1:
+            command = command[:comment]
+        if not command:
+            return EMPTY, None
+        inst = Parser.Parser.parse(command)
+        if inst.kind is Parser.Parser.A_COMMAND:
+            if inst.value is not None:
+                return WORD, inst.value
+            if inst.symbol in SymbolTable.SymbolTable.defined_symbols:
+                return WORD, SymbolTable.SymbolTable.defined_symbols[inst.symbol]
+            return SYMBOL, inst.symbol
+        if inst.kind is Parser.Parser.L_COMMAND:
+            return LABEL, inst.symbol
+        return WORD, self.code.cInstruction(inst.dest, inst.comp, inst.jump)
+
+    def writeLines(self, lines: list):
+        """
+        assembleSinglePassと同じ規則で行を順に機械語にする
+        """
+        words = self.words
+        encoded = self.encoded
+        symbol_table = self.symbol_table
+        for line in lines:
+            entry = encoded.get(line)
+            if entry is None:
+                entry = encoded[line] = self.encode(line)
+            kind, value = entry
+            if kind == WORD:
+                words.append(value)
+            elif kind == SYMBOL:
+                if symbol_table.contains(value):
+                    words.append(symbol_table.getAddress(value))
+                else:
+                    self.fixups.setdefault(value, []).append(len(words))
+                    words.append(0)
+            elif kind == LABEL:
+                if symbol_table.contains(value):
+                    raise Exception("Error: Dual Definition of l_symbol: {}".format(value))
+                symbol_table.addEntry(value, len(words))
+                for pc in self.fixups.pop(value, []):
+                    words[pc] = len(words)
+
+    def write(self, text: str):
+        """
+        アセンブリのテキストを書き込む (ファイルオブジェクトの代わりに使う場合)
+        """
+        self.writeLines(text.split('\n'))
+
+    def close(self):
+        pass
+
+    def finish(self) -> array:
+        """
+        残ったシンボルを変数として初出順に割り当て, 機械語を返す
+        """
+        for symbol, pcs in self.fixups.items():
+            address = self.symbol_table.addLocalVar(symbol)
+            for pc in pcs:
+                self.words[pc] = address
+        self.fixups = {}
+        return self.words
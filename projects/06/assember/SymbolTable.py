@@ -28,29 +28,50 @@ class SymbolTable():
     }
 
     def __init__(self):
-        self.table = self.defined_symbols
+        self.table = {}
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        定義済みシンボルだけの状態に戻す (同じインスタンスで別のプログラムをアセンブルできる)
+        """
+        self.table.clear()
+        self.table.update(self.defined_symbols)
         self.local_var_address = 16
 
+    def snapshot(self) -> tuple:
+        """
+        現在の状態を返す. restoreで戻せる
+        """
+        return self.table.copy(), self.local_var_address
+
+    def restore(self, snapshot: tuple) -> None:
+        """
+        snapshotで保存した状態に戻す
+        """
+        table, self.local_var_address = snapshot
+        self.table.clear()
+        self.table.update(table)
+
     def addEntry(self, symbol: str, address: int) -> None:
         """
         デーブルに(symbol, address)のペアを追加
         """
         if not self.contains(symbol):
-            logging.debug("SybmolTable: Add {} => {}".format(symbol, address))
+            logging.debug("SybmolTable: Add %s => %s", symbol, address)
             self.table[symbol] = address
 
     def contains(self, symbol: str) -> bool:
         """
         テーブルにsymbolを含むか？
         """
-        return symbol in self.table.keys()
+        return symbol in self.table
 
     def getAddress(self, symbol: str) -> int:
         """
         symbolに結び付けられたアドレスを返す
         """
-        address = self.table.get(symbol) 
-        return address if address != None else -1
+        return self.table.get(symbol, -1)
 
     def addLocalVar(self, symbol: str) -> int:
         """
@@ -59,4 +80,4 @@ class SymbolTable():
         if not self.contains(symbol):
             self.addEntry(symbol, self.local_var_address)
             self.local_var_address += 1
-        return self.getAddress(symbol)
\ No newline at end of file
+        return self.getAddress(symbol)
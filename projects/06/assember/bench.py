@@ -0,0 +1,431 @@
+import AssemblyCache
+import Assembler
+import Parser
+import SourceMap
+import SymbolTable
+import argparse
+import logging
+import os
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+PONG_ASM = os.path.join(PROJECT_DIR, 'pong', 'Pong.asm')
+RECT_ASM = os.path.join(PROJECT_DIR, 'rect', 'Rect.asm')
+VM_TRANSLATOR = os.path.join(PROJECT_DIR, '..', '08', 'VMtranslator', 'VMtranslator.py')
+FIBONACCI_ELEMENT = os.path.join(PROJECT_DIR, '..', '08', 'FunctionCalls', 'FibonacciElement')
+
+
+def measure(func, *args, repeat: int = 5):
+    """
+    funcを実行して (最短の実行時間[s], ピークメモリ[byte]) を返す
+    時間計測とメモリ計測は別々に実行する
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def report(name: str, elapsed: float, peak: int):
+    print("{:<16} {:>10.1f} ms {:>10.1f} KiB".format(
+        name, elapsed * 1000, peak / 1024))
+
+
+def benchSinglePass(args):
+    """
+    2パスと1パス(バックパッチ)のアセンブルを比較
+    """
+    print(args.src)
+    report('two-pass', *measure(Assembler.assembleTwoPass,
+                                args.src, repeat=args.repeat))
+    report('single-pass', *measure(Assembler.assembleSinglePass,
+                                   args.src, repeat=args.repeat))
+    if Assembler.assembleTwoPass(args.src) != Assembler.assembleSinglePass(args.src):
+        raise Exception("Error: output mismatch between two-pass and single-pass")
+
+
+def benchOutput(args):
+    """
+    .hackテキストとパック済みバイナリの書き出しを比較
+    """
+    words = Assembler.assembleSinglePass(args.src)
+    print("{} ({} words)".format(args.src, len(words)))
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, writer, filename in [
+                ('text', Assembler.writeHack, 'out.hack'),
+                ('binary', Assembler.writeBinary, 'out.bin')]:
+            dst = os.path.join(tmp, filename)
+            report(name, *measure(writer, words, dst, repeat=args.repeat))
+            print("{:<16} {:>10} bytes".format('', os.path.getsize(dst)))
+
+
+def benchTrace(args):
+    """
+    トレースなし/ありでアセンブルのスループットを比較
+    """
+    # トレース出力そのものではなくフォーマットとlogging呼び出しのコストを測る
+    handler = logging.StreamHandler(open(os.devnull, 'w'))
+    logging.getLogger().addHandler(handler)
+    size = os.path.getsize(args.src)
+    print(args.src)
+    for name, level in [('quiet', logging.WARNING), ('trace', logging.DEBUG)]:
+        logging.getLogger().setLevel(level)
+        elapsed, peak = measure(Assembler.assembleSinglePass, args.src, repeat=args.repeat)
+        report(name, elapsed, peak)
+        print("{:<16} {:>10.2f} MB/s".format('', size / elapsed / 1e6))
+    logging.getLogger().removeHandler(handler)
+
+
+def parseLegacy(filename: str):
+    """
+    Instruction導入前と同じく, 1行ごとに最大4回の正規表現で種類を判定し,
+    dest/comp/jumpごとにC_COMMAND_REGREPを再実行する
+    """
+    P = Parser.Parser
+    for line in open(filename, "r"):
+        command = re.sub('[\s]', '', line)
+        comment_i = command.find('//')
+        if comment_i != -1:
+            command = command[:comment_i]
+        if not command:
+            continue
+        if P.A_COMMAND_REGREP_SYMBOL.match(command) is not None \
+                or P.A_COMMAND_REGREP_NUM.match(command) is not None:
+            command[1:]
+        elif P.L_COMMAND_REGREP.match(command) is not None:
+            command[1:-1]
+        else:
+            P.C_COMMAND_REGREP.match(command)
+            P.C_COMMAND_REGREP.match(command)
+            P.C_COMMAND_REGREP.match(command)
+
+
+def parseRecords(filename: str):
+    for line in open(filename, "r"):
+        command = re.sub('[\s]', '', line)
+        comment_i = command.find('//')
+        if comment_i != -1:
+            command = command[:comment_i]
+        if command:
+            Parser.Parser.parse(command)
+
+
+def benchParse(args):
+    """
+    行ごとの正規表現マッチとInstructionへの1回パースを比較
+    """
+    for src in args.src:
+        print(src)
+        report('per-accessor', *measure(parseLegacy, src, repeat=args.repeat))
+        report('records', *measure(parseRecords, src, repeat=args.repeat))
+
+
+def editLine(filename: str, position: float, edit: str):
+    """
+    全体のpositionの位置にある命令行を書き換える
+    replace: 定数を変える / insert: 命令を1行挿入 (後ろのラベルがずれる)
+    """
+    with open(filename) as f:
+        lines = f.read().split('\n')
+    i = int(len(lines) * position)
+    while not lines[i].strip().startswith('@'):
+        i -= 1
+    if edit == 'replace':
+        lines[i] = '@12345'
+    else:
+        lines.insert(i, 'D=D+1')
+    with open(filename, 'w') as f:
+        f.write('\n'.join(lines))
+
+
+def benchIncremental(args):
+    """
+    小さな編集の後の再アセンブルを, キャッシュなしとチャンクキャッシュで比較
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, os.path.basename(args.src))
+        shutil.copy(args.src, src)
+        cache_file = os.path.join(tmp, 'asm.cache')
+        print(args.src)
+        for name, position, edit in [('cold', None, None),
+                                     ('unchanged', None, None),
+                                     ('tail replace', 0.95, 'replace'),
+                                     ('tail insert', 0.95, 'insert'),
+                                     ('middle insert', 0.5, 'insert')]:
+            if edit is not None:
+                editLine(src, position, edit)
+            full, _ = measure(Assembler.assembleSinglePass, src, repeat=args.repeat)
+            cache = AssemblyCache.AssemblyCache(cache_file)
+            start = time.perf_counter()
+            words = cache.assemble(src)
+            elapsed = time.perf_counter() - start
+            cache.save()
+            print("{:<14} full {:>7.1f} ms  incremental {:>7.1f} ms  hit {:>3} miss {:>3}".format(
+                name, full * 1000, elapsed * 1000, cache.hits, cache.misses))
+            if words != Assembler.assembleSinglePass(src):
+                raise Exception("Error: incremental output mismatch")
+
+
+def assembleRepeated(src: str, count: int, reuse: bool):
+    symbol_table = SymbolTable.SymbolTable()
+    for _ in range(count):
+        if reuse:
+            symbol_table.reset()
+        else:
+            symbol_table = SymbolTable.SymbolTable()
+        Assembler.assembleSinglePass(src, symbol_table)
+    return symbol_table
+
+
+def setupTables(count: int, reuse: bool):
+    symbol_table = SymbolTable.SymbolTable()
+    for _ in range(count):
+        if reuse:
+            symbol_table.reset()
+        else:
+            symbol_table = SymbolTable.SymbolTable()
+
+
+def lookupSymbols(table: SymbolTable.SymbolTable, symbols: list, keys: bool):
+    if keys:
+        # 変更前のcontains
+        for s in symbols:
+            s in table.table.keys()
+    else:
+        for s in symbols:
+            table.contains(s)
+
+
+def benchSymbols(args):
+    """
+    同じプロセスでの繰り返しアセンブル (テーブルを毎回作る/resetで使い回す) と
+    containsの参照コストを比較
+    """
+    print("{} x {}".format(args.src, args.count))
+    for name, reuse in [('new table', False), ('reset', True)]:
+        report(name, *measure(assembleRepeated, args.src, args.count, reuse,
+                              repeat=args.repeat))
+    print("table setup x 100000")
+    for name, reuse in [('new table', False), ('reset', True)]:
+        report(name, *measure(setupTables, 100000, reuse, repeat=args.repeat))
+
+    # 使い回したテーブルに前のプログラムのシンボルが残っていないか
+    expected = Assembler.assembleSinglePass(args.src)
+    symbol_table = SymbolTable.SymbolTable()
+    before = symbol_table.snapshot()
+    for src in [RECT_ASM, args.src]:
+        symbol_table.reset()
+        words = Assembler.assembleSinglePass(src, symbol_table)
+    if words != expected:
+        raise Exception("Error: output changed after reusing the symbol table")
+    symbol_table.restore(before)
+    if symbol_table.table != SymbolTable.SymbolTable.defined_symbols:
+        raise Exception("Error: restore did not return to the predefined symbols")
+
+    symbol_table = SymbolTable.SymbolTable()
+    Assembler.assembleSinglePass(args.src, symbol_table)
+    symbols = [inst.symbol for inst in Parser.Parser(args.src)
+               if inst.kind is not Parser.Parser.C_COMMAND and inst.value is None]
+    print("{} lookups".format(len(symbols)))
+    for name, keys in [('contains .keys()', True), ('contains', False)]:
+        report(name, *measure(lookupSymbols, symbol_table, symbols, keys,
+                              repeat=args.repeat))
+
+
+def makeLargeSource(src: str, dst: str, size: int):
+    """
+    srcをsize byte以上になるまで繰り返したソースを作る
+    2つ目以降のコピーのラベル定義はコメントにして, 参照は最初のコピーのラベルに解決させる
+    """
+    with open(src) as f:
+        text = f.read()
+    copy = re.sub(r"^(\s*\()", r"// \1", text, flags=re.MULTILINE)
+    with open(dst, 'w') as f:
+        f.write(text)
+        written = len(text)
+        while written < size:
+            f.write(copy)
+            written += len(copy)
+
+
+def runLarge(args):
+    """
+    (子プロセス用) 1回アセンブルして時間とピークRSSをJSONで出力
+    """
+    import json
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if args.reader == 'readline':
+        with open(args.src) as f:
+            words = Assembler.assembleSinglePass(f)
+    else:
+        words = Assembler.assembleSinglePass(args.src)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'elapsed': elapsed, 'words': len(words), 'baseline': baseline,
+                      'peak': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+
+
+def benchLarge(args):
+    """
+    大きな合成ソースで, 行ごとのreadline+正規表現とメモリマップ+ブロック処理を比較
+    """
+    import json
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, 'Large.asm')
+        makeLargeSource(args.src, src, args.size_mb * 1024 * 1024)
+        size = os.path.getsize(src)
+        print("{} x{:.0f} ({:.1f} MB)".format(
+            args.src, size / os.path.getsize(args.src), size / 1e6))
+        for reader in ['readline', 'mmap']:
+            result = subprocess.run(
+                [sys.executable, __file__, 'large-run', src, reader],
+                check=True, stdout=subprocess.PIPE, text=True)
+            r = json.loads(result.stdout)
+            # ru_maxrssはLinuxではKiB単位
+            print("{:<10} {:>8.1f} s {:>8.2f} MB/s  peak RSS {:>7.1f} MiB (+{:.1f} MiB)".format(
+                reader, r['elapsed'], size / r['elapsed'] / 1e6, r['peak'] / 1024,
+                (r['peak'] - r['baseline']) / 1024))
+
+
+def lookupAll(source_map: SourceMap.SourceMap, count: int):
+    for address in range(count):
+        source_map.lookup(address)
+
+
+def lookupLinear(source_map: SourceMap.SourceMap, count: int):
+    """
+    bisectを使わず, 先頭から直前のVMコマンドと関数を探す
+    """
+    for address in range(count):
+        i = 0
+        while i < len(source_map.vm_addresses) and source_map.vm_addresses[i] <= address:
+            i += 1
+        j = 0
+        while j < len(source_map.function_addresses) and \
+                source_map.function_addresses[j] <= address:
+            j += 1
+        source_map.asm_lines[address]
+
+
+def checkSourceMap(source_map: SourceMap.SourceMap, vm_dir: str, words: int):
+    """
+    各アドレスの.vmの行がコマンドで, その行を含む関数が対応表の関数と一致するか確かめる
+    """
+    vm_lines = {}
+    for filename in source_map.files:
+        with open(os.path.join(vm_dir, filename)) as f:
+            vm_lines[filename] = [line.split('//')[0].split() for line in f]
+    for address in range(words):
+        _, filename, line, function = source_map.lookup(address)
+        if filename is None:
+            continue
+        lines = vm_lines[filename]
+        if not lines[line - 1]:
+            raise Exception("Error: address {} maps to an empty line {}:{}".format(
+                address, filename, line))
+        n = line - 1
+        while lines[n][:1] != ['function']:
+            n -= 1
+        if lines[n][1] != function:
+            raise Exception("Error: address {} maps to {} but {}:{} is in {}".format(
+                address, function, filename, line, lines[n][1]))
+
+
+def benchSourceMap(args):
+    """
+    VMtranslatorの出力から対応表を作るコストと, アドレスからの引き当てを比較
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        for options in [[], ['--fold', '--optimize', '--trampoline']]:
+            vm_dir = os.path.join(tmp, os.path.basename(args.src))
+            shutil.rmtree(vm_dir, ignore_errors=True)
+            shutil.copytree(args.src, vm_dir)
+            subprocess.run([sys.executable, VM_TRANSLATOR, vm_dir] + options, check=True,
+                           stdout=subprocess.DEVNULL)
+            src = vm_dir + '.asm'
+            words = Assembler.assembleSinglePass(src)
+            source_map = SourceMap.SourceMap()
+            if Assembler.assembleSinglePass(src, source_map=source_map) != words:
+                raise Exception("Error: output changed with the source map")
+            checkSourceMap(source_map, vm_dir, len(words))
+            map_file = os.path.join(tmp, 'out.map')
+            source_map.save(map_file)
+
+            print("{} {} ({} words, {} vm commands, {} functions, {} bytes)".format(
+                os.path.basename(args.src), ' '.join(options), len(words),
+                len(source_map.vm_addresses), len(source_map.function_addresses),
+                os.path.getsize(map_file)))
+            report('assemble', *measure(Assembler.assembleSinglePass, src, repeat=args.repeat))
+            report('+ source map', *measure(
+                lambda: Assembler.assembleSinglePass(src, source_map=SourceMap.SourceMap()),
+                repeat=args.repeat))
+            report('load map', *measure(SourceMap.SourceMap.load, map_file, repeat=args.repeat))
+            for name, lookup in [('lookup bisect', lookupAll), ('lookup linear', lookupLinear)]:
+                elapsed, peak = measure(lookup, source_map, len(words), repeat=args.repeat)
+                report(name, elapsed, peak)
+                print("{:<16} {:>10.2f} us/lookup".format('', elapsed / len(words) * 1e6))
+            for address in [0, len(words) // 2, len(words) - 1]:
+                print("  {:>5} -> {}".format(address, source_map.lookup(address)))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Assembler benchmarks.')
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    subparsers = arg_parser.add_subparsers(dest='bench', required=True)
+
+    single_pass = subparsers.add_parser('single-pass', help=benchSinglePass.__doc__)
+    single_pass.add_argument('src', type=str, nargs='?', default=PONG_ASM)
+    single_pass.set_defaults(func=benchSinglePass)
+
+    output = subparsers.add_parser('output', help=benchOutput.__doc__)
+    output.add_argument('src', type=str, nargs='?', default=PONG_ASM)
+    output.set_defaults(func=benchOutput)
+
+    trace = subparsers.add_parser('trace', help=benchTrace.__doc__)
+    trace.add_argument('src', type=str, nargs='?', default=PONG_ASM)
+    trace.set_defaults(func=benchTrace)
+
+    parse = subparsers.add_parser('parse', help=benchParse.__doc__)
+    parse.add_argument('src', type=str, nargs='*', default=[PONG_ASM, RECT_ASM])
+    parse.set_defaults(func=benchParse)
+
+    incremental = subparsers.add_parser('incremental', help=benchIncremental.__doc__)
+    incremental.add_argument('src', type=str, nargs='?', default=PONG_ASM)
+    incremental.set_defaults(func=benchIncremental)
+
+    symbols = subparsers.add_parser('symbols', help=benchSymbols.__doc__)
+    symbols.add_argument('src', type=str, nargs='?', default=PONG_ASM)
+    symbols.add_argument('--count', type=int, default=20)
+    symbols.set_defaults(func=benchSymbols)
+
+    large = subparsers.add_parser('large', help=benchLarge.__doc__)
+    large.add_argument('src', type=str, nargs='?', default=PONG_ASM)
+    large.add_argument('--size-mb', type=int, default=32)
+    large.set_defaults(func=benchLarge)
+
+    large_run = subparsers.add_parser('large-run', help=runLarge.__doc__)
+    large_run.add_argument('src', type=str)
+    large_run.add_argument('reader', choices=['readline', 'mmap'])
+    large_run.set_defaults(func=runLarge)
+
+    source_map = subparsers.add_parser('source-map', help=benchSourceMap.__doc__)
+    source_map.add_argument('src', type=str, nargs='?', default=FIBONACCI_ELEMENT)
+    source_map.set_defaults(func=benchSourceMap)
+
+    args = arg_parser.parse_args()
+    args.func(args)
@@ -0,0 +1,158 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import argparse
+import base64
+import json
+import os
+import socketserver
+import stat
+import sys
+import threading
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+ASSEMBLER_DIR = os.path.join(PROJECT_DIR, '06', 'assember')
+
+sys.path.append(os.path.join(PROJECT_DIR, '08', 'VMtranslator'))
+import ModuleLoader  # noqa: E402
+import VMtranslator  # noqa: E402
+
+# 06/assemberと08/VMtranslatorはどちらもParserモジュールを持つので, Assemblerは別名で読み込む
+Assembler = ModuleLoader.load(ASSEMBLER_DIR, 'Assembler')
+
+
+def handle(request: dict) -> dict:
+    """
+    1つのリクエストを処理して応答を返す
+    {"op": "assemble", "source": asm, "format": "hack" | "binary"}
+        -> output: .hackのテキスト, binaryの場合はbase64
+    {"op": "translate", "files": [{"name": "Main.vm", "source": vm}, ...],
+     "optimize": bool, "trampoline": bool, "fold": bool, "link": bool, "fuse": bool}
+        -> output: アセンブリのテキスト
+    """
+    response = {'id': request.get('id')}
+    try:
+        op = request.get('op')
+        if op == 'assemble':
+            words = Assembler.assembleSource(request['source'])
+            if request.get('format', 'hack') == 'binary':
+                response['output'] = base64.b64encode(Assembler.binaryBytes(words)).decode()
+            else:
+                response['output'] = Assembler.hackText(words)
+        elif op == 'translate':
+            response['output'] = VMtranslator.translateSources(
+                [(f['name'], f['source']) for f in request['files']],
+                request.get('optimize', False), request.get('trampoline', False),
+                request.get('fold', False), request.get('link', False),
+                request.get('fuse', False))
+        else:
+            raise Exception("Unsupported op: {}".format(op))
+        response['ok'] = True
+    except Exception as e:
+        response['ok'] = False
+        response['error'] = "{}: {}".format(type(e).__name__, e)
+    return response
+
+
+def handleLine(line: str) -> str:
+    """
+    1行のJSONリクエストを処理して1行のJSON応答を返す
+    """
+    try:
+        request = json.loads(line)
+    except ValueError as e:
+        return json.dumps({'id': None, 'ok': False, 'error': "Invalid JSON: {}".format(e)})
+    if not isinstance(request, dict):
+        return json.dumps({'id': None, 'ok': False, 'error': "Request must be an object"})
+    return json.dumps(handle(request))
+
+
+class Service():
+    """
+    アセンブルとVM変換のリクエストを受け付け続けるサービス
+    workers > 1 ならリクエストをプロセスプールで並列に処理する
+    """
+
+    def __init__(self, workers: int = 1):
+        if workers > 1:
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def submit(self, line: str):
+        return self.executor.submit(handleLine, line)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def serveStdio(self, infile=sys.stdin, outfile=sys.stdout):
+        """
+        1行1リクエストで読み, 処理が終わった順に1行1応答で書き出す (idで対応を取る)
+        """
+        lock = threading.Lock()
+
+        def write(future):
+            with lock:
+                outfile.write(future.result() + '\n')
+                outfile.flush()
+
+        for line in infile:
+            if line.strip():
+                self.submit(line).add_done_callback(write)
+        self.close()
+
+    def serveSocket(self, path: str):
+        """
+        Unixドメインソケットで待ち受ける. 接続ごとにスレッドで処理する
+        pathに残っている古いソケットは消すが, ソケット以外のファイルがあればエラーにする
+        """
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            pass
+        else:
+            if not stat.S_ISSOCK(st.st_mode):
+                raise Exception("Error: not a socket, refusing to remove: {}".format(path))
+            os.remove(path)
+        server = socketserver.ThreadingUnixStreamServer(path, RequestHandler)
+        server.service = self
+        st = os.lstat(path)
+        bound = (st.st_dev, st.st_ino)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            # 待ち受け中に別のファイルに置き換えられていれば消さない
+            try:
+                st = os.lstat(path)
+                if (st.st_dev, st.st_ino) == bound:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.close()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    1接続分のリクエストを順に処理し, 同じ順で応答する
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if line.strip():
+                response = self.server.service.submit(line.decode()).result()
+                self.wfile.write((response + '\n').encode())
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(
+        description='Serve assemble/translate requests as JSON lines.')
+    arg_parser.add_argument('--socket', type=str, default=None,
+                            help='listen on a Unix socket instead of stdin/stdout')
+    arg_parser.add_argument('-j', '--workers', type=int, default=1,
+                            help='number of worker processes')
+    args = arg_parser.parse_args()
+
+    service = Service(args.workers)
+    if args.socket is not None:
+        service.serveSocket(args.socket)
+    else:
+        service.serveStdio()
@@ -0,0 +1,133 @@
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.join(SERVICE_DIR, '..', '..')
+ASSEMBLER_DIR = os.path.join(PROJECT_DIR, '06', 'assember')
+VMTRANSLATOR_DIR = os.path.join(PROJECT_DIR, '08', 'VMtranslator')
+
+
+def collectInputs(tmp: str) -> list:
+    """
+    06の.asmと07/08の.vmディレクトリをtmpにコピーし, (種類, パス) のリストを返す
+    """
+    inputs = []
+    for src in sorted(glob.glob(os.path.join(PROJECT_DIR, '06', '*', '*.asm'))):
+        if os.path.dirname(os.path.abspath(src)) == os.path.abspath(ASSEMBLER_DIR):
+            continue
+        dst = os.path.join(tmp, 'asm', os.path.basename(src))
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.copy(src, dst)
+        inputs.append(('asm', dst))
+    for project in ['07', '08']:
+        for src_dir in sorted(glob.glob(os.path.join(PROJECT_DIR, project, '*', '*'))):
+            files = sorted(glob.glob(os.path.join(src_dir, '*.vm')))
+            if not files:
+                continue
+            dst_dir = os.path.join(tmp, project, os.path.basename(src_dir))
+            os.makedirs(dst_dir)
+            for f in files:
+                shutil.copy(f, dst_dir)
+            inputs.append(('vm', dst_dir))
+    return inputs
+
+
+def runCLI(inputs: list) -> dict:
+    """
+    入力ごとにAssembler.py / VMtranslator.pyを起動し, 出力 (失敗ならNone) を返す
+    """
+    outputs = {}
+    for kind, path in inputs:
+        if kind == 'asm':
+            argv, cwd, out = ['Assembler.py', path], ASSEMBLER_DIR, path[:-4] + '.hack'
+        else:
+            argv, cwd, out = ['VMtranslator.py', path], VMTRANSLATOR_DIR, path + '.asm'
+        result = subprocess.run([sys.executable] + argv, cwd=cwd,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if result.returncode == 0:
+            with open(out) as f:
+                outputs[path] = f.read()
+        else:
+            outputs[path] = None
+    return outputs
+
+
+def makeRequest(kind: str, path: str) -> dict:
+    if kind == 'asm':
+        with open(path) as f:
+            return {'id': path, 'op': 'assemble', 'source': f.read()}
+    # VMtranslatorと同じ順序でファイルを渡す
+    files = []
+    for f in glob.glob(f"{path}/*.vm"):
+        with open(f) as src:
+            files.append({'name': os.path.basename(f), 'source': src.read()})
+    return {'id': path, 'op': 'translate', 'files': files}
+
+
+def runService(inputs: list, workers: int):
+    """
+    サービスを1つ起動して全リクエストを送り, (出力, 起動時間[s]) を返す
+    """
+    start = time.perf_counter()
+    service = subprocess.Popen(
+        [sys.executable, 'Service.py', '-j', str(workers)], cwd=SERVICE_DIR,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    # 起動 (importまで) を待つために空のリクエストを1つ送る
+    service.stdin.write(json.dumps({'id': 'ping', 'op': 'ping'}) + '\n')
+    service.stdin.flush()
+    service.stdout.readline()
+    startup = time.perf_counter() - start
+
+    requests = [json.dumps(makeRequest(kind, path)) + '\n' for kind, path in inputs]
+    service.stdin.write(''.join(requests))
+    service.stdin.close()
+    outputs = {}
+    for line in service.stdout:
+        response = json.loads(line)
+        outputs[response['id']] = response['output'] if response['ok'] else None
+    service.wait()
+    return outputs, startup
+
+
+def benchService(args):
+    """
+    入力ごとのCLI起動と, 起動済みのサービスへのリクエストを比較
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = collectInputs(tmp)
+        print("{} asm files, {} vm programs".format(
+            sum(1 for k, _ in inputs if k == 'asm'), sum(1 for k, _ in inputs if k == 'vm')))
+
+        start = time.perf_counter()
+        expected = runCLI(inputs)
+        elapsed = time.perf_counter() - start
+        print("{:<16} {:>10.1f} ms".format('cli', elapsed * 1000))
+
+        for workers in args.workers:
+            start = time.perf_counter()
+            outputs, startup = runService(inputs, workers)
+            elapsed = time.perf_counter() - start
+            print("{:<16} {:>10.1f} ms (startup {:.1f} ms)".format(
+                f"service -j {workers}", elapsed * 1000, startup * 1000))
+            if outputs != expected:
+                diff = [p for p in expected if outputs.get(p) != expected[p]]
+                raise Exception("Error: service output differs: {}".format(diff))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Service benchmarks.')
+    subparsers = arg_parser.add_subparsers(dest='bench', required=True)
+
+    service = subparsers.add_parser('service', help=benchService.__doc__)
+    service.add_argument('--workers', type=int, nargs='+', default=[1, 2])
+    service.set_defaults(func=benchService)
+
+    args = arg_parser.parse_args()
+    args.func(args)
@@ -0,0 +1,435 @@
+SCREEN_WORDS = 8192
+HEAP_BASE = 2048
+HEAP_END = 16379
+
+# VMの関数名 -> (Builtinsのメソッド名, 引数の数)
+FUNCTIONS = {
+    'Math.abs':             ('mathAbs', 1),
+    'Math.multiply':        ('mathMultiply', 2),
+    'Math.divide':          ('mathDivide', 2),
+    'Math.sqrt':            ('mathSqrt', 1),
+    'Math.max':             ('mathMax', 2),
+    'Math.min':             ('mathMin', 2),
+    'Memory.peek':          ('memoryPeek', 1),
+    'Memory.poke':          ('memoryPoke', 2),
+    'Memory.alloc':         ('memoryAlloc', 1),
+    'Memory.deAlloc':       ('memoryDeAlloc', 1),
+    'Array.new':            ('arrayNew', 1),
+    'Array.dispose':        ('arrayDispose', 1),
+    'String.new':           ('stringNew', 1),
+    'String.dispose':       ('stringDispose', 1),
+    'String.length':        ('stringLength', 1),
+    'String.charAt':        ('stringCharAt', 2),
+    'String.setCharAt':     ('stringSetCharAt', 3),
+    'String.appendChar':    ('stringAppendChar', 2),
+    'String.eraseLastChar': ('stringEraseLastChar', 1),
+    'String.intValue':      ('stringIntValue', 1),
+    'String.setInt':        ('stringSetInt', 2),
+    'String.newLine':       ('stringNewLine', 0),
+    'String.backSpace':     ('stringBackSpace', 0),
+    'String.doubleQuote':   ('stringDoubleQuote', 0),
+    'Screen.clearScreen':   ('screenClearScreen', 0),
+    'Screen.setColor':      ('screenSetColor', 1),
+    'Screen.drawPixel':     ('screenDrawPixel', 2),
+    'Screen.drawLine':      ('screenDrawLine', 4),
+    'Screen.drawRectangle': ('screenDrawRectangle', 4),
+    'Screen.drawCircle':    ('screenDrawCircle', 3),
+}
+
+
+def select(names: list) -> set:
+    """
+    関数名またはクラス名のリストを置き換える関数名の集合にする. 空なら全部
+    """
+    if not names:
+        return set(FUNCTIONS)
+    functions = set()
+    for name in names:
+        matched = [f for f in FUNCTIONS if f == name or f.split('.')[0] == name]
+        if not matched:
+            raise Exception("Unknown builtin: {}".format(name))
+        functions.update(matched)
+    return functions
+
+
+def signed(x: int) -> int:
+    x &= 0xffff
+    return x - 0x10000 if x & 0x8000 else x
+
+
+class Builtins():
+    """
+    tools/OSの関数をRAMを直接読み書きするPythonの関数で置き換える
+    結果のRAMはVMの実装を実行した場合と同じになるようにする
+    (ただしスタックのフレームとローカル変数の跡は残らない)
+    Sys.errorになる引数ではNoneを返し, 呼び出し側はVMの実装を実行する
+    """
+
+    def __init__(self, ram: list, statics: dict):
+        self.ram = ram
+        # Mathのstatic 1はdivideが作業に使う配列
+        self.scratch = statics.get('Math.vm.1')
+        # Screenのstatic 1は画面の先頭アドレス, static 2は色
+        self.screen = statics.get('Screen.vm.1')
+        self.color = statics.get('Screen.vm.2')
+
+    def function(self, name: str, num_args: int):
+        """
+        置き換える関数を返す. 置き換えられなければNone
+        """
+        if name not in FUNCTIONS:
+            return None
+        method, arity = FUNCTIONS[name]
+        if arity != num_args:
+            return None
+        if (name == 'Math.divide' or name.startswith('Screen.')) and self.scratch is None:
+            return None
+        if name.startswith('Screen.') and (self.screen is None or self.color is None):
+            return None
+        return getattr(self, method)
+
+    # ---- Math ----
+
+    def mathAbs(self, x: int) -> int:
+        return -x & 0xffff if x & 0x8000 else x
+
+    def mathMultiply(self, x: int, y: int) -> int:
+        return (x * y) & 0xffff
+
+    def mathDivide(self, x: int, y: int):
+        if y == 0 or x == 0x8000 or y == 0x8000:
+            return None
+        x = signed(x)
+        y = signed(y)
+        # VMの実装が作業用の配列に残す |y| * 2^i (|x|を超える最初の値まで) も書き込む
+        ram = self.ram
+        scratch = ram[self.scratch]
+        b = abs(y)
+        ram[scratch] = b
+        for i in range(15):
+            if 32767 - (b - 1) < b - 1:
+                break
+            b += b
+            ram[scratch + i + 1] = b
+            if b - 1 > abs(x) - 1:
+                break
+        q = abs(x) // abs(y)
+        return -q & 0xffff if (x < 0) != (y < 0) else q
+
+    def mathSqrt(self, x: int):
+        if x & 0x8000:
+            return None
+        y = 0
+        for j in range(7, -1, -1):
+            if (y + (1 << j)) ** 2 <= x:
+                y += 1 << j
+        return y
+
+    def mathMax(self, x: int, y: int) -> int:
+        return x if signed(x) > signed(y) else y
+
+    def mathMin(self, x: int, y: int) -> int:
+        return x if signed(x) < signed(y) else y
+
+    # ---- Memory, Array ----
+
+    def memoryPeek(self, address: int) -> int:
+        return self.ram[address]
+
+    def memoryPoke(self, address: int, value: int) -> int:
+        self.ram[address] = value
+        return 0
+
+    def memoryAlloc(self, size: int, journal: list = None):
+        """
+        first-fitで空きセグメントを探す. journalには書き換える前の (番地, 値) を追加する
+        """
+        ram = self.ram
+        if signed(size) < 1:
+            return None
+        seg = HEAP_BASE
+        for _ in range(len(ram)):
+            if signed(ram[seg]) >= signed(size):
+                break
+            seg = ram[seg + 1]
+            if seg >= len(ram) - 1:
+                return None
+        else:
+            return None
+        if signed(seg + size) > HEAP_END:
+            return None
+        if journal is not None:
+            journal += [(a, ram[a]) for a in [seg, seg + 1, seg + size + 2, seg + size + 3]]
+        if signed(ram[seg]) > signed(size + 2):
+            ram[seg + size + 2] = (ram[seg] - size - 2) & 0xffff
+            if ram[seg + 1] == seg + 2:
+                ram[seg + size + 3] = seg + size + 4
+            else:
+                ram[seg + size + 3] = ram[seg + 1]
+            ram[seg + 1] = seg + size + 2
+        ram[seg] = 0
+        return seg + 2
+
+    def memoryDeAlloc(self, o: int) -> int:
+        ram = self.ram
+        seg = (o - 2) & 0xffff
+        nxt = ram[seg + 1]
+        if ram[nxt] == 0:
+            ram[seg] = (nxt - seg - 2) & 0xffff
+        else:
+            ram[seg] = (nxt - seg + ram[nxt]) & 0xffff
+            if ram[nxt + 1] == (nxt + 2) & 0xffff:
+                ram[seg + 1] = seg + 2
+            else:
+                ram[seg + 1] = ram[nxt + 1]
+        return 0
+
+    def arrayNew(self, size: int, journal: list = None):
+        if signed(size) <= 0:
+            return None
+        return self.memoryAlloc(size, journal)
+
+    def arrayDispose(self, this: int) -> int:
+        return self.memoryDeAlloc(this)
+
+    # ---- String: this[0]が最大長, this[1]が文字の配列, this[2]が長さ ----
+
+    def stringNew(self, max_length: int):
+        if signed(max_length) < 0:
+            return None
+        ram = self.ram
+        journal = []
+        this = self.memoryAlloc(3, journal)
+        if this is None:
+            return None
+        if max_length > 0:
+            chars = self.arrayNew(max_length)
+            if chars is None:
+                # VMの実装でやり直すので, 確保したthisを元に戻す
+                for address, value in reversed(journal):
+                    ram[address] = value
+                return None
+            ram[this + 1] = chars
+        ram[this] = max_length
+        ram[this + 2] = 0
+        return this
+
+    def stringDispose(self, this: int) -> int:
+        if signed(self.ram[this]) > 0:
+            self.memoryDeAlloc(self.ram[this + 1])
+        return self.memoryDeAlloc(this)
+
+    def stringLength(self, this: int) -> int:
+        return self.ram[this + 2]
+
+    def stringCharAt(self, this: int, j: int):
+        ram = self.ram
+        if not 0 <= signed(j) < signed(ram[this + 2]):
+            return None
+        return ram[(ram[this + 1] + j) & 0xffff]
+
+    def stringSetCharAt(self, this: int, j: int, c: int):
+        ram = self.ram
+        if not 0 <= signed(j) < signed(ram[this + 2]):
+            return None
+        ram[(ram[this + 1] + j) & 0xffff] = c
+        return 0
+
+    def stringAppendChar(self, this: int, c: int):
+        ram = self.ram
+        length = ram[this + 2]
+        if length == ram[this]:
+            return None
+        ram[(ram[this + 1] + length) & 0xffff] = c
+        ram[this + 2] = (length + 1) & 0xffff
+        return this
+
+    def stringEraseLastChar(self, this: int):
+        ram = self.ram
+        if ram[this + 2] == 0:
+            return None
+        ram[this + 2] = (ram[this + 2] - 1) & 0xffff
+        return 0
+
+    def stringIntValue(self, this: int) -> int:
+        ram = self.ram
+        length = signed(ram[this + 2])
+        if length == 0:
+            return 0
+        chars = ram[this + 1]
+        i = 0
+        negative = ram[chars] == 45
+        if negative:
+            i = 1
+        value = 0
+        while i < length:
+            digit = signed(ram[(chars + i) & 0xffff] - 48)
+            if not 0 <= digit <= 9:
+                break
+            value = (value * 10 + digit) & 0xffff
+            i += 1
+        return -value & 0xffff if negative else value
+
+    def stringSetInt(self, this: int, number: int):
+        ram = self.ram
+        if ram[this] == 0:
+            return None
+        number = signed(number)
+        negative = number < 0
+        if negative:
+            number = signed(-number)
+        if signed(ram[this]) < (len(str(number)) if number > 0 else 0) + negative:
+            return None
+        digits = []
+        while number > 0:
+            # Math.divideの作業用の配列もVMの実装と同じく書き換える
+            q = self.mathDivide(number, 10)
+            digits.append(48 + number - q * 10)
+            number = q
+        if negative:
+            digits.append(45)
+        # VMの実装と同じく作業用の配列を確保して解放する (配列の中身はヒープに残る)
+        buf = self.arrayNew(6)
+        if buf is None:
+            return None
+        for i, c in enumerate(digits):
+            ram[buf + i] = c
+        chars = ram[this + 1]
+        if not digits:
+            ram[chars] = 48
+            ram[this + 2] = 1
+        else:
+            for i, c in enumerate(reversed(digits)):
+                ram[(chars + i) & 0xffff] = c
+            ram[this + 2] = len(digits)
+        self.memoryDeAlloc(buf)
+        return 0
+
+    def stringNewLine(self) -> int:
+        return 128
+
+    def stringBackSpace(self) -> int:
+        return 129
+
+    def stringDoubleQuote(self) -> int:
+        return 34
+
+    # ---- Screen: 画面の番地はstatic 1からの相対位置 ----
+
+    def update(self, address: int, mask: int):
+        ram = self.ram
+        address = (ram[self.screen] + address) & 0xffff
+        if ram[self.color]:
+            ram[address] |= mask
+        else:
+            ram[address] &= mask ^ 0xffff
+
+    def column(self, x: int) -> int:
+        """
+        0 <= x <= 511の語の位置. VMの実装と同じくMath.divideの作業用の配列も書き換える
+        """
+        return self.mathDivide(x, 16)
+
+    def drawRow(self, y: int, x1: int, x2: int):
+        """
+        0 <= x1 <= x2 <= 511の横線. VMの実装と同じく語単位でマスクを書き込む
+        """
+        left = self.column(x1)
+        right = self.column(x2)
+        left_mask = ((1 << (x1 % 16)) - 1) ^ 0xffff
+        right_mask = ((1 << (x2 % 16 + 1)) - 1) & 0xffff
+        address = y * 32 + left
+        if left == right:
+            self.update(address, left_mask & right_mask)
+            return
+        self.update(address, left_mask)
+        for a in range(address + 1, address + right - left):
+            self.update(a, 0xffff)
+        self.update(address + right - left, right_mask)
+
+    def screenClearScreen(self) -> int:
+        base = self.ram[self.screen]
+        self.ram[base:base + SCREEN_WORDS] = [0] * SCREEN_WORDS
+        return 0
+
+    def screenSetColor(self, color: int) -> int:
+        self.ram[self.color] = color
+        return 0
+
+    def screenDrawPixel(self, x: int, y: int):
+        if x > 511 or y > 255:
+            return None
+        self.update(y * 32 + self.column(x), 1 << (x % 16))
+        return 0
+
+    def screenDrawLine(self, x1: int, y1: int, x2: int, y2: int):
+        x1, y1, x2, y2 = signed(x1), signed(y1), signed(x2), signed(y2)
+        if x1 < 0 or x2 > 511 or y1 < 0 or y2 > 255:
+            return None
+        dx = signed(abs(signed(x2 - x1)))
+        dy = signed(abs(signed(y2 - y1)))
+        steep = dx < dy
+        if steep and y2 < y1 or not steep and x2 < x1:
+            x1, y1, x2, y2 = x2, y2, x1, y1
+        if steep:
+            dx, dy = dy, dx
+            a, b, end, down = y1, x1, y2, x1 > x2
+        else:
+            a, b, end, down = x1, y1, x2, y1 > y2
+        error = signed(2 * dy - dx)
+        inc_error = signed(2 * dy)
+        inc_both = signed(2 * (dy - dx))
+        # 途中の点が画面外ならdrawPixelがエラーになるので, 書き込む前に全部の点を求める
+        points = [(a, b)]
+        while a < end:
+            if error < 0:
+                error = signed(error + inc_error)
+            else:
+                error = signed(error + inc_both)
+                b += -1 if down else 1
+            a += 1
+            points.append((a, b))
+        if steep:
+            points = [(b, a) for a, b in points]
+        if any(not (0 <= x <= 511 and 0 <= y <= 255) for x, y in points):
+            return None
+        for x, y in points:
+            self.update(y * 32 + self.column(x), 1 << (x % 16))
+        return 0
+
+    def screenDrawRectangle(self, x1: int, y1: int, x2: int, y2: int):
+        x1, y1, x2, y2 = signed(x1), signed(y1), signed(x2), signed(y2)
+        if x1 > x2 or y1 > y2 or x1 < 0 or x2 > 511 or y1 < 0 or y2 > 255:
+            return None
+        for y in range(y1, y2 + 1):
+            self.drawRow(y, x1, x2)
+        return 0
+
+    def drawHorizontal(self, y: int, x1: int, x2: int):
+        lo = min(x1, x2)
+        hi = max(x1, x2)
+        if -1 < y < 256 and lo < 512 and hi > -1:
+            self.drawRow(y, max(lo, 0), min(hi, 511))
+
+    def screenDrawCircle(self, x: int, y: int, r: int):
+        x, y, r = signed(x), signed(y), signed(r)
+        if x < 0 or x > 511 or y < 0 or y > 255:
+            return None
+        if x - r < 0 or x + r > 511 or y - r < 0 or y + r > 255:
+            return None
+        a = 0
+        b = r
+        d = 1 - r
+        while True:
+            self.drawHorizontal(y - b, x + a, x - a)
+            self.drawHorizontal(y + b, x + a, x - a)
+            self.drawHorizontal(y - a, x - b, x + b)
+            self.drawHorizontal(y + a, x - b, x + b)
+            if not b > a:
+                return 0
+            if d < 0:
+                d += 2 * a + 3
+            else:
+                d += 2 * (a - b) + 5
+                b -= 1
+            a += 1
@@ -0,0 +1,361 @@
+import Builtins
+import argparse
+import glob
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'VMtranslator'))
+import Parser  # noqa: E402
+from CommandType import CommandType  # noqa: E402
+
+RAM_SIZE = 32768
+STATIC_BASE = 16
+OS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'tools', 'OS')
+
+
+class Halt(Exception):
+    """
+    自分自身へのgotoかSys.haltに到達した
+    """
+    pass
+
+
+def programFiles(path: str, os_dir: str = None) -> list:
+    """
+    プログラムの.vmファイルのリストを返す (VMtranslatorと同じ順序)
+    os_dirを指定した場合, プログラムにないクラスをos_dirから追加する
+    """
+    if os.path.isfile(path):
+        files = [path]
+    else:
+        files = glob.glob(f"{path.rstrip('/')}/*.vm")
+    if os_dir is not None:
+        classes = {os.path.basename(f) for f in files}
+        files += [f for f in sorted(glob.glob(f"{os_dir}/*.vm"))
+                  if os.path.basename(f) not in classes]
+    return files
+
+
+class VMEmulator():
+    """
+    .vmファイルを直接実行するインタプリタ
+    ロード時にラベル, 関数アドレス, staticのアドレスを解決し,
+    各コマンドを引数を束縛したクロージャ (次のコマンドの位置を返す) にする
+    """
+
+    def __init__(self, files: list, bootstrap: bool = True, builtins=()):
+        self.ram = [0] * RAM_SIZE
+        self.commands = []   # (filename, line, cmd_type, arg1, arg2, function)
+        self.labels = {}     # function$label / 関数名 -> コマンドの位置
+        self.statics = {}    # filename.index -> アドレス
+        self.halts = []      # 停止とみなすコマンドのアセンブリ上のラベル
+        self.steps = 0
+        for f in files:
+            self.load(f)
+        # callをPythonの実装で置き換える関数の名前 (Builtins.select)
+        self.builtins = set(builtins)
+        self.natives = Builtins.Builtins(self.ram, self.statics)
+        self.ops = [self.compile(i, c) for i, c in enumerate(self.commands)]
+
+        if bootstrap:
+            # CodeWriter.writeInitと同じ: SP=256, call Sys.init 0
+            self.ram[0] = 256
+            self.pc = len(self.ops)
+            self.ops.append(self.opCall(self.labels['Sys.init'], 0, self.pc + 1))
+            self.ops.append(opHalt)
+        else:
+            self.pc = 0
+
+    def load(self, filename: str):
+        """
+        1ファイル分のコマンドを読み込み, ラベル/関数の位置とstaticを登録
+        """
+        basename = os.path.basename(filename)
+        parser = Parser.Parser(filename)
+        function = None
+        while parser.advance():
+            cmd_type = parser.commandType()
+            if cmd_type is None:
+                raise Exception("Parser Error: command: {}".format(parser.command))
+            arg1 = parser.arg1() if cmd_type != CommandType.C_RETURN else None
+            arg2 = parser.arg2() if cmd_type in [
+                CommandType.C_PUSH, CommandType.C_POP,
+                CommandType.C_FUNCTION, CommandType.C_CALL] else None
+            if cmd_type == CommandType.C_FUNCTION:
+                function = arg1
+                self.labels[function] = len(self.commands)
+            elif cmd_type == CommandType.C_LABEL:
+                self.labels[f"{function}${arg1}"] = len(self.commands)
+            elif cmd_type in [CommandType.C_PUSH, CommandType.C_POP] and arg1 == 'static':
+                # アセンブラと同じく初出順にアドレスを割り当てる
+                symbol = f"{basename}.{arg2}"
+                if symbol not in self.statics:
+                    self.statics[symbol] = STATIC_BASE + len(self.statics)
+            self.commands.append(
+                (basename, parser.line, cmd_type, arg1, arg2, function))
+
+    def compile(self, index: int, command: tuple):
+        filename, line, cmd_type, arg1, arg2, function = command
+        nxt = index + 1
+        if cmd_type == CommandType.C_ARITHMETIC:
+            return ARITHMETIC_OPS[arg1](self.ram, nxt)
+        elif cmd_type == CommandType.C_PUSH:
+            return self.opPush(arg1, arg2, filename, nxt)
+        elif cmd_type == CommandType.C_POP:
+            return self.opPop(arg1, arg2, filename, nxt)
+        elif cmd_type == CommandType.C_LABEL:
+            return lambda: nxt
+        elif cmd_type == CommandType.C_GOTO:
+            target = self.resolveLabel(function, arg1)
+            if target == index - 1:
+                # label X; goto X
+                self.halts.append(f"{function}${arg1}")
+                return opHalt
+            return lambda: target
+        elif cmd_type == CommandType.C_IF:
+            return opIf(self.ram, self.resolveLabel(function, arg1), nxt)
+        elif cmd_type == CommandType.C_FUNCTION:
+            if arg1 == 'Sys.halt':
+                self.halts.append(arg1)
+                return opHalt
+            return opFunction(self.ram, arg2, nxt)
+        elif cmd_type == CommandType.C_CALL:
+            if arg1 not in self.labels:
+                call = opUndefined("Undefined function: {} ({}: line {})".format(
+                    arg1, filename, line))
+            else:
+                call = self.opCall(self.labels[arg1], arg2, nxt)
+            native = self.natives.function(arg1, arg2) if arg1 in self.builtins else None
+            if native is not None:
+                return self.opNative(native, arg2, call, nxt)
+            return call
+        elif cmd_type == CommandType.C_RETURN:
+            return opReturn(self.ram)
+        raise Exception("Unsupported command: {} ({}: line {})".format(
+            cmd_type, filename, line))
+
+    def resolveLabel(self, function: str, label: str) -> int:
+        key = f"{function}${label}"
+        if key not in self.labels:
+            raise Exception("Undefined label: {}".format(key))
+        return self.labels[key]
+
+    def segmentAddress(self, segment: str, index: int, filename: str):
+        """
+        固定アドレスのセグメントはそのアドレス, 可変のものは基底ポインタの番地を返す
+        """
+        if segment == 'static':
+            return self.statics[f"{filename}.{index}"], None
+        elif segment == 'temp':
+            return 5 + index, None
+        elif segment == 'pointer':
+            return 3 + index, None
+        return None, SEGMENT_POINTERS[segment]
+
+    def opPush(self, segment: str, index: int, filename: str, nxt: int):
+        ram = self.ram
+        if segment == 'constant':
+            value = index & 0xffff
+
+            def op():
+                sp = ram[0]
+                ram[sp] = value
+                ram[0] = sp + 1
+                return nxt
+            return op
+        address, pointer = self.segmentAddress(segment, index, filename)
+        if address is not None:
+            def op():
+                sp = ram[0]
+                ram[sp] = ram[address]
+                ram[0] = sp + 1
+                return nxt
+        else:
+            def op():
+                sp = ram[0]
+                ram[sp] = ram[ram[pointer] + index]
+                ram[0] = sp + 1
+                return nxt
+        return op
+
+    def opPop(self, segment: str, index: int, filename: str, nxt: int):
+        ram = self.ram
+        address, pointer = self.segmentAddress(segment, index, filename)
+        if address is not None:
+            def op():
+                sp = ram[0] - 1
+                ram[address] = ram[sp]
+                ram[0] = sp
+                return nxt
+        else:
+            def op():
+                sp = ram[0] - 1
+                ram[ram[pointer] + index] = ram[sp]
+                ram[0] = sp
+                return nxt
+        return op
+
+    def opCall(self, target: int, num_args: int, nxt: int):
+        ram = self.ram
+
+        def op():
+            sp = ram[0]
+            ram[sp] = nxt
+            ram[sp + 1] = ram[1]
+            ram[sp + 2] = ram[2]
+            ram[sp + 3] = ram[3]
+            ram[sp + 4] = ram[4]
+            ram[2] = sp - num_args
+            ram[1] = ram[0] = sp + 5
+            return target
+        return op
+
+    def opNative(self, native, num_args: int, call, nxt: int):
+        """
+        引数を取り除いて戻り値を積む (1コマンドとして数える)
+        nativeがNoneを返したらcallでVMの実装を呼び出す
+        """
+        ram = self.ram
+
+        def op():
+            sp = ram[0] - num_args
+            value = native(*ram[sp:sp + num_args])
+            if value is None:
+                return call()
+            ram[sp] = value
+            ram[0] = sp + 1
+            return nxt
+        return op
+
+    def run(self, steps: int) -> bool:
+        """
+        最大stepsコマンドを実行する. 停止したらTrueを返す
+        """
+        ops = self.ops
+        pc = self.pc
+        i = -1
+        try:
+            for i in range(steps):
+                pc = ops[pc]()
+        except Halt:
+            self.steps += i
+            return True
+        finally:
+            self.pc = pc
+        self.steps += i + 1
+        return False
+
+
+SEGMENT_POINTERS = {
+    'local':    1,
+    'argument': 2,
+    'this':     3,
+    'that':     4,
+}
+
+
+def opHalt():
+    raise Halt()
+
+
+def opUndefined(message: str):
+    """
+    実行された時点でエラーにする (リンクされていない関数の呼び出しなど)
+    """
+    def op():
+        raise Exception(message)
+    return op
+
+
+def opIf(ram: list, target: int, nxt: int):
+    def op():
+        sp = ram[0] - 1
+        ram[0] = sp
+        return target if ram[sp] else nxt
+    return op
+
+
+def opFunction(ram: list, num_locals: int, nxt: int):
+    zeros = [0] * num_locals
+
+    def op():
+        sp = ram[0]
+        ram[sp:sp + num_locals] = zeros
+        ram[0] = sp + num_locals
+        return nxt
+    return op
+
+
+def opReturn(ram: list):
+    def op():
+        frame = ram[1]
+        ret = ram[frame - 5]
+        arg = ram[2]
+        ram[arg] = ram[ram[0] - 1]
+        ram[0] = arg + 1
+        ram[4] = ram[frame - 1]
+        ram[3] = ram[frame - 2]
+        ram[2] = ram[frame - 3]
+        ram[1] = ram[frame - 4]
+        return ret
+    return op
+
+
+def binaryOp(func):
+    """
+    スタックの上2つ (x, y) をfunc(x, y)で置き換えるコマンド
+    """
+    def factory(ram: list, nxt: int):
+        def op():
+            sp = ram[0] - 1
+            ram[sp - 1] = func(ram[sp - 1], ram[sp])
+            ram[0] = sp
+            return nxt
+        return op
+    return factory
+
+
+def unaryOp(func):
+    def factory(ram: list, nxt: int):
+        def op():
+            sp = ram[0] - 1
+            ram[sp] = func(ram[sp])
+            return nxt
+        return op
+    return factory
+
+
+# 比較は符号付き. 0x8000とのXORで符号なしの大小関係に写す
+ARITHMETIC_OPS = {
+    'add': binaryOp(lambda x, y: (x + y) & 0xffff),
+    'sub': binaryOp(lambda x, y: (x - y) & 0xffff),
+    'and': binaryOp(lambda x, y: x & y),
+    'or':  binaryOp(lambda x, y: x | y),
+    'eq':  binaryOp(lambda x, y: 0xffff if x == y else 0),
+    'gt':  binaryOp(lambda x, y: 0xffff if (x ^ 0x8000) > (y ^ 0x8000) else 0),
+    'lt':  binaryOp(lambda x, y: 0xffff if (x ^ 0x8000) < (y ^ 0x8000) else 0),
+    'neg': unaryOp(lambda x: -x & 0xffff),
+    'not': unaryOp(lambda x: x ^ 0xffff),
+}
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Run VM file or directory.')
+    arg_parser.add_argument('path', type=str, help='vm file or directory')
+    arg_parser.add_argument('--os', action='store_true',
+                            help='link classes missing from path with tools/OS')
+    arg_parser.add_argument('--no-bootstrap', action='store_true',
+                            help='start at the first command instead of calling Sys.init')
+    arg_parser.add_argument('--builtins', type=str, nargs='*', default=None,
+                            metavar='NAME',
+                            help='run these OS functions or classes (all if none given) in Python')
+    arg_parser.add_argument('--steps', type=int, default=10000000,
+                            help='maximum number of VM commands to execute')
+    args = arg_parser.parse_args()
+
+    builtins = Builtins.select(args.builtins) if args.builtins is not None else ()
+    emulator = VMEmulator(programFiles(args.path, OS_DIR if args.os else None),
+                          bootstrap=not args.no_bootstrap, builtins=builtins)
+    halted = emulator.run(args.steps)
+    print("{} after {} steps: SP={} LCL={} ARG={} THIS={} THAT={}".format(
+        'halted' if halted else 'stopped', emulator.steps, *emulator.ram[0:5]))
@@ -0,0 +1,248 @@
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+ASSEMBLER_DIR = os.path.join(PROJECT_DIR, '06', 'assember')
+VMTRANSLATOR_DIR = os.path.join(PROJECT_DIR, '08', 'VMtranslator')
+JACK_COMPILER_DIR = os.path.join(PROJECT_DIR, '11', 'JackCompiler')
+FUNCTION_CALLS = [
+    os.path.join(PROJECT_DIR, '08', 'FunctionCalls', name)
+    for name in ['FibonacciElement', 'NestedCall', 'StaticsTest']
+]
+
+sys.path.append(os.path.join(PROJECT_DIR, '05', 'CPUEmulator'))
+import HackCPU  # noqa: E402
+import VMEmulator  # noqa: E402
+import Builtins  # noqa: E402
+# VMEmulatorが08/VMtranslatorをsys.pathに追加している
+import ModuleLoader  # noqa: E402
+
+# 06/assemberと08/VMtranslatorはどちらもParserモジュールを持つので, Assemblerは別名で読み込む
+Assembler = ModuleLoader.load(ASSEMBLER_DIR, 'Assembler')
+
+# (プログラム, 終了条件): Pongはキー入力を待ち続けるので,
+# Keyboard.keyPressedをFRAMES回呼んだところ (ボールがFRAMES回動いたところ) で止める
+FRAMES = 200
+BUILTIN_PROGRAMS = [
+    (os.path.join(PROJECT_DIR, '11', 'Pong'), 'Keyboard.keyPressed'),
+    (os.path.join(PROJECT_DIR, '11', 'ComplexArrays'), None),
+    (os.path.join(PROJECT_DIR, '12', 'MathTest'), None),
+]
+
+# OS全体を通る計算量の多いプログラム
+OS_MAIN_VM = """function Main.main 1
+push constant 0
+pop local 0
+label LOOP
+push local 0
+push constant 300
+lt
+not
+if-goto END
+push local 0
+push constant 123
+call Math.multiply 2
+push constant 7
+call Math.divide 2
+pop static 0
+push local 0
+push constant 1
+add
+pop local 0
+goto LOOP
+label END
+push constant 0
+return
+"""
+
+
+def prepare(program_dir: str, tmp: str, with_os: bool) -> str:
+    """
+    プログラム (とOS) の.vmをtmpにまとめたディレクトリを返す
+    """
+    dst_dir = os.path.join(tmp, os.path.basename(os.path.normpath(program_dir)))
+    os.makedirs(dst_dir)
+    files = VMEmulator.programFiles(program_dir, VMEmulator.OS_DIR if with_os else None)
+    for f in files:
+        shutil.copy(f, dst_dir)
+    return dst_dir
+
+
+def prepareJack(program_dir: str, tmp: str) -> str:
+    """
+    .jackをtmpにコピーしてJackCompilerで.vmにし, OSと合わせたディレクトリを返す
+    """
+    src_dir = os.path.join(tmp, 'src', os.path.basename(os.path.normpath(program_dir)))
+    os.makedirs(src_dir)
+    for f in glob.glob(os.path.join(program_dir, '*.jack')):
+        shutil.copy(f, src_dir)
+    subprocess.run([sys.executable, 'JackCompiler.py', src_dir],
+                   cwd=JACK_COMPILER_DIR, check=True)
+    return prepare(src_dir, tmp, True)
+
+
+def stopAt(emulator: VMEmulator.VMEmulator, function: str, count: int):
+    """
+    functionにcount回入ったところで停止させる
+    """
+    index = emulator.labels[function]
+    op = emulator.ops[index]
+    remaining = [count]
+
+    def stop():
+        remaining[0] -= 1
+        if remaining[0] < 0:
+            raise VMEmulator.Halt()
+        return op()
+    emulator.ops[index] = stop
+
+
+def runBuiltins(vm_dir: str, stop: str, builtins: set, steps: int):
+    start = time.perf_counter()
+    emulator = VMEmulator.VMEmulator(VMEmulator.programFiles(vm_dir), builtins=builtins)
+    if stop is not None:
+        stopAt(emulator, stop, FRAMES)
+    if not emulator.run(steps):
+        raise Exception("Error: VM program did not halt")
+    return emulator, time.perf_counter() - start
+
+
+def compareHeap(expected, ram) -> list:
+    """
+    static変数, ヒープ, 画面のうち値が異なる番地を返す
+    (スタックにはOSの関数のフレームの跡が残らないので比べない)
+    """
+    addresses = list(range(16, 256)) + list(range(2048, 24577))
+    return [a for a in addresses if expected[a] != ram[a]]
+
+
+def benchBuiltins(args):
+    """
+    OSの関数をPythonの実装で置き換えた場合の実行コマンド数と時間をクラスごとに比較
+    """
+    selections = [(name, Builtins.select([name])) for name in args.builtins or
+                  sorted({f.split('.')[0] for f in Builtins.FUNCTIONS})]
+    selections.append(('all', Builtins.select(args.builtins)))
+    with tempfile.TemporaryDirectory() as tmp:
+        for program_dir, stop in BUILTIN_PROGRAMS:
+            vm_dir = prepareJack(program_dir, tmp)
+            print(os.path.basename(vm_dir))
+            expected, elapsed = runBuiltins(vm_dir, stop, set(), args.steps)
+            print("{:<8} {:>10} steps  {:>10.1f} ms".format(
+                'vm', expected.steps, elapsed * 1000))
+            for name, builtins in selections:
+                emulator, elapsed = runBuiltins(vm_dir, stop, builtins, args.steps)
+                print("{:<8} {:>10} steps  {:>10.1f} ms".format(
+                    name, emulator.steps, elapsed * 1000))
+                diff = compareHeap(expected.ram, emulator.ram)
+                if diff:
+                    raise Exception("Error: RAM mismatch at {}".format(diff[:10]))
+
+
+def runHack(words, halts: list, cycles: int) -> HackCPU.HackCPU:
+    """
+    停止ループのラベルに到達するまでHackCPUを実行
+    """
+    cpu = HackCPU.HackCPU(words)
+    if not cpu.run(cycles, set(halts)):
+        raise Exception("Error: Hack program did not halt")
+    return cpu
+
+
+def activeFrameSlots(ram) -> set:
+    """
+    LCLをたどって実行中のフレームのリターンアドレスの位置を返す
+    (VMとHackでリターンアドレスの値は異なる)
+    """
+    slots = set()
+    lcl = ram[1]
+    while lcl >= 261:
+        slots.add(lcl - 5)
+        lcl = ram[lcl - 4]
+    return slots
+
+
+def compareRAM(vm_ram, hack_ram) -> list:
+    """
+    VMとHackで一致するべきRAMの番地のうち, 値が異なるものを返す
+    R13-R15はVMtranslatorの作業用なので除く
+    """
+    addresses = list(range(0, 13)) + list(range(16, 256)) + list(range(2048, 24577))
+    skip = activeFrameSlots(vm_ram)
+    addresses += [a for a in range(256, vm_ram[0]) if a not in skip]
+    return [a for a in addresses if vm_ram[a] != hack_ram[a]]
+
+
+def benchOracle(args):
+    """
+    VMインタプリタと変換+アセンブル+HackCPUの実行時間と最終状態を比較
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        os_main = os.path.join(tmp, 'src', 'OSMain')
+        os.makedirs(os_main)
+        with open(os.path.join(os_main, 'Main.vm'), 'w') as f:
+            f.write(OS_MAIN_VM)
+        programs = [(d, False) for d in FUNCTION_CALLS] + [(os_main, True)]
+
+        for program_dir, with_os in programs:
+            vm_dir = prepare(program_dir, tmp, with_os)
+            print(os.path.basename(vm_dir))
+
+            start = time.perf_counter()
+            emulator = VMEmulator.VMEmulator(VMEmulator.programFiles(vm_dir))
+            if not emulator.run(args.steps):
+                raise Exception("Error: VM program did not halt")
+            elapsed = time.perf_counter() - start
+            print("{:<8} {:>10} steps  {:>10.1f} ms".format(
+                'vm', emulator.steps, elapsed * 1000))
+
+            subprocess.run([sys.executable, 'VMtranslator.py', vm_dir] + args.translate,
+                           cwd=VMTRANSLATOR_DIR, check=True)
+            symbol_table = Assembler.SymbolTable.SymbolTable()
+            words = Assembler.assembleSinglePass(vm_dir + '.asm', symbol_table)
+            if len(words) > HackCPU.ROM_SIZE:
+                print("{:<8} {:>10} words: does not fit in ROM".format('hack', len(words)))
+                continue
+            start = time.perf_counter()
+            halts = [symbol_table.getAddress(l) for l in emulator.halts]
+            cpu = runHack(words, halts, args.cycles)
+            elapsed = time.perf_counter() - start
+            print("{:<8} {:>10} cycles {:>10.1f} ms".format(
+                'hack', cpu.cycles, elapsed * 1000))
+
+            diff = compareRAM(emulator.ram, cpu.ram)
+            if diff:
+                raise Exception("Error: RAM mismatch at {}".format(diff[:10]))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='VM emulator benchmarks.')
+    subparsers = arg_parser.add_subparsers(dest='bench', required=True)
+
+    oracle = subparsers.add_parser('oracle', help=benchOracle.__doc__)
+    oracle.add_argument('--steps', type=int, default=100000000)
+    oracle.add_argument('--cycles', type=int, default=1000000000)
+    oracle.add_argument('--optimize', dest='translate', action='append_const',
+                        const='--optimize', default=[], help='pass --optimize to VMtranslator')
+    oracle.add_argument('--trampoline', dest='translate', action='append_const',
+                        const='--trampoline', help='pass --trampoline to VMtranslator')
+    oracle.add_argument('--fold', dest='translate', action='append_const',
+                        const='--fold', help='pass --fold to VMtranslator')
+    oracle.add_argument('--link', dest='translate', action='append_const',
+                        const='--link', help='pass --link to VMtranslator')
+    oracle.set_defaults(func=benchOracle)
+
+    builtins = subparsers.add_parser('builtins', help=benchBuiltins.__doc__)
+    builtins.add_argument('builtins', type=str, nargs='*',
+                          help='OS functions or classes to compare (all classes if none given)')
+    builtins.add_argument('--steps', type=int, default=100000000)
+    builtins.set_defaults(func=benchBuiltins)
+
+    args = arg_parser.parse_args()
+    args.func(args)
@@ -1,4 +1,5 @@
 from CommandType import CommandType
+from PeepholeOptimizer import PeepholeOptimizer
 
 
 class CodeWriter():
@@ -23,28 +24,68 @@ class CodeWriter():
         'pointer':  '3',
     }
 
-    ENTRY_POINT = "Sys.init"
+    # compに直接書ける定数
+    constant_comps = {
+        0:      '0',
+        1:      '1',
+        0xffff: '-1',
+    }
 
-    def __init__(self, filename: str):
-        self.dst_file = open(filename, "w")
+    # 比較のjumpの真偽を反対にしたもの (比較の後のnotをjumpに含める)
+    negated_jumps = {
+        'JEQ': 'JNE',
+        'JGT': 'JLE',
+        'JLT': 'JGE',
+    }
+
+    ENTRY_POINT = "Sys.init"
+    # trampoline指定時にcall/returnが共有するサブルーチン
+    CALL_ROUTINE = "$$CALL"
+    RETURN_ROUTINE = "$$RETURN"
+    # ブートストラップなしで共有サブルーチンを出力する時に, その後ろに置くラベル
+    PROGRAM_START = "$$START"
+
+    def __init__(self, filename, optimize: bool = False, trampoline: bool = False,
+                 init: bool = True, fold: bool = False, fuse: bool = False,
+                 bootstrap: bool = True):
+        """
+        filenameにはファイル名か書き込み可能なファイルオブジェクトを渡す
+        writeLinesを持つオブジェクト (StreamAssemblerなど) には命令を行のリストのまま渡す
+        initがFalseの場合はブートストラップを出力しない (並列変換のワーカー用)
+        bootstrapがFalseの場合はSPの設定とSys.initの呼び出しを出力しない (07/08のSys.initのないテスト用)
+        foldがTrueの場合, VMtranslatorはコマンドをVMOptimizerを通して出力する
+        fuseがTrueの場合, VMtranslatorは比較 (とnot) に続くif-gotoを1つの条件ジャンプにする
+        """
+        self.dst_file = open(filename, "w") if isinstance(filename, str) else filename
+        if hasattr(self.dst_file, 'writeLines'):
+            self.writeLines = self.dst_file.writeLines
+        # 最適化する場合はVMファイル1つ分の出力を溜めてから書き込む
+        self.codes = [] if optimize else None
+        self.trampoline = trampoline
+        self.fold = fold
+        self.fuse = fuse
         self.filename = None
         self.label_count = 0
         self.return_label_count = 0
         self.function_name = None
 
-        self.writeInit()
+        if init:
+            self.writeInit(bootstrap)
 
     def __enter__(self):
         return self
 
     def __exit__(self, ex_type, ex_value, trace):
-        self.dst_file.close()
+        self.close()
 
     def setFileName(self, fileName: str):
         """
         CodeWriterモジュールに新しいVMファイルの変換が開始したことを知らせる
         """
+        self.flush()
         self.filename = fileName
+        # ファイルをまたいで関数名を引き継がない (ファイル単位で変換できるように)
+        self.function_name = None
 
     def writeArithmetic(self, command: str):
         """
@@ -75,52 +116,86 @@ class CodeWriter():
                                     CommandType.C_PUSH else 'pop', s=segment, i=index)
         ])
         if command == CommandType.C_PUSH:
-            if segment == 'constant':
-                self.writeCode([
-                    f"@{index}",
-                    "D=A",
-                ])
-                self.writePushFromD()
-            elif segment in ['local', 'argument', 'this', 'that']:
-                self.writePushFromVirtualSegment(segment, index)
-            elif segment in ['temp', 'pointer']:
-                self.writePushFromStaticSegment(segment, index)
-            elif segment == 'static':
-                self.writeCode([
-                    '@{filename}.{index}'.format(
-                        filename=self.filename, index=index),
-                    'D=M'
-                ])
-                self.writePushFromD()
+            self.writeLoadSegment(segment, index)
+            self.writePushFromD()
         elif command == CommandType.C_POP:
-            if segment in ['local', 'argument', 'this', 'that']:
-                self.writePopToVritualSegment(segment, index)
-            elif segment in ['temp', 'pointer']:
-                self.writePopToStaticSegment(segment, index)
-            elif segment == 'static':
-                self.writePopToM()
-                self.writeCode([
-                    'D=M',
-                    '@{filename}.{index}'.format(
-                        filename=self.filename, index=index),
-                    'M=D',
-                ])
+            self.writePopToM()
+            self.writeCode([
+                'D=M'
+            ])
+            self.writeStoreSegment(segment, index)
         else:
             raise Exception("Unsupport command: {}".format(command))
 
+    def writeCommand(self, command):
+        """
+        Parser.Commandを種類に応じて出力
+        """
+        cmd_type = command.type
+        if cmd_type == CommandType.C_ARITHMETIC:
+            self.writeArithmetic(command.arg1)
+        elif cmd_type in [CommandType.C_PUSH, CommandType.C_POP]:
+            self.writePushPop(cmd_type, command.arg1, command.arg2)
+        elif cmd_type == CommandType.C_LABEL:
+            self.writeLabel(command.arg1)
+        elif cmd_type == CommandType.C_GOTO:
+            self.writeGoto(command.arg1)
+        elif cmd_type == CommandType.C_IF:
+            self.writeIf(command.arg1)
+        elif cmd_type == CommandType.C_FUNCTION:
+            self.writeFunction(command.arg1, command.arg2)
+        elif cmd_type == CommandType.C_CALL:
+            self.writeCall(command.arg1, command.arg2)
+        elif cmd_type == CommandType.C_RETURN:
+            self.writeReturn()
+        else:
+            raise Exception("Unsupport command: {}".format(cmd_type))
+
+    def flush(self):
+        """
+        溜めている出力を最適化して書き込む
+        最適化はVMファイルごとに行うので, 並列に変換しても結果は同じになる
+        """
+        if self.codes:
+            self.writeLines(PeepholeOptimizer().optimize(self.codes))
+            self.codes = []
+
+    def write(self, text: str):
+        """
+        別のCodeWriterが出力したアセンブリをそのまま書き込む
+        """
+        self.flush()
+        self.dst_file.write(text)
+
     def close(self):
         """
         出力ファイルを閉じる
         """
+        self.flush()
+        self.codes = None
         self.dst_file.close()
 
-    def writeInit(self):
+    def writeInit(self, bootstrap: bool = True):
         """
         VMの初期化コードを出力
         出力ファイルの先頭に配置される
+        bootstrapがFalseなら, 共有サブルーチンだけを (先頭から飛び越して) 出力する
         """
-        self.writeSetSP(256)
-        self.writeCall(self.ENTRY_POINT, 0)
+        if bootstrap:
+            self.writeSetSP(256)
+            self.writeCall(self.ENTRY_POINT, 0)
+        if self.trampoline:
+            if not bootstrap:
+                self.writeCode([
+                    f"@{self.PROGRAM_START}",
+                    '0;JMP'
+                ])
+            self.writeCallRoutine()
+            self.writeReturnRoutine()
+            if not bootstrap:
+                self.writeCode([
+                    f"({self.PROGRAM_START})"
+                ])
 
     def writeLabel(self, label: str):
         """
@@ -145,16 +220,69 @@ class CodeWriter():
         """
         self.writePopToM()
         self.writeCode([
-            'D=M',
+            'D=M'
+        ])
+        self.writeIfD(label)
+
+    def writeIfD(self, label: str):
+        """
+        Dが0でなければlabelへジャンプ
+        """
+        self.writeCode([
             f"@{self.function_name}${label}",
             'D;JNE'
         ])
 
+    def writeCompareIf(self, command: str, label: str, negate: bool = False):
+        """
+        比較コマンドとそれに続くif-gotoを, 真偽値をスタックに積まずに出力する
+        negateがTrueなら比較とif-gotoの間にnotがある
+        """
+        self.writePopToM()
+        self.writeCode([
+            'D=M'
+        ])
+        self.writePopToM()
+        self.writeCode([
+            'D=M-D'
+        ])
+        self.writeCompareIfD(command, label, negate)
+
+    def writeCompareIfD(self, command: str, label: str, negate: bool = False):
+        """
+        D (= x - y) の比較結果が真 (negateなら偽) ならlabelへジャンプ
+        """
+        jump = self.arithmetic_commands[command]
+        if negate:
+            jump = self.negated_jumps[jump]
+        self.writeCode([
+            f"@{self.function_name}${label}",
+            f"D;{jump}"
+        ])
+
     def writeCall(self, functionName: str, numArgs: int = 0):
         """
         callコマンドを出力
         """
         return_label = self.getReturnLabel()
+        if self.trampoline:
+            # R13: ARGのSPからの距離, R14: 呼び出し先, D: リターンアドレス
+            self.writeCode([
+                '@{}'.format(5 + numArgs),
+                'D=A',
+                '@R13',
+                'M=D',
+                f"@{functionName}",
+                'D=A',
+                '@R14',
+                'M=D',
+                f"@{return_label}",
+                'D=A',
+                f"@{self.CALL_ROUTINE}",
+                '0;JMP',
+                f"({return_label})"
+            ])
+            return
         self.writeCode([
             f"@{return_label}",
             'D=A'
@@ -185,10 +313,65 @@ class CodeWriter():
             f"({return_label})"
         ])
 
+    def writeCallRoutine(self):
+        """
+        共有のcallサブルーチンを出力
+        """
+        self.writeCode([
+            f"({self.CALL_ROUTINE})",
+            '//    push return-address',
+            '@SP',
+            'A=M',
+            'M=D',
+            '//    Save State',
+        ])
+        for l in ['@LCL', '@ARG', '@THIS', '@THAT']:
+            self.writeCode([
+                l,
+                'D=M',
+                '@SP',
+                'AM=M+1',
+                'M=D',
+            ])
+        self.writeCode([
+            '//    SET LCL',
+            '@SP',
+            'MD=M+1',
+            '@LCL',
+            'M=D',
+            '//    SET ARG',
+            '@R13',
+            'D=D-M',
+            '@ARG',
+            'M=D',
+            '//    jump to function',
+            '@R14',
+            'A=M',
+            '0;JMP'
+        ])
+
+    def writeReturnRoutine(self):
+        """
+        共有のreturnサブルーチンを出力
+        """
+        self.writeCode([
+            f"({self.RETURN_ROUTINE})"
+        ])
+        self.writeReturnCode()
+
     def writeReturn(self):
         """
         returnコマンドを出力
         """
+        if self.trampoline:
+            self.writeCode([
+                f"@{self.RETURN_ROUTINE}",
+                '0;JMP'
+            ])
+        else:
+            self.writeReturnCode()
+
+    def writeReturnCode(self):
         # ステートを戻して, リターンアドレスにジャンプ
         self.writeCode([
             '//    FRAME -> R13',
@@ -274,11 +457,20 @@ class CodeWriter():
             'D=M'
         ])
         self.writePopToM()
+        self.writeCode([
+            'D=M-D'
+        ])
+        self.writeCompareD(command)
+        self.writePushFromD()
+
+    def writeCompareD(self, command: str):
+        """
+        D (= x - y) を比較結果 (真: -1, 偽: 0) に置き換える
+        """
         goto_true = self.getLabel()
         goto_false = self.getLabel()
         comp_type = self.arithmetic_commands[command]
         self.writeCode([
-            'D=M-D',
             f"@{goto_true}",
             f"D;{comp_type}",
             'D=0',  # set False
@@ -288,43 +480,78 @@ class CodeWriter():
             'D=-1',  # set True
             f"({goto_false})"
         ])
-        self.writePushFromD()
 
-    def writePushFromVirtualSegment(self, segment: str, index: int):
-        self.writeCode([
-            '@{}'.format(self.segment_names[segment]),
-            'A=M',
-            *(['A=A+1'] * index),
-            'D=M',
-        ])
-        self.writePushFromD()
+    def writeLoadSegment(self, segment: str, index: int):
+        """
+        segment[index]の値をDに読み込む
+        """
+        if segment == 'constant':
+            self.writeCode([
+                f"@{index}",
+                "D=A",
+            ])
+        else:
+            self.writeSegmentAddress(segment, index)
+            self.writeCode([
+                'D=M'
+            ])
 
-    def writePopToVritualSegment(self, segment: str, index: int):
-        self.writePopToM()
+    def writeStoreSegment(self, segment: str, index: int, comp: str = 'D'):
+        """
+        segment[index]にcompの値 (D, 0, 1, -1) を書き込む
+        """
+        self.writeSegmentAddress(segment, index)
         self.writeCode([
-            'D=M',
-            '@{}'.format(self.segment_names[segment]),
-            'A=M',
-            *(['A=A+1'] * index),
-            'M=D'
+            f"M={comp}"
         ])
 
-    def writePushFromStaticSegment(self, segment: str, index: int):
-        self.writeCode([
-            '@{}'.format(self.segment_names[segment]),
-            *(['A=A+1'] * index),
-            'D=M',
-        ])
-        self.writePushFromD()
+    def writeSegmentAddress(self, segment: str, index: int):
+        """
+        segment[index]のアドレスをAに設定 (Dは変えない)
+        """
+        if segment in ['local', 'argument', 'this', 'that']:
+            self.writeCode([
+                '@{}'.format(self.segment_names[segment]),
+                'A=M',
+                *(['A=A+1'] * index),
+            ])
+        elif segment in ['temp', 'pointer']:
+            self.writeCode([
+                '@{}'.format(self.segment_names[segment]),
+                *(['A=A+1'] * index),
+            ])
+        elif segment == 'static':
+            self.writeCode([
+                '@{filename}.{index}'.format(
+                    filename=self.filename, index=index),
+            ])
+        else:
+            raise Exception("Unsupport segment: {}".format(segment))
 
-    def writePopToStaticSegment(self, segment: str, index: int):
-        self.writePopToM()
-        self.writeCode([
-            'D=M',
-            '@{}'.format(self.segment_names[segment]),
-            *(['A=A+1'] * index),
-            'M=D',
-        ])
+    def writeLoadConstant(self, value: int):
+        """
+        16bitの任意の値をDに読み込む (Aコマンドは15bitまでなので, 否定や符号反転を使う)
+        """
+        value &= 0xffff
+        if value in self.constant_comps:
+            self.writeCode([
+                f"D={self.constant_comps[value]}"
+            ])
+        elif value < 0x8000:
+            self.writeCode([
+                f"@{value}",
+                'D=A'
+            ])
+        elif -value & 0xffff < 0x8000:
+            self.writeCode([
+                f"@{-value & 0xffff}",
+                'D=-A'
+            ])
+        else:
+            self.writeCode([
+                f"@{~value & 0xffff}",
+                'D=!A'
+            ])
 
     def writePopToM(self):
         """
@@ -358,7 +585,13 @@ class CodeWriter():
         ])
 
     def writeCode(self, codes: list):
-        self.dst_file.write('\n'.join(codes) + '\n')
+        if self.codes is not None:
+            self.codes += codes
+        else:
+            self.writeLines(codes)
+
+    def writeLines(self, lines: list):
+        self.dst_file.write('\n'.join(lines) + '\n')
 
     def getLabel(self):
         self.label_count += 1
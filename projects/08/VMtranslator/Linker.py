@@ -0,0 +1,125 @@
+import Parser
+from CodeWriter import CodeWriter
+from CommandType import CommandType
+
+
+def readLines(filename: str) -> list:
+    with open(filename, 'r') as f:
+        return f.read().split('\n')
+
+
+def dropLines(lines, spans):
+    """
+    spans ((開始行, 終了行) のリスト, 1始まりで終了行を含む) に入る行を空行にして返す
+    行番号が変わらないので, 出力のコメントは元のファイルの行を指したままになる
+    """
+    spans = sorted(spans)
+    i = 0
+    for n, line in enumerate(lines, 1):
+        while i < len(spans) and spans[i][1] < n:
+            i += 1
+        if i < len(spans) and spans[i][0] <= n:
+            yield ''
+        else:
+            yield line
+
+
+class Function():
+    """
+    1関数分の情報
+    start, end: 定義の最初と最後の行 (end以降は次の関数)
+    calls: callで呼ぶ関数名のリスト
+    """
+    __slots__ = ('name', 'filename', 'start', 'end', 'commands', 'calls')
+
+    def __init__(self, name: str, filename: str, start: int):
+        self.name = name
+        self.filename = filename
+        self.start = start
+        self.end = None
+        self.commands = 0
+        self.calls = []
+
+
+class Linker():
+    """
+    .vmファイルをまたいで関数の呼び出しグラフを作り,
+    エントリポイント (Sys.init) から呼ばれない関数を取り除く
+    エントリポイントがない場合 (07のテストなど) は何も取り除かない
+    """
+
+    def __init__(self, entry_point: str = CodeWriter.ENTRY_POINT):
+        self.entry_point = entry_point
+        self.functions = {}  # 関数名 -> Function
+        self.removed = []    # 取り除いたFunction (読み込んだ順)
+
+    def scan(self, filename: str, lines=None):
+        """
+        1ファイル分の関数の定義と呼び出しを登録する
+        linesを省略した場合はfilenameから読む
+        """
+        parser = Parser.Parser(filename if lines is None else lines)
+        function = None
+        for command in parser:
+            if command is None:
+                raise Exception("Parser Error: command: {}".format(parser.command))
+            if command.type == CommandType.C_FUNCTION:
+                if function is not None:
+                    function.end = parser.line - 1
+                if command.arg1 in self.functions:
+                    raise Exception("Error: Dual Definition of function: {}".format(
+                        command.arg1))
+                function = Function(command.arg1, filename, parser.line)
+                self.functions[function.name] = function
+            elif function is not None and command.type == CommandType.C_CALL:
+                function.calls.append(command.arg1)
+            if function is not None:
+                function.commands += 1
+        if function is not None:
+            function.end = parser.line
+
+    def reachable(self) -> set:
+        """
+        エントリポイントから呼び出しをたどって到達できる関数名の集合
+        """
+        if self.entry_point not in self.functions:
+            return set(self.functions)
+        reached = {self.entry_point}
+        stack = [self.entry_point]
+        while stack:
+            for callee in self.functions[stack.pop()].calls:
+                # 定義のない関数はアセンブル時のエラーに任せる
+                if callee not in reached and callee in self.functions:
+                    reached.add(callee)
+                    stack.append(callee)
+        return reached
+
+    def link(self, files: list) -> dict:
+        """
+        filesを読み込み, ファイル名 -> 取り除く行の範囲のタプル を返す
+        """
+        for f in files:
+            self.scan(f)
+        return self.resolve(files)
+
+    def resolve(self, files: list) -> dict:
+        """
+        scan済みのファイルについて, ファイル名 -> 取り除く行の範囲のタプル を返す
+        """
+        reached = self.reachable()
+        self.removed = [fn for fn in self.functions.values() if fn.name not in reached]
+        spans = {f: [] for f in files}
+        for fn in self.removed:
+            spans[fn.filename].append((fn.start, fn.end))
+        return {f: tuple(s) for f, s in spans.items()}
+
+    def report(self) -> str:
+        """
+        取り除いた関数の一覧
+        """
+        lines = ["link: kept {} functions, removed {} functions ({} commands)".format(
+            len(self.functions) - len(self.removed), len(self.removed),
+            sum(fn.commands for fn in self.removed))]
+        for fn in self.removed:
+            lines.append("  {} ({}, {} commands)".format(fn.name, fn.filename, fn.commands))
+        return '\n'.join(lines)
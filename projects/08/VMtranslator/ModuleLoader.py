@@ -0,0 +1,76 @@
+import importlib.abc
+import importlib.util
+import os
+import re
+import sys
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+
+
+def uniqueName(directory: str, name: str) -> str:
+    """
+    directoryのnameモジュールをsys.modulesに登録する名前 ("_06_assember_Parser" など)
+    """
+    relpath = os.path.relpath(os.path.abspath(directory), os.path.abspath(PROJECT_DIR))
+    return "_{}_{}".format(re.sub(r"\W", "_", relpath), name)
+
+
+class SiblingFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """
+    読み込み中のモジュールの "import 名前" を, 同じディレクトリのモジュールに向ける
+    見つけたモジュールはloadで一意な名前で読み込み, そのモジュール自身を返す
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.specs = {}  # 元の名前 -> 読み込んだモジュールの本来のspec
+
+    def find_spec(self, fullname, path, target=None):
+        if path is not None or not os.path.isfile(os.path.join(self.directory, fullname + '.py')):
+            return None
+        return importlib.util.spec_from_loader(fullname, self)
+
+    def create_module(self, spec):
+        module = load(self.directory, spec.name)
+        self.specs[spec.name] = module.__spec__
+        return module
+
+    def exec_module(self, module):
+        # 実行済みなので, import機構が元の名前のspecに書き換えた__spec__を戻すだけ
+        module.__spec__ = self.specs.pop(module.__spec__.name)
+
+
+def load(directory: str, name: str):
+    """
+    directoryのname.pyを, 他のディレクトリの同名のモジュール (06/assemberと08/VMtranslatorの
+    Parserなど) と衝突しないように, uniqueNameの名前で読み込んで返す
+    nameが同じディレクトリのモジュールをimportしていれば, それも同じように読み込む
+    sys.pathや, 元の名前のsys.modulesは変えない
+    """
+    directory = os.path.abspath(directory)
+    unique = uniqueName(directory, name)
+    module = sys.modules.get(unique)
+    if module is not None:
+        return module
+    path = os.path.join(directory, name + '.py')
+    spec = importlib.util.spec_from_file_location(unique, path)
+    if spec is None or not os.path.isfile(path):
+        raise Exception("Error: module not found: {}".format(path))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[unique] = module
+    finder = SiblingFinder(directory)
+    # 元の名前で登録済みの別のモジュールより先に探すため, 読み込み中だけ元の名前を外す
+    siblings = {os.path.splitext(f)[0] for f in os.listdir(directory) if f.endswith('.py')}
+    saved = {n: sys.modules.pop(n) for n in siblings if n in sys.modules}
+    sys.meta_path.insert(0, finder)
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[unique]
+        raise
+    finally:
+        sys.meta_path.remove(finder)
+        for n in siblings:
+            sys.modules.pop(n, None)
+        sys.modules.update(saved)
+    return module
@@ -1,37 +1,131 @@
+import mmap
+import os
 import re
 from CommandType import CommandType
 
-CMD_TYPE_REGREPS = {
-    CommandType.C_ARITHMETIC: re.compile("^((?:add)|(?:sub)|(?:neg)|(?:eq)|" +
-                                         "(?:gt)|(?:lt)|(?:and)|(?:or)|(?:not))$"),
-    CommandType.C_PUSH: re.compile("^push[\s]+([\w]+)[\s]+([\d]+)$"),
-    CommandType.C_POP: re.compile("^pop[\s]+([\w]+)[\s]+([\d]+)$"),
-    CommandType.C_LABEL: re.compile("^label[\s]+([\w]+[\w\d_.:]*)$"),
-    CommandType.C_GOTO: re.compile("^goto[\s]+([\w_.:]+[\w\d_.:]*)$"),
-    CommandType.C_IF: re.compile("^if-goto[\s]+([\w_.:]+[\w\d_.:]*)$"),
-    CommandType.C_FUNCTION: re.compile("^function[\s]+([\w\d_.:]+)[\s]+([\d]+)$"),
-    CommandType.C_CALL: re.compile("^call[\s]+([\w\d_.:]+)[\s]+([\d]+)$"),
-    CommandType.C_RETURN: re.compile("^return$"),
+# mappedLinesが1度にデコードする大きさ (この後の最初の改行までを1ブロックにする)
+BLOCK_SIZE = 1 << 16
+
+# 最初のトークン -> (コマンドの種類, 引数の数)
+COMMANDS = {
+    'add':      (CommandType.C_ARITHMETIC, 0),
+    'sub':      (CommandType.C_ARITHMETIC, 0),
+    'neg':      (CommandType.C_ARITHMETIC, 0),
+    'eq':       (CommandType.C_ARITHMETIC, 0),
+    'gt':       (CommandType.C_ARITHMETIC, 0),
+    'lt':       (CommandType.C_ARITHMETIC, 0),
+    'and':      (CommandType.C_ARITHMETIC, 0),
+    'or':       (CommandType.C_ARITHMETIC, 0),
+    'not':      (CommandType.C_ARITHMETIC, 0),
+    'push':     (CommandType.C_PUSH, 2),
+    'pop':      (CommandType.C_POP, 2),
+    'label':    (CommandType.C_LABEL, 1),
+    'goto':     (CommandType.C_GOTO, 1),
+    'if-goto':  (CommandType.C_IF, 1),
+    'function': (CommandType.C_FUNCTION, 2),
+    'call':     (CommandType.C_CALL, 2),
+    'return':   (CommandType.C_RETURN, 0),
+}
+# 種類ごとの最初の引数の形式
+ARG1_REGREPS = {
+    CommandType.C_PUSH:     re.compile("[\w]+"),
+    CommandType.C_POP:      re.compile("[\w]+"),
+    CommandType.C_LABEL:    re.compile("[\w]+[\w\d_.:]*"),
+    CommandType.C_GOTO:     re.compile("[\w_.:]+[\w\d_.:]*"),
+    CommandType.C_IF:       re.compile("[\w_.:]+[\w\d_.:]*"),
+    CommandType.C_FUNCTION: re.compile("[\w\d_.:]+"),
+    CommandType.C_CALL:     re.compile("[\w\d_.:]+"),
 }
 
 
+def release(data, end: int):
+    """
+    読み終わったendまでのページをプロセスから外す (ページキャッシュには残る)
+    マップしたページもRSSに数えられるので, 外さないとファイルの大きさだけRSSが増える
+    """
+    if isinstance(data, mmap.mmap) and hasattr(mmap, 'MADV_DONTNEED'):
+        end -= end % mmap.PAGESIZE
+        if end > 0:
+            data.madvise(mmap.MADV_DONTNEED, 0, end)
+
+
+def mappedLines(filename: str):
+    """
+    ファイルをメモリマップし, ブロックごとにまとめて行に分割して返す
+    ファイル全体を読み込まないのでメモリ使用量は一定
+    """
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    with data:
+        size = len(data)
+        start = 0
+        while start < size:
+            end = start + BLOCK_SIZE
+            if end >= size:
+                end = size
+            else:
+                end = data.find(b'\n', end) + 1 or size
+            text = data[start:end].decode()
+            lines = text.split('\n')
+            if text.endswith('\n'):
+                lines.pop()
+            yield from lines
+            start = end
+            release(data, start)
+
+# 行 -> classifyの結果. 長く動くプロセスで増え続けないように上限を超えたら捨てる
+PARSED_COMMANDS = {}
+MAX_PARSED_COMMANDS = 1 << 16
+
+
+class Command():
+    """
+    1コマンド分のパース結果
+    type: CommandType
+    arg1: 最初の引数 (算術コマンドはコマンド自身, returnはNone)
+    arg2: 2番目の引数 (push/pop/function/call以外はNone)
+    """
+    __slots__ = ('type', 'arg1', 'arg2')
+
+    def __init__(self, cmd_type: int, arg1: str = None, arg2: int = None):
+        self.type = cmd_type
+        self.arg1 = arg1
+        self.arg2 = arg2
+
+    def __repr__(self):
+        return "Command({}, arg1={}, arg2={})".format(self.type, self.arg1, self.arg2)
+
+
 class Parser():
 
-    def __init__(self, file: str):
-        self.file = open(file, "r")
+    def __init__(self, file):
+        """
+        fileにはファイル名か, 行のイテラブル (ファイルオブジェクト, 文字列のリストなど) を渡す
+        ファイル名の場合はメモリマップして読む
+        """
+        self.lines = mappedLines(file) if isinstance(file, str) else iter(file)
         self.command = None
         self.command_type = None
-        self.command_matched = None
+        self.record = None
         self.line = 0
 
+    def __iter__(self):
+        """
+        残りのコマンドをCommandとして順に返す (不正なコマンドはNone)
+        """
+        while self.advance():
+            yield self.parse(self.command)
+
     def advance(self) -> bool:
         """
         次のコマンドを用意
         """
         while True:
-            line = self.file.readline()
+            line = next(self.lines, None)
             self.line += 1
-            if not line:
+            if line is None:
                 self.command = None
                 return False
             comment_i = line.find("//")
@@ -43,25 +137,63 @@ class Parser():
             self.command = line
             return True
 
+    @classmethod
+    def parse(cls, command: str) -> Command:
+        """
+        コメントと前後の空白を除いた1行をCommandにする. 形式が正しくない場合はNone
+        同じ行は何度も現れるので分類結果を覚えておく
+        """
+        fields = PARSED_COMMANDS.get(command, False)
+        if fields is False:
+            fields = cls.classify(command)
+            if len(PARSED_COMMANDS) >= MAX_PARSED_COMMANDS:
+                PARSED_COMMANDS.clear()
+            PARSED_COMMANDS[command] = fields
+        return None if fields is None else Command(*fields)
+
+    @staticmethod
+    def classify(command: str):
+        """
+        最初のトークンで種類を引き, 引数の形式を確かめて (種類, arg1, arg2) を返す
+        """
+        tokens = command.split()
+        entry = COMMANDS.get(tokens[0])
+        if entry is None:
+            return None
+        cmd_type, num_args = entry
+        if len(tokens) != num_args + 1:
+            return None
+        if num_args == 0:
+            if cmd_type == CommandType.C_RETURN:
+                return cmd_type, None, None
+            return cmd_type, tokens[0], None
+        if not ARG1_REGREPS[cmd_type].fullmatch(tokens[1]):
+            return None
+        if num_args == 1:
+            return cmd_type, tokens[1], None
+        if not tokens[2].isdecimal():
+            return None
+        return cmd_type, tokens[1], int(tokens[2])
+
     def commandType(self) -> int:
         """
         vmコマンドの種類を返す
         """
-        for t, r in CMD_TYPE_REGREPS.items():
-            matched_re = r.match(self.command)
-            if matched_re:
-                self.command_type = t
-                self.command_matched = matched_re
-                return t
+        self.record = self.parse(self.command)
+        if self.record is None:
+            self.command_type = None
+            return None
+        self.command_type = self.record.type
+        return self.command_type
 
     def arg1(self) -> str:
         """
         最初の引数が返される
         """
-        return self.command_matched.group(1)
+        return self.record.arg1
 
     def arg2(self) -> int:
         """
         2番目の引数が返される
         """
-        return int(self.command_matched.group(2))
+        return self.record.arg2
@@ -0,0 +1,157 @@
+import re
+
+
+class PeepholeOptimizer():
+    """
+    CodeWriterが出力したアセンブリの命令列を局所的に書き換えて短くする
+    コメント行は直後の命令に付けて保持する
+    """
+    PUSH_D = ['@SP', 'A=M', 'M=D', '@SP', 'M=M+1']
+    POP_M = ['@SP', 'AM=M-1']
+    # pop -> Mとの演算 -> pushを, スタックトップを直接書き換える形にする
+    IN_PLACE = {
+        'D=D+M': 'M=D+M',
+        'D=M-D': 'M=M-D',
+        'D=D&M': 'M=D&M',
+        'D=D|M': 'M=D|M',
+        'D=!M':  'M=!M',
+        'D=-M':  'M=-M',
+    }
+    # push D; pop -> M の後でMだけを読む命令は, Dを読む命令に置き換えられる
+    READ_PUSHED = {
+        'D=M':  None,
+        'D=!M': 'D=!D',
+        'D=-M': 'D=-D',
+    }
+    SEGMENT_POINTERS = ['@LCL', '@ARG', '@THIS', '@THAT']
+    CONSTANT_REGREP = re.compile(r"^@(\d+)$")
+    # 何個以上のA=A+1を @index; A=D+A に置き換えるか
+    MIN_INDEX_CHAIN = 3
+
+    def __init__(self):
+        self.rules = [
+            self.removePushPop,
+            self.inPlaceArithmetic,
+            self.foldConstantIncrement,
+            self.indexSegmentPointer,
+            self.removeDeadAddress,
+        ]
+
+    def optimize(self, lines: list) -> list:
+        """
+        変化がなくなるまで規則を適用した行のリストを返す
+        """
+        insts = []
+        comments = []
+        pending = []
+        for line in lines:
+            if line.startswith('//'):
+                pending.append(line)
+            else:
+                insts.append(line)
+                comments.append(pending)
+                pending = []
+
+        changed = True
+        while changed:
+            insts, comments, trailing, changed = self.rewrite(insts, comments)
+            pending = trailing + pending
+
+        out = []
+        for c, inst in zip(comments, insts):
+            out += c
+            out.append(inst)
+        return out + pending
+
+    def rewrite(self, insts: list, comments: list):
+        """
+        先頭から1回規則を適用する
+        """
+        new_insts = []
+        new_comments = []
+        pending = []
+        changed = False
+        i = 0
+        while i < len(insts):
+            for rule in self.rules:
+                matched = rule(insts, i)
+                if matched is not None:
+                    n, replacement = matched
+                    for c in comments[i:i + n]:
+                        pending += c
+                    for inst in replacement:
+                        new_insts.append(inst)
+                        new_comments.append(pending)
+                        pending = []
+                    i += n
+                    changed = True
+                    break
+            else:
+                new_insts.append(insts[i])
+                new_comments.append(pending + comments[i])
+                pending = []
+                i += 1
+        # pendingは末尾で消えた命令のコメント
+        return new_insts, new_comments, pending, changed
+
+    def removePushPop(self, insts: list, i: int):
+        """
+        push D; pop -> M; D=M はDがそのまま残るので丸ごと不要
+        push D; pop -> M; D=!M  =>  D=!D
+        """
+        if insts[i:i + 7] == self.PUSH_D + self.POP_M and insts[i + 7:i + 8] \
+                and insts[i + 7] in self.READ_PUSHED:
+            replacement = self.READ_PUSHED[insts[i + 7]]
+            return 8, [replacement] if replacement else []
+        return None
+
+    def inPlaceArithmetic(self, insts: list, i: int):
+        """
+        pop -> M; D=D+M; push D  =>  @SP; A=M-1; M=D+M
+        直後がpopの場合はremovePushPopのためにDに結果を残す
+        """
+        if insts[i:i + 2] == self.POP_M and insts[i + 2:i + 3] \
+                and insts[i + 2] in self.IN_PLACE \
+                and insts[i + 3:i + 8] == self.PUSH_D \
+                and insts[i + 8:i + 10] != self.POP_M:
+            return 8, ['@SP', 'A=M-1', self.IN_PLACE[insts[i + 2]]]
+        return None
+
+    def foldConstantIncrement(self, insts: list, i: int):
+        """
+        @n; A=A+1 (k回)  =>  @n+k
+        """
+        m = self.CONSTANT_REGREP.match(insts[i])
+        if m is None:
+            return None
+        k = self.countIncrements(insts, i + 1)
+        if k == 0:
+            return None
+        return 1 + k, [f"@{int(m.group(1)) + k}"]
+
+    def indexSegmentPointer(self, insts: list, i: int):
+        """
+        @LCL; A=M; A=A+1 (k回); D=M  =>  @LCL; D=M; @k; A=D+A; D=M
+        """
+        if insts[i] not in self.SEGMENT_POINTERS or insts[i + 1:i + 2] != ['A=M']:
+            return None
+        k = self.countIncrements(insts, i + 2)
+        if k < self.MIN_INDEX_CHAIN or insts[i + 2 + k:i + 3 + k] != ['D=M']:
+            return None
+        return 3 + k, [insts[i], 'D=M', f"@{k}", 'A=D+A', 'D=M']
+
+    def removeDeadAddress(self, insts: list, i: int):
+        """
+        @X; @Y の@Xは使われない
+        """
+        if insts[i].startswith('@') and insts[i + 1:i + 2] \
+                and insts[i + 1].startswith('@'):
+            return 1, []
+        return None
+
+    @staticmethod
+    def countIncrements(insts: list, i: int) -> int:
+        k = 0
+        while i + k < len(insts) and insts[i + k] == 'A=A+1':
+            k += 1
+        return k
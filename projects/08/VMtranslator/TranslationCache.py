@@ -0,0 +1,110 @@
+import glob
+import hashlib
+import json
+import os
+import re
+
+# 変換結果に影響するソース. どれかが変わればキャッシュは使われない
+TRANSLATOR_SOURCES = ['CommandType.py', 'Parser.py', 'CodeWriter.py', 'Linker.py',
+                      'PeepholeOptimizer.py', 'VMOptimizer.py', 'VMtranslator.py']
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# keyが返すハッシュの名前のファイルだけをキャッシュのエントリとみなす
+ENTRY_REGREP = re.compile(r"[0-9a-f]{64}\.json")
+
+
+def translatorVersion() -> str:
+    """
+    変換器のソースのハッシュを返す
+    """
+    h = hashlib.sha256()
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in TRANSLATOR_SOURCES:
+        with open(os.path.join(base_dir, name), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class TranslationCache():
+    """
+    .vmファイル1つ分の変換結果 (アセンブリ, LABEL数, RETURN数) をディスクに保存する
+    キーはファイルの内容とファイル名, 変換器のバージョン, オプションのハッシュ
+    容量を超えたら最後に使われた時刻 (mtime) が古いものから消す
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = translatorVersion()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, filename: str, options: list) -> str:
+        """
+        staticのシンボルにファイル名が入るので, 内容が同じでもファイル名が違えば別のキー
+        """
+        h = hashlib.sha256()
+        h.update(self.version.encode())
+        h.update(repr(options).encode())
+        h.update(os.path.basename(filename).encode())
+        with open(filename, 'rb') as f:
+            h.update(f.read())
+        return h.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key: str):
+        """
+        キャッシュにあれば変換結果を返し, 使用時刻を更新する. なければNone
+        読めないファイルや, 形式の違うファイル (別のツールや古い版のもの) もないものとみなす
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+            text, labels, returns = entry['text'], entry['labels'], entry['returns']
+            if not (isinstance(text, str) and isinstance(labels, int) and isinstance(returns, int)):
+                raise TypeError("unexpected cache entry: {}".format(path))
+            os.utime(path)
+        except (OSError, ValueError, KeyError, TypeError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return text, labels, returns
+
+    def put(self, key: str, fragment: tuple):
+        text, labels, returns = fragment
+        path = self.path(key)
+        # 書き込み途中のファイルを読まないように, 別名で書いてから置き換える
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump({'text': text, 'labels': labels, 'returns': returns}, f)
+        os.replace(tmp_path, path)
+
+    def evict(self) -> int:
+        """
+        合計サイズがmax_bytes以下になるまで古いものから消し, 消した数を返す
+        ディレクトリにあるキャッシュ以外のファイル (package.jsonなど) は数えず, 消さない
+        """
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            if not ENTRY_REGREP.fullmatch(os.path.basename(path)):
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
@@ -0,0 +1,314 @@
+from CommandType import CommandType
+from Parser import Command
+
+
+class VMOptimizer():
+    """
+    VMコマンドを基本ブロックごとに溜め, 定数を畳み込んでからCodeWriterへ出力する
+    ブロック内ではスタックの上の方の値を (定数のまま, またはDに入れたまま) 遅らせて積み,
+    必要になるまでSPを操作しない. ブロックの終わりでは必ずスタックに書き出す
+    """
+    BINARY = {
+        'add': lambda x, y: x + y,
+        'sub': lambda x, y: x - y,
+        'and': lambda x, y: x & y,
+        'or':  lambda x, y: x | y,
+    }
+    UNARY = {
+        'neg': lambda x: -x,
+        'not': lambda x: ~x,
+    }
+    # x - y (16bitで折り返し) から比較結果を決める. CodeWriterのD=M-D; D;JXXと同じ
+    COMPARE = {
+        'eq': lambda d: d == 0,
+        'gt': lambda d: 0 < d < 0x8000,
+        'lt': lambda d: d >= 0x8000,
+    }
+    # Dに入った値 (x) と定数 (y) の演算. 定数はAに入れる
+    D_OP_A = {
+        'add': 'D=D+A',
+        'sub': 'D=D-A',
+        'and': 'D=D&A',
+        'or':  'D=D|A',
+        'eq':  'D=D-A',
+        'gt':  'D=D-A',
+        'lt':  'D=D-A',
+    }
+    # この後ろでブロックを区切るコマンド (if-gotoは自分までをブロックに含める)
+    BOUNDARIES = [CommandType.C_LABEL, CommandType.C_GOTO, CommandType.C_FUNCTION,
+                  CommandType.C_CALL, CommandType.C_RETURN]
+    # 仮想スタックのDに入っている値
+    D = None
+
+    def __init__(self, code_writer):
+        self.code_writer = code_writer
+        self.block = []  # [Command, コメントのリスト]
+        # まだスタックに積んでいない値. Dは先頭にだけ置ける. 他は定数 (0 - 0xffff)
+        self.stack = []
+
+    def write(self, command: Command, comment: str = None):
+        """
+        コマンドを1つ受け取る. ブロックの区切りでは溜めたコマンドを出力する
+        """
+        comments = [comment] if comment is not None else []
+        if command.type in self.BOUNDARIES:
+            self.flush()
+            for c in comments:
+                self.code_writer.writeComment(c)
+            self.code_writer.writeCommand(command)
+            return
+        self.block.append([command, comments])
+        if command.type == CommandType.C_IF:
+            self.flush()
+
+    def flush(self):
+        """
+        溜めたブロックを畳み込んで出力する. ファイルの終わりでも呼ぶ
+        """
+        block = self.fold(self.block)
+        self.block = []
+        fused = self.fusedBranch(block) if self.code_writer.fuse else None
+        if fused is not None:
+            # 比較の前までを出力し, 比較と続くnot, if-gotoは1つのjumpにする
+            i, branch = fused
+            compare, compare_comments = block[i]
+            block = block[:i]
+        for command, comments in block:
+            for c in comments:
+                self.code_writer.writeComment(c)
+            self.writeCommand(command)
+        if fused is not None:
+            for c in compare_comments:
+                self.code_writer.writeComment(c)
+            self.writeBinary(compare.arg1, branch)
+        self.spill(0)
+
+    def fusedBranch(self, block: list) -> tuple:
+        """
+        ブロックが 比較, not*, if-goto で終わっていれば
+        (比較の位置, (ラベル, notが奇数個か)) を返す. 比較以降のコメントは比較の位置にまとめる
+        """
+        if not block or block[-1][0] is None or block[-1][0].type != CommandType.C_IF:
+            return None
+        i = len(block) - 2
+        while i >= 0 and self.isArithmetic(block[i][0], ['not']):
+            i -= 1
+        if i < 0 or not self.isArithmetic(block[i][0], self.COMPARE):
+            return None
+        for _, comments in block[i + 1:]:
+            block[i][1].extend(comments)
+        return i, (block[-1][0].arg1, (len(block) - 2 - i) % 2 == 1)
+
+    @staticmethod
+    def isArithmetic(command: Command, names) -> bool:
+        return command is not None and command.type == CommandType.C_ARITHMETIC \
+            and command.arg1 in names
+
+    def fold(self, block: list) -> list:
+        """
+        定数どうしの演算を1つのpush constantに置き換える
+        ブロックの中で値が作られてから使われるまでの間のコマンドは,
+        その値より上のスタックしか触らないので, 積む位置を使う位置までずらしてよい
+        """
+        block = list(block)
+        # スタックの各値を積んだpush constantの位置 (それ以外で積まれた値はNone)
+        stack = []
+        for i, (command, comments) in enumerate(block):
+            cmd_type = command.type
+            if cmd_type == CommandType.C_PUSH:
+                stack.append(i if command.arg1 == 'constant' else None)
+            elif cmd_type == CommandType.C_POP:
+                if stack:
+                    stack.pop()
+            elif cmd_type == CommandType.C_ARITHMETIC:
+                n = 1 if command.arg1 in self.UNARY else 2
+                args = stack[-n:] if len(stack) >= n else []
+                del stack[-n:]
+                if len(args) < n or None in args:
+                    stack.append(None)
+                    continue
+                values = [block[j][0].arg2 for j in args]
+                comments[:0] = [c for j in args for c in block[j][1]]
+                for j in args:
+                    block[j] = None
+                block[i] = [Command(CommandType.C_PUSH, 'constant',
+                                    self.evaluate(command.arg1, *values)), comments]
+                stack.append(i)
+            elif cmd_type == CommandType.C_IF:
+                j = stack.pop() if stack else None
+                if j is None:
+                    continue
+                value = block[j][0].arg2
+                comments[:0] = block[j][1]
+                block[j] = None
+                if value:
+                    block[i] = [Command(CommandType.C_GOTO, command.arg1), comments]
+                else:
+                    block[i] = [None, comments]
+        return [node for node in block if node is not None]
+
+    def evaluate(self, command: str, *values) -> int:
+        """
+        16bitの定数の演算結果 (0 - 0xffff) を返す
+        """
+        if command in self.UNARY:
+            return self.UNARY[command](*values) & 0xffff
+        if command in self.BINARY:
+            return self.BINARY[command](*values) & 0xffff
+        x, y = values
+        return 0xffff if self.COMPARE[command]((x - y) & 0xffff) else 0
+
+    def writeCommand(self, command: Command):
+        """
+        畳み込み後の1コマンドを, 仮想スタックを使って出力する
+        """
+        if command is None:
+            return
+        cw = self.code_writer
+        cmd_type = command.type
+        stack = self.stack
+        if cmd_type == CommandType.C_PUSH:
+            if command.arg1 == 'constant':
+                stack.append(command.arg2 & 0xffff)
+            else:
+                self.spill(0)
+                cw.writeLoadSegment(command.arg1, command.arg2)
+                stack.append(self.D)
+        elif cmd_type == CommandType.C_POP:
+            self.writePop(command.arg1, command.arg2)
+        elif cmd_type == CommandType.C_ARITHMETIC:
+            if command.arg1 in self.UNARY:
+                self.writeUnary(command.arg1)
+            else:
+                self.writeBinary(command.arg1)
+        elif cmd_type == CommandType.C_IF:
+            if stack == [self.D]:
+                stack.pop()
+                cw.writeIfD(command.arg1)
+            else:
+                self.spill(0)
+                cw.writeIf(command.arg1)
+        else:
+            self.spill(0)
+            cw.writeCommand(command)
+
+    def writePop(self, segment: str, index: int):
+        cw = self.code_writer
+        stack = self.stack
+        if stack and stack[-1] is not self.D and stack[-1] in cw.constant_comps:
+            # 0, 1, -1はDを使わずに書き込める
+            cw.writeStoreSegment(segment, index, cw.constant_comps[stack.pop()])
+            return
+        if stack and stack[-1] is not self.D:
+            self.spill(1)
+            cw.writeLoadConstant(stack.pop())
+        elif stack:
+            stack.pop()
+        else:
+            cw.writePopToM()
+            cw.writeCode([
+                'D=M'
+            ])
+        cw.writeStoreSegment(segment, index)
+
+    def writeUnary(self, command: str):
+        cw = self.code_writer
+        stack = self.stack
+        if stack and stack[-1] is not self.D:
+            stack.append(self.evaluate(command, stack.pop()))
+        elif stack:
+            cw.writeCode([
+                'D=-D' if command == 'neg' else 'D=!D'
+            ])
+        else:
+            cw.writeCode([
+                '@SP',
+                'A=M-1',
+                'M=-M' if command == 'neg' else 'M=!M'
+            ])
+
+    def writeBinary(self, command: str, branch: tuple = None):
+        """
+        x op yをDに計算して仮想スタックに積む. 比較はx - yを計算してからjumpで真偽にする
+        branch (ラベル, 反転するか) を渡すと, 比較の真偽を積まずにそのままif-gotoのjumpにする
+        """
+        cw = self.code_writer
+        stack = self.stack
+        compare = command in self.COMPARE
+        if len(stack) >= 2 and stack[-2] is not self.D:
+            y = stack.pop()
+            value = self.evaluate(command, stack.pop(), y)
+            if branch is None:
+                stack.append(value)
+            elif bool(value) != branch[1]:
+                self.spill(0)
+                cw.writeGoto(branch[0])
+            return
+        if stack == [self.D]:
+            # y: D, x: スタック
+            stack.pop()
+            cw.writePopToM()
+            cw.writeCode([
+                'D=M-D' if compare else cw.arithmetic_commands[command]
+            ])
+        elif len(stack) == 1 and stack[0] < 0x8000 \
+                or stack[:1] == [self.D] and len(stack) == 2 and stack[1] < 0x8000:
+            # y: 定数, x: Dかスタック
+            y = stack.pop()
+            x = 'D'
+            if not stack:
+                cw.writePopToM()
+                x = 'M'
+            stack.clear()
+            if y == 1 and command in ['add', 'sub']:
+                cw.writeCode([
+                    f"D={x}+1" if command == 'add' else f"D={x}-1"
+                ])
+            else:
+                if x == 'M':
+                    cw.writeCode([
+                        'D=M'
+                    ])
+                cw.writeCode([
+                    f"@{y}",
+                    self.D_OP_A[command]
+                ])
+        else:
+            self.spill(0)
+            cw.writePopToM()
+            cw.writeCode([
+                'D=M'
+            ])
+            cw.writePopToM()
+            cw.writeCode([
+                'D=M-D' if compare else cw.arithmetic_commands[command]
+            ])
+        if branch is not None:
+            # 比較の後の仮想スタックは空なので, そのままjumpできる
+            cw.writeCompareIfD(command, *branch)
+            return
+        if compare:
+            cw.writeCompareD(command)
+        stack.append(self.D)
+
+    def spill(self, keep: int):
+        """
+        仮想スタックの上からkeep個を残して, 下から順にスタックへ書き出す
+        """
+        cw = self.code_writer
+        n = len(self.stack) - keep
+        for value in self.stack[:n]:
+            if value is self.D:
+                cw.writePushFromD()
+            elif value in cw.constant_comps:
+                cw.writeCode([
+                    '@SP',
+                    'A=M',
+                    f"M={cw.constant_comps[value]}",
+                    '@SP',
+                    'M=M+1'
+                ])
+            else:
+                cw.writeLoadConstant(value)
+                cw.writePushFromD()
+        del self.stack[:n]
@@ -1,69 +1,295 @@
 import Parser
 import CodeWriter
+import Linker
+import TranslationCache
+import VMOptimizer
 from CommandType import CommandType
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import argparse
+import io
 import os
 import glob
+import logging
+import re
+
+# CodeWriter.getLabel/getReturnLabelが生成するラベル (の参照) だけにマッチする
+GENERATED_LABEL_REGREP = re.compile(r"(?<=[@(])(LABEL|RETURN)(\d+)(?=\)?$)", re.MULTILINE)
 
 
 class VMtranslator():
-    def __init__(self):
+    def __init__(self, argv: list = None):
         self.parser = argparse.ArgumentParser(
             description='Transrate VM file or directory to single asm file.')
         self.parser.add_argument('path', type=str, help='vm file or directory')
-        args = self.parser.parse_args()
+        self.parser.add_argument('--trace', action='store_true',
+                                 help='log every translated command')
+        self.parser.add_argument('--optimize', action='store_true',
+                                 help='run the peephole optimizer over the output')
+        self.parser.add_argument('--trampoline', action='store_true',
+                                 help='share one call/return subroutine between all call sites')
+        self.parser.add_argument('--fold', action='store_true',
+                                 help='fold constants and keep the stack top in D within basic blocks')
+        self.parser.add_argument('--fuse', action='store_true',
+                                 help='turn eq/gt/lt (and not) followed by if-goto into one jump')
+        self.parser.add_argument('--link', action='store_true',
+                                 help='drop functions unreachable from Sys.init')
+        self.parser.add_argument('--no-bootstrap', action='store_true',
+                                 help='do not set SP or call Sys.init at the start')
+        self.parser.add_argument('-j', '--workers', type=int, default=1,
+                                 help='number of worker processes translating files in parallel')
+        self.parser.add_argument('--cache', type=str, default=None,
+                                 help='directory caching translated files between runs')
+        self.parser.add_argument('--cache-size', type=int, default=64,
+                                 help='maximum size of the cache directory in MiB')
+        args = self.parser.parse_args(argv)
         path = args.path
+        logging.basicConfig(level=logging.DEBUG if args.trace else logging.WARNING)
+        self.trace = args.trace
+        self.optimize = args.optimize
+        self.trampoline = args.trampoline
+        self.fold = args.fold
+        self.fuse = args.fuse
+        self.workers = args.workers
+        self.cache = None
+        if args.cache is not None:
+            self.cache = TranslationCache.TranslationCache(
+                args.cache, args.cache_size * 1024 * 1024)
 
         if os.path.isfile(path):
             if path.endswith('.vm'):
                 self.code_writer = CodeWriter.CodeWriter(
-                    "{}.asm".format(path[:-3]))
+                    "{}.asm".format(path[:-3]), args.optimize, args.trampoline,
+                    fold=args.fold, fuse=args.fuse, bootstrap=not args.no_bootstrap)
                 self.files = [path]
             else:
                 raise Exception("path: file name should end with \".vm\".")
         elif os.path.isdir(path):
             if path.endswith('/'):
                 path = path[:-1]
-            self.code_writer = CodeWriter.CodeWriter("{}.asm".format(path))
+            self.code_writer = CodeWriter.CodeWriter(
+                "{}.asm".format(path), args.optimize, args.trampoline, fold=args.fold,
+                fuse=args.fuse, bootstrap=not args.no_bootstrap)
             self.files = glob.glob(f"{path}/*.vm")
         else:
             raise Exception("Unsupport File Type.")
 
+        # ファイル名 -> 取り除く行の範囲. リンクしない場合は空
+        self.linker = None
+        self.drops = {f: () for f in self.files}
+        if args.link:
+            self.linker = Linker.Linker()
+            self.drops = self.linker.link(self.files)
+
     def translate(self):
-        for f in self.files:
-            filename = os.path.basename(f)
-            self.code_writer.setFileName(filename)
-            self.parser = Parser.Parser(f)
-            while self.parser.advance():
-                cmd_type = self.parser.commandType()
-                print(f"{cmd_type} : {self.parser.command}")
-                self.code_writer.writeComment(
-                    f"{filename}: {self.parser.command} (line: {self.parser.line})")
-                if cmd_type == CommandType.C_ARITHMETIC:
-                    self.code_writer.writeArithmetic(self.parser.arg1())
-                elif cmd_type in [CommandType.C_PUSH, CommandType.C_POP]:
-                    self.code_writer.writePushPop(
-                        cmd_type, self.parser.arg1(), self.parser.arg2())
-                elif cmd_type == CommandType.C_LABEL:
-                    self.code_writer.writeLabel(self.parser.arg1())
-                elif cmd_type == CommandType.C_GOTO:
-                    self.code_writer.writeGoto(self.parser.arg1())
-                elif cmd_type == CommandType.C_IF:
-                    self.code_writer.writeIf(self.parser.arg1())
-                elif cmd_type == CommandType.C_FUNCTION:
-                    self.code_writer.writeFunction(
-                        self.parser.arg1(), self.parser.arg2())
-                elif cmd_type == CommandType.C_CALL:
-                    self.code_writer.writeCall(
-                        self.parser.arg1(), self.parser.arg2())
-                elif cmd_type == CommandType.C_RETURN:
-                    self.code_writer.writeReturn()
-                else:
-                    raise Exception(
-                        "Parser Error: command: {}".format(self.parser.command))
-            self.parser = None
+        if self.cache is None and (self.workers <= 1 or len(self.files) <= 1):
+            for f in self.files:
+                translateFile(self.code_writer, f, self.trace, self.drops[f])
+        else:
+            self.link(self.translateFragments())
         self.code_writer.close()
 
+    def translateFragments(self) -> list:
+        """
+        ファイルごとの変換結果 (アセンブリ, LABEL数, RETURN数) を元の順序で返す
+        キャッシュにないファイルだけを変換し, workers > 1 ならプロセスプールで並列に変換する
+        """
+        fragments = [None] * len(self.files)
+        keys = [None] * len(self.files)
+        if self.cache is not None:
+            for i, f in enumerate(self.files):
+                options = [self.optimize, self.trampoline, self.fold, self.fuse, self.drops[f]]
+                keys[i] = self.cache.key(f, options)
+                fragments[i] = self.cache.get(keys[i])
+        misses = [i for i, fragment in enumerate(fragments) if fragment is None]
+
+        translate = partial(translateToBuffer, optimize=self.optimize,
+                            trampoline=self.trampoline, fold=self.fold, fuse=self.fuse,
+                            trace=self.trace)
+        files = [self.files[i] for i in misses]
+        drops = [self.drops[f] for f in files]
+        if self.workers <= 1 or len(files) <= 1:
+            results = [translate(f, d) for f, d in zip(files, drops)]
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(translate, files, drops))
+
+        for i, fragment in zip(misses, results):
+            fragments[i] = fragment
+            if self.cache is not None:
+                self.cache.put(keys[i], fragment)
+        if self.cache is not None:
+            self.cache.evict()
+        return fragments
+
+    def link(self, fragments: list):
+        """
+        変換結果を順に連結する
+        ラベルの番号はファイル内で1から振られているので, 前のファイルまでの数だけずらす
+        """
+        code_writer = self.code_writer
+        for text, label_count, return_label_count in fragments:
+            code_writer.write(renumberLabels(
+                text, code_writer.label_count, code_writer.return_label_count))
+            code_writer.label_count += label_count
+            code_writer.return_label_count += return_label_count
+
+
+class CommandWriter():
+    """
+    1つの.vmファイル分のCommandを順に受け取り, code_writerへ出力する
+    code_writer.foldがTrueならVMOptimizerを通す
+    code_writer.fuseがTrueなら, 比較 (とそれに続くnot) を次のコマンドまで出力せずに持っておき,
+    if-gotoが来たら1つの条件ジャンプにする
+    """
+
+    def __init__(self, code_writer: CodeWriter.CodeWriter, filename: str):
+        code_writer.setFileName(filename)
+        self.code_writer = code_writer
+        self.filename = filename
+        self.optimizer = VMOptimizer.VMOptimizer(code_writer) if code_writer.fold else None
+        self.pending = []  # 出力を保留している [Command, コメント]
+
+    def write(self, command: Parser.Command, text: str, line: int):
+        """
+        textとlineは出力のコメントに使う.vmファイル上のコマンドと行番号
+        """
+        comment = f"{self.filename}: {text} (line: {line})"
+        if self.optimizer is not None:
+            self.optimizer.write(command, comment)
+        elif self.code_writer.fuse:
+            self.fuse(command, comment)
+        else:
+            self.code_writer.writeComment(comment)
+            self.code_writer.writeCommand(command)
+
+    def fuse(self, command: Parser.Command, comment: str):
+        cw = self.code_writer
+        if command.type == CommandType.C_ARITHMETIC:
+            if command.arg1 in ['eq', 'gt', 'lt']:
+                self.writePending()
+                self.pending.append([command, comment])
+                return
+            if command.arg1 == 'not' and self.pending:
+                self.pending.append([command, comment])
+                return
+        elif command.type == CommandType.C_IF and self.pending:
+            for _, c in self.pending:
+                cw.writeComment(c)
+            cw.writeComment(comment)
+            negate = len(self.pending) % 2 == 0
+            cw.writeCompareIf(self.pending[0][0].arg1, command.arg1, negate)
+            self.pending = []
+            return
+        self.writePending()
+        cw.writeComment(comment)
+        cw.writeCommand(command)
+
+    def writePending(self):
+        for command, comment in self.pending:
+            self.code_writer.writeComment(comment)
+            self.code_writer.writeCommand(command)
+        self.pending = []
+
+    def close(self):
+        if self.optimizer is not None:
+            self.optimizer.flush()
+        self.writePending()
+
+
+def translateFile(code_writer: CodeWriter.CodeWriter, f: str, trace: bool = False,
+                  drop: tuple = ()):
+    """
+    1つの.vmファイルをcode_writerへ出力する
+    dropはLinkerが返した, 出力しない行の範囲
+    """
+    lines = Linker.dropLines(Linker.readLines(f), drop) if drop else f
+    translateLines(code_writer, os.path.basename(f), lines, trace)
+
+
+def translateLines(code_writer: CodeWriter.CodeWriter, filename: str, lines,
+                   trace: bool = False):
+    """
+    filenameという名前の.vmファイルとしてlines (ファイル名か行のイテラブル) を出力する
+    """
+    writer = CommandWriter(code_writer, filename)
+    parser = Parser.Parser(lines)
+    while parser.advance():
+        cmd_type = parser.commandType()
+        if trace:
+            logging.debug("%s : %s", cmd_type, parser.command)
+        if cmd_type is None:
+            raise Exception(
+                "Parser Error: command: {}".format(parser.command))
+        writer.write(parser.record, parser.command, parser.line)
+    writer.close()
+
+
+def translateSources(sources: list, optimize: bool = False, trampoline: bool = False,
+                     fold: bool = False, link: bool = False, fuse: bool = False) -> str:
+    """
+    ファイルを介さずに変換し, アセンブリの文字列を返す
+    sourcesは (ファイル名, ソース文字列または行のイテラブル) のリスト
+    """
+    buf = io.StringIO()
+    code_writer = CodeWriter.CodeWriter(buf, optimize, trampoline, fold=fold, fuse=fuse)
+    writeSources(code_writer, sources, link)
+    code_writer.flush()
+    return buf.getvalue()
+
+
+def writeSources(code_writer: CodeWriter.CodeWriter, sources: list, link: bool = False):
+    """
+    sources ((ファイル名, ソース文字列または行のイテラブル) のリスト) を順にcode_writerへ出力する
+    linkがTrueならSys.initから到達しない関数を除く
+    """
+    sources = [(filename, source.splitlines() if isinstance(source, str) else source)
+               for filename, source in sources]
+    drops = {filename: () for filename, _ in sources}
+    if link:
+        # 2回読むので行のリストにしておく
+        sources = [(filename, list(lines)) for filename, lines in sources]
+        linker = Linker.Linker()
+        for filename, lines in sources:
+            linker.scan(filename, lines)
+        drops = linker.resolve([filename for filename, _ in sources])
+    for filename, lines in sources:
+        if drops[filename]:
+            lines = Linker.dropLines(lines, drops[filename])
+        translateLines(code_writer, filename, lines)
+
+
+def translateToBuffer(f: str, drop: tuple, optimize: bool, trampoline: bool, fold: bool,
+                      fuse: bool, trace: bool):
+    """
+    ワーカープロセスで1ファイルを変換し (アセンブリ, LABEL数, RETURN数) を返す
+    """
+    if trace:
+        logging.basicConfig(level=logging.DEBUG)
+    buf = io.StringIO()
+    code_writer = CodeWriter.CodeWriter(buf, optimize, trampoline, init=False, fold=fold,
+                                        fuse=fuse)
+    translateFile(code_writer, f, trace, drop)
+    code_writer.flush()
+    return buf.getvalue(), code_writer.label_count, code_writer.return_label_count
+
+
+def renumberLabels(text: str, label_offset: int, return_label_offset: int) -> str:
+    """
+    生成されたLABEL/RETURNの番号にオフセットを足す
+    """
+    if label_offset == 0 and return_label_offset == 0:
+        return text
+    offsets = {'LABEL': label_offset, 'RETURN': return_label_offset}
+    return GENERATED_LABEL_REGREP.sub(
+        lambda m: "{}{}".format(m.group(1), int(m.group(2)) + offsets[m.group(1)]), text)
+
 
 if __name__ == '__main__':
-    VMtranslator().translate()
+    translator = VMtranslator()
+    translator.translate()
+    if translator.linker is not None:
+        print(translator.linker.report())
+    if translator.cache is not None:
+        print("cache: {} hits, {} misses".format(
+            translator.cache.hits, translator.cache.misses))
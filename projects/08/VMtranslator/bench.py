@@ -0,0 +1,557 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+REPO_DIR = os.path.join(PROJECT_DIR, '..')
+OS_DIR = os.path.join(REPO_DIR, 'tools', 'OS')
+ASSEMBLER_DIR = os.path.join(PROJECT_DIR, '06', 'assember')
+FIBONACCI_ELEMENT = os.path.join(PROJECT_DIR, '08', 'FunctionCalls', 'FibonacciElement')
+# OSの初期化だけを行うプログラム
+EMPTY_MAIN_VM = """function Main.main 0
+push constant 0
+return
+"""
+
+# 比較してif-gotoするループでOSを呼ぶプログラム (Jackのwhileはlt, not, if-gotoになる)
+LOOP_MAIN_VM = """function Main.main 1
+push constant 0
+pop local 0
+label LOOP
+push local 0
+push constant 200
+lt
+not
+if-goto END
+push local 0
+push constant 123
+call Math.multiply 2
+push constant 7
+call Math.divide 2
+call String.new 1
+call String.dispose 1
+pop temp 0
+push local 0
+push constant 1
+add
+pop local 0
+goto LOOP
+label END
+push constant 0
+return
+"""
+
+sys.path.append(os.path.join(PROJECT_DIR, '05', 'CPUEmulator'))
+sys.path.append(os.path.join(PROJECT_DIR, '08', 'VMEmulator'))
+import HackCPU  # noqa: E402
+import TestScript  # noqa: E402
+import VMEmulator  # noqa: E402
+import VMtranslator  # noqa: E402
+import CodeWriter  # noqa: E402
+import Parser  # noqa: E402
+from CommandType import CommandType  # noqa: E402
+import ModuleLoader  # noqa: E402
+
+# 06/assemberと08/VMtranslatorはどちらもParserモジュールを持つので, Assemblerは別名で読み込む
+Assembler = ModuleLoader.load(ASSEMBLER_DIR, 'Assembler')
+
+# 変更前のParserの分類: 9個の正規表現を順に試す
+LEGACY_REGREPS = {
+    CommandType.C_ARITHMETIC: re.compile("^((?:add)|(?:sub)|(?:neg)|(?:eq)|" +
+                                         "(?:gt)|(?:lt)|(?:and)|(?:or)|(?:not))$"),
+    CommandType.C_PUSH: re.compile("^push[\s]+([\w]+)[\s]+([\d]+)$"),
+    CommandType.C_POP: re.compile("^pop[\s]+([\w]+)[\s]+([\d]+)$"),
+    CommandType.C_LABEL: re.compile("^label[\s]+([\w]+[\w\d_.:]*)$"),
+    CommandType.C_GOTO: re.compile("^goto[\s]+([\w_.:]+[\w\d_.:]*)$"),
+    CommandType.C_IF: re.compile("^if-goto[\s]+([\w_.:]+[\w\d_.:]*)$"),
+    CommandType.C_FUNCTION: re.compile("^function[\s]+([\w\d_.:]+)[\s]+([\d]+)$"),
+    CommandType.C_CALL: re.compile("^call[\s]+([\w\d_.:]+)[\s]+([\d]+)$"),
+    CommandType.C_RETURN: re.compile("^return$"),
+}
+
+
+def measure(func, *args, repeat: int = 5):
+    """
+    funcを実行して (最短の実行時間[s], ピークメモリ[byte]) を返す
+    時間計測とメモリ計測は別々に実行する
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def report(name: str, elapsed: float, peak: int):
+    print("{:<16} {:>10.1f} ms {:>10.1f} KiB".format(
+        name, elapsed * 1000, peak / 1024))
+
+
+def copyProgram(src_dir: str, dst_dir: str) -> str:
+    """
+    src_dirの.vmファイルをdst_dir以下にコピーし, そのディレクトリを返す
+    (出力の.asmがリポジトリに書き込まれないように)
+    """
+    program_dir = os.path.join(dst_dir, os.path.basename(os.path.normpath(src_dir)))
+    os.makedirs(program_dir)
+    for f in sorted(glob.glob(os.path.join(src_dir, '*.vm'))):
+        shutil.copy(f, program_dir)
+    return program_dir
+
+
+def translate(argv: list):
+    VMtranslator.VMtranslator(argv).translate()
+
+
+def benchTrace(args):
+    """
+    トレースなし/ありで変換のスループットを比較
+    """
+    # トレース出力そのものではなくフォーマットとlogging呼び出しのコストを測る
+    logging.basicConfig(level=logging.DEBUG, stream=open(os.devnull, 'w'))
+    with tempfile.TemporaryDirectory() as tmp:
+        program_dir = copyProgram(args.src, tmp)
+        size = sum(os.path.getsize(f) for f in glob.glob(f"{program_dir}/*.vm"))
+        print("{} ({:.1f} KiB)".format(args.src, size / 1024))
+        for name, argv in [('quiet', [program_dir]),
+                           ('trace', [program_dir, '--trace'])]:
+            elapsed, peak = measure(translate, argv, repeat=args.repeat)
+            report(name, elapsed, peak)
+            print("{:<16} {:>10.2f} MB/s".format('', size / elapsed / 1e6))
+
+
+def buildAndRun(program_dir: str, options: list, cycles: int):
+    """
+    変換してアセンブルし, ROMサイズと停止までのサイクル数を返す
+    ROMに入らない場合サイクル数はNone
+    """
+    translate([program_dir] + options)
+    symbol_table = Assembler.SymbolTable.SymbolTable()
+    words = Assembler.assembleSinglePass(program_dir + '.asm', symbol_table)
+    if len(words) > HackCPU.ROM_SIZE:
+        return len(words), None
+    halts = VMEmulator.VMEmulator(VMEmulator.programFiles(program_dir)).halts
+    cpu = HackCPU.HackCPU(words)
+    if not cpu.run(cycles, {symbol_table.getAddress(l) for l in halts}):
+        raise Exception("Error: {} did not halt".format(program_dir))
+    return len(words), cpu.cycles
+
+
+def prepareOSPrograms(tmp: str) -> list:
+    """
+    FibonacciElementと, 空のMain.mainをtools/OSとリンクしたプログラムをtmpに用意
+    """
+    fibonacci = copyProgram(FIBONACCI_ELEMENT, tmp)
+    os_program = copyProgram(OS_DIR, tmp)
+    with open(os.path.join(os_program, 'Main.vm'), 'w') as f:
+        f.write(EMPTY_MAIN_VM)
+    return [fibonacci, os_program]
+
+
+def linkProgram(src_dir: str, tmp: str) -> str:
+    """
+    src_dirの.vmに足りないクラスをtools/OSから補ったプログラムをtmpに用意
+    """
+    program_dir = os.path.join(tmp, os.path.basename(os.path.normpath(src_dir)))
+    os.makedirs(program_dir)
+    for f in VMEmulator.programFiles(src_dir, OS_DIR):
+        shutil.copy(f, program_dir)
+    return program_dir
+
+
+def compareOptions(program_dirs: list, variants: list, cycles: int):
+    """
+    各プログラムをvariantsのオプションで変換し, ROMサイズと実行サイクル数を表示
+    """
+    for program_dir in program_dirs:
+        print(os.path.basename(program_dir))
+        for name, options in variants:
+            size, count = buildAndRun(program_dir, options, cycles)
+            print("{:<20} {:>8} words {:>12} cycles".format(
+                name, size, count if count is not None else '-'))
+
+
+def benchOptimize(args):
+    """
+    ピープホール最適化の有無でROMサイズと実行サイクル数を比較
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        compareOptions(prepareOSPrograms(tmp),
+                       [('plain', []), ('optimize', ['--optimize'])], args.cycles)
+
+
+def benchTrampoline(args):
+    """
+    call/returnのインライン展開と共有サブルーチンでROMサイズと実行サイクル数を比較
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        programs = prepareOSPrograms(tmp) + [linkProgram(d, tmp) for d in args.src]
+        compareOptions(programs, [
+            ('plain', []),
+            ('trampoline', ['--trampoline']),
+            ('optimize', ['--optimize']),
+            ('optimize+trampoline', ['--optimize', '--trampoline']),
+        ], args.cycles)
+
+
+def benchFold(args):
+    """
+    定数畳み込みとスタックトップのDへの保持の有無でROMサイズと実行サイクル数を比較
+    Sys.initのない07/08のプログラムはROMサイズだけを比較する
+    """
+    variants = [
+        ('plain', []),
+        ('fold', ['--fold']),
+        ('optimize', ['--optimize']),
+        ('optimize+fold', ['--optimize', '--fold']),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        programs = []
+        for src_dir in sorted(glob.glob(os.path.join(PROJECT_DIR, '0[78]', '*', '*'))):
+            if glob.glob(os.path.join(src_dir, '*.vm')):
+                programs.append(copyProgram(src_dir, tmp))
+        runnable = [d for d in programs if os.path.exists(os.path.join(d, 'Sys.vm'))]
+        for program_dir in programs:
+            if program_dir in runnable:
+                continue
+            print(os.path.basename(program_dir))
+            for name, options in variants:
+                translate([program_dir] + options)
+                size = len(Assembler.assembleSinglePass(program_dir + '.asm'))
+                print("{:<20} {:>8} words".format(name, size))
+        # FibonacciElementはrunnableに含まれているので, OSのプログラムだけを足す
+        os_program = prepareOSPrograms(os.path.join(tmp, 'os'))[-1]
+        compareOptions(runnable + [os_program], variants, args.cycles)
+
+
+def runTests(programs: list, options: list) -> tuple:
+    """
+    各プログラム ((元のディレクトリ, コピー先) のリスト) をoptionsで変換して.tstを実行し,
+    (通ったテストの名前の集合, テスト数) を返す
+    """
+    tests = []
+    for src_dir, program_dir in programs:
+        for f in glob.glob(os.path.join(src_dir, '*.tst')) + glob.glob(os.path.join(src_dir, '*.cmp')):
+            shutil.copy(f, program_dir)
+        # Sys.initのないテストはSPを.tstで設定するので, ブートストラップなしで変換する
+        bootstrap = [] if os.path.exists(os.path.join(program_dir, 'Sys.vm')) else ['--no-bootstrap']
+        translate([program_dir] + options + bootstrap)
+        shutil.copy(program_dir + '.asm', program_dir)
+        tests += TestScript.findTests([program_dir])
+    results = TestScript.runTests(tests)
+    return {os.path.basename(f) for f, status, _ in results if status == 'passed'}, len(results)
+
+
+def benchFuse(args):
+    """
+    比較とif-gotoを1つのjumpにする前後で, 08のプログラムとOSのROMサイズ・実行サイクル数を比較
+    Sys.initのないプログラムはROMサイズだけを比較し, 最後に08のテストがすべて通るか確かめる
+    """
+    # (名前, オプション, 比較の基準にする変種の名前)
+    variants = [
+        ('plain', [], None),
+        ('fuse', ['--fuse'], 'plain'),
+        ('fold', ['--fold'], None),
+        ('fold+fuse', ['--fold', '--fuse'], 'fold'),
+        ('trampoline', ['--trampoline'], None),
+        ('trampoline+fuse', ['--trampoline', '--fuse'], 'trampoline'),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        sources = [d for d in sorted(glob.glob(os.path.join(PROJECT_DIR, '08', '*', '*')))
+                   if glob.glob(os.path.join(d, '*.vm'))]
+        programs = [copyProgram(d, tmp) for d in sources]
+        loop_program = copyProgram(OS_DIR, os.path.join(tmp, 'loop'))
+        with open(os.path.join(loop_program, 'Main.vm'), 'w') as f:
+            f.write(LOOP_MAIN_VM)
+        runnable = [d for d in programs if os.path.exists(os.path.join(d, 'Sys.vm'))]
+        runnable += [prepareOSPrograms(os.path.join(tmp, 'os'))[-1], loop_program]
+        for program_dir in programs + runnable[-2:]:
+            print(os.path.basename(program_dir) if program_dir != loop_program else 'OS loop')
+            results = {}
+            for name, options, base in variants:
+                if program_dir in runnable:
+                    results[name] = buildAndRun(program_dir, options, args.cycles)
+                else:
+                    translate([program_dir] + options)
+                    results[name] = (len(Assembler.assembleSinglePass(program_dir + '.asm')),
+                                     None)
+                size, count = results[name]
+                line = "{:<16} {:>8} words {:>12} cycles".format(
+                    name, size, count if count is not None else '-')
+                if base is not None:
+                    base_size, base_count = results[base]
+                    line += "  {:>+7.1f} % words".format((size / base_size - 1) * 100)
+                    if count is not None:
+                        line += " {:>+7.1f} % cycles".format((count / base_count - 1) * 100)
+                print(line)
+
+        for name, options, _ in variants:
+            passed, total = runTests(list(zip(sources, programs)), options)
+            print("{:<16} {}/{} tests passed".format(name, len(passed), total))
+            if len(passed) != total:
+                raise Exception("Error: {} failed {} of {} tests".format(
+                    name, total - len(passed), total))
+
+
+def benchLink(args):
+    """
+    到達しない関数を取り除く前後でROMサイズと変換/アセンブルの時間を比較
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        programs = prepareOSPrograms(tmp) + [linkProgram(d, tmp) for d in args.src]
+        for program_dir in programs:
+            print(os.path.basename(program_dir))
+            for name, options in [('plain', []), ('link', ['--link'])]:
+                argv = [program_dir] + options
+                translate_time, _ = measure(translate, argv, repeat=args.repeat)
+                assemble_time, _ = measure(
+                    Assembler.assembleSinglePass, program_dir + '.asm', repeat=args.repeat)
+                size = len(Assembler.assembleSinglePass(program_dir + '.asm'))
+                print("{:<8} {:>8} words {:>8.1f} ms translate {:>8.1f} ms assemble".format(
+                    name, size, translate_time * 1000, assemble_time * 1000))
+            translator = VMtranslator.VMtranslator([program_dir, '--link'])
+            print(translator.linker.report().split('\n')[0])
+
+
+def benchParallel(args):
+    """
+    逐次変換とプロセスプールでの並列変換の時間を比較し, 出力が一致するか確認
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        program_dir = copyProgram(args.src, tmp)
+        print("{} ({} files)".format(
+            args.src, len(glob.glob(os.path.join(program_dir, '*.vm')))))
+        outputs = {}
+        for workers in [1] + args.workers:
+            name = 'serial' if workers == 1 else f"-j {workers}"
+            argv = [program_dir, '-j', str(workers)] + args.options
+            elapsed, peak = measure(translate, argv, repeat=args.repeat)
+            report(name, elapsed, peak)
+            with open(program_dir + '.asm') as f:
+                outputs[name] = f.read()
+        if len(set(outputs.values())) != 1:
+            raise Exception("Error: parallel output differs from serial output")
+
+
+def benchCache(args):
+    """
+    キャッシュなし/空のキャッシュ/変更なし/Main.vmだけ変更で再変換の時間を比較
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        program_dir = prepareOSPrograms(tmp)[1]
+        cache = ['--cache', os.path.join(tmp, 'cache')] + args.options
+        main_vm = os.path.join(program_dir, 'Main.vm')
+
+        def editMain():
+            with open(main_vm, 'a') as f:
+                f.write("function Main.edited 0\npush constant 1\nreturn\n")
+
+        baseline = None
+        for name, options, edit in [('no cache', args.options, None),
+                                    ('cold', cache, None),
+                                    ('warm', cache, None),
+                                    ('edit Main.vm', cache, editMain)]:
+            if edit is not None:
+                edit()
+            translator = VMtranslator.VMtranslator([program_dir] + options)
+            start = time.perf_counter()
+            translator.translate()
+            elapsed = time.perf_counter() - start
+            if baseline is None:
+                baseline = elapsed
+                hits = misses = '-'
+            else:
+                hits, misses = translator.cache.hits, translator.cache.misses
+            print("{:<14} {:>8.1f} ms  hit {:>2} miss {:>2}  saved {:>8.1f} ms".format(
+                name, elapsed * 1000, hits, misses, (baseline - elapsed) * 1000))
+            if edit is not None:
+                # 変更後の出力がキャッシュなしの変換と一致するか
+                with open(program_dir + '.asm') as f:
+                    cached = f.read()
+                translate([program_dir] + args.options)
+                with open(program_dir + '.asm') as f:
+                    if f.read() != cached:
+                        raise Exception("Error: cached output differs")
+
+
+def makeLargeSource(src_dir: str, dst: str, size: int):
+    """
+    src_dirの.vmを連結したものをsize byte以上になるまで繰り返した1つの.vmを作る
+    (関数名は重複するが, 変換の速度とメモリを測るだけなので構わない)
+    """
+    text = ''
+    for f in sorted(glob.glob(os.path.join(src_dir, '*.vm'))):
+        with open(f) as src:
+            text += src.read() + '\n'
+    with open(dst, 'w') as f:
+        written = 0
+        while written < size:
+            f.write(text)
+            written += len(text)
+
+
+def runLarge(args):
+    """
+    (子プロセス用) 1回変換して時間とピークRSSをJSONで出力
+    """
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    with CodeWriter.CodeWriter(args.src[:-3] + '.asm') as code_writer:
+        if args.reader == 'readline':
+            with open(args.src) as f:
+                VMtranslator.translateLines(code_writer, os.path.basename(args.src), f)
+        else:
+            VMtranslator.translateFile(code_writer, args.src)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'elapsed': elapsed, 'baseline': baseline,
+                      'peak': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+
+
+def benchLarge(args):
+    """
+    大きな合成ソースで, 行ごとのreadlineとメモリマップ+ブロック処理を比較
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, 'Large.vm')
+        makeLargeSource(args.src, src, args.size_mb * 1024 * 1024)
+        size = os.path.getsize(src)
+        print("{} ({:.1f} MB)".format(args.src, size / 1e6))
+        for reader in ['readline', 'mmap']:
+            result = subprocess.run(
+                [sys.executable, __file__, 'large-run', src, reader],
+                check=True, stdout=subprocess.PIPE, text=True)
+            r = json.loads(result.stdout)
+            # ru_maxrssはLinuxではKiB単位
+            print("{:<10} {:>8.1f} s {:>8.2f} MB/s  peak RSS {:>7.1f} MiB (+{:.1f} MiB)".format(
+                reader, r['elapsed'], size / r['elapsed'] / 1e6, r['peak'] / 1024,
+                (r['peak'] - r['baseline']) / 1024))
+
+
+def classifyLegacy(commands: list) -> list:
+    result = []
+    for command in commands:
+        for t, r in LEGACY_REGREPS.items():
+            m = r.match(command)
+            if m:
+                arg1 = m.group(1) if t != CommandType.C_RETURN else None
+                arg2 = int(m.group(2)) if t in [
+                    CommandType.C_PUSH, CommandType.C_POP,
+                    CommandType.C_FUNCTION, CommandType.C_CALL] else None
+                result.append((t, arg1, arg2))
+                break
+        else:
+            result.append(None)
+    return result
+
+
+def classifyRecords(commands: list) -> list:
+    result = []
+    for command in commands:
+        record = Parser.Parser.parse(command)
+        result.append(None if record is None else (record.type, record.arg1, record.arg2))
+    return result
+
+
+def classifyRecordsCold(commands: list) -> list:
+    Parser.PARSED_COMMANDS.clear()
+    return classifyRecords(commands)
+
+
+def benchParse(args):
+    """
+    正規表現を順に試す分類と, 最初のトークンの表引きによる分類を比較
+    """
+    files = sorted(glob.glob(os.path.join(PROJECT_DIR, '*', '*', '*', '*.vm'))) + \
+        sorted(glob.glob(os.path.join(OS_DIR, '*.vm')))
+    commands = []
+    for f in files:
+        parser = Parser.Parser(f)
+        while parser.advance():
+            commands.append(parser.command)
+    print("{} files, {} commands".format(len(files), len(commands)))
+    for name, func in [('regex list', classifyLegacy),
+                       ('first token cold', classifyRecordsCold),
+                       ('first token', classifyRecords)]:
+        elapsed, peak = measure(func, commands, repeat=args.repeat)
+        report(name, elapsed, peak)
+        print("{:<16} {:>10.2f} Mcmd/s".format('', len(commands) / elapsed / 1e6))
+    if classifyLegacy(commands) != classifyRecords(commands):
+        raise Exception("Error: classification differs")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='VM translator benchmarks.')
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    subparsers = arg_parser.add_subparsers(dest='bench', required=True)
+
+    trace = subparsers.add_parser('trace', help=benchTrace.__doc__)
+    trace.add_argument('src', type=str, nargs='?', default=OS_DIR)
+    trace.set_defaults(func=benchTrace)
+
+    optimize = subparsers.add_parser('optimize', help=benchOptimize.__doc__)
+    optimize.add_argument('--cycles', type=int, default=100000000)
+    optimize.set_defaults(func=benchOptimize)
+
+    trampoline = subparsers.add_parser('trampoline', help=benchTrampoline.__doc__)
+    trampoline.add_argument('src', type=str, nargs='*',
+                            help='extra .vm directories (linked with tools/OS)')
+    trampoline.add_argument('--cycles', type=int, default=100000000)
+    trampoline.set_defaults(func=benchTrampoline)
+
+    fold = subparsers.add_parser('fold', help=benchFold.__doc__)
+    fold.add_argument('--cycles', type=int, default=100000000)
+    fold.set_defaults(func=benchFold)
+
+    fuse = subparsers.add_parser('fuse', help=benchFuse.__doc__)
+    fuse.add_argument('--cycles', type=int, default=100000000)
+    fuse.set_defaults(func=benchFuse)
+
+    link = subparsers.add_parser('link', help=benchLink.__doc__)
+    link.add_argument('src', type=str, nargs='*',
+                      help='extra .vm directories (linked with tools/OS)')
+    link.set_defaults(func=benchLink)
+
+    parallel = subparsers.add_parser('parallel', help=benchParallel.__doc__)
+    parallel.add_argument('src', type=str, nargs='?', default=OS_DIR)
+    parallel.add_argument('--workers', type=int, nargs='+', default=[2, 4, 8])
+    parallel.add_argument('--options', type=str, nargs='*', default=[],
+                          help='extra VMtranslator options (e.g. --optimize)')
+    parallel.set_defaults(func=benchParallel)
+
+    cache = subparsers.add_parser('cache', help=benchCache.__doc__)
+    cache.add_argument('--options', type=str, nargs='*', default=[],
+                       help='extra VMtranslator options (e.g. --optimize)')
+    cache.set_defaults(func=benchCache)
+
+    parse = subparsers.add_parser('parse', help=benchParse.__doc__)
+    parse.set_defaults(func=benchParse)
+
+    large = subparsers.add_parser('large', help=benchLarge.__doc__)
+    large.add_argument('src', type=str, nargs='?', default=OS_DIR)
+    large.add_argument('--size-mb', type=int, default=32)
+    large.set_defaults(func=benchLarge)
+
+    large_run = subparsers.add_parser('large-run', help=runLarge.__doc__)
+    large_run.add_argument('src', type=str)
+    large_run.add_argument('reader', choices=['readline', 'mmap'])
+    large_run.set_defaults(func=runLarge)
+
+    args = arg_parser.parse_args()
+    args.func(args)
@@ -0,0 +1,389 @@
+import JackTokenizer
+from JackTokenizer import KEYWORD, SYMBOL, IDENTIFIER, INT_CONST, STRING_CONST
+from SymbolTable import SymbolTable
+from VMWriter import VMWriter
+
+
+class CompilationEngine():
+    """
+    再帰下降でJackのクラスを1つ読み, 構文木を作らずにVMコマンドを出力する
+    """
+    # 二項演算子 -> VMコマンド (乗除算はOSの関数呼び出し)
+    binary_ops = {
+        '+': 'add',
+        '-': 'sub',
+        '&': 'and',
+        '|': 'or',
+        '<': 'lt',
+        '>': 'gt',
+        '=': 'eq',
+    }
+    call_ops = {
+        '*': 'Math.multiply',
+        '/': 'Math.divide',
+    }
+    unary_ops = {
+        '-': 'neg',
+        '~': 'not',
+    }
+    statement_keywords = frozenset(['let', 'if', 'while', 'do', 'return'])
+    type_keywords = frozenset(['int', 'char', 'boolean'])
+
+    def __init__(self, tokenizer: JackTokenizer.JackTokenizer, vm_writer: VMWriter):
+        self.tokenizer = tokenizer
+        self.vm_writer = vm_writer
+        self.symbol_table = SymbolTable()
+        self.class_name = None
+        self.if_count = 0
+        self.while_count = 0
+        tokenizer.advance()
+
+    # ---- トークンの読み出し ----
+
+    def error(self, expected: str):
+        tokenizer = self.tokenizer
+        raise Exception("Error: expected {} but got {!r} (line: {})".format(
+            expected, tokenizer.value, tokenizer.line()))
+
+    def take(self) -> str:
+        """
+        現在のトークンの値を返して次へ進む
+        """
+        value = self.tokenizer.value
+        self.tokenizer.advance()
+        return value
+
+    def expect(self, value: str) -> str:
+        if self.tokenizer.value != value or self.tokenizer.token_type not in [KEYWORD, SYMBOL]:
+            self.error(repr(value))
+        return self.take()
+
+    def expectIdentifier(self) -> str:
+        if self.tokenizer.token_type != IDENTIFIER:
+            self.error('identifier')
+        return self.take()
+
+    def expectType(self, allow_void: bool = False) -> str:
+        tokenizer = self.tokenizer
+        if tokenizer.token_type == IDENTIFIER or tokenizer.token_type == KEYWORD and (
+                tokenizer.value in self.type_keywords or allow_void and tokenizer.value == 'void'):
+            return self.take()
+        self.error('type')
+
+    def at(self, value: str) -> bool:
+        return self.tokenizer.value == value and self.tokenizer.token_type in [KEYWORD, SYMBOL]
+
+    # ---- プログラムの構造 ----
+
+    def compileClass(self):
+        """
+        'class' className '{' classVarDec* subroutineDec* '}'
+        """
+        self.expect('class')
+        self.class_name = self.expectIdentifier()
+        self.expect('{')
+        while self.at('static') or self.at('field'):
+            self.compileClassVarDec()
+        while self.at('constructor') or self.at('function') or self.at('method'):
+            self.compileSubroutine()
+        self.expect('}')
+        if self.tokenizer.token_type is not None:
+            self.error('end of file')
+
+    def compileClassVarDec(self):
+        kind = self.take()
+        var_type = self.expectType()
+        self.symbol_table.define(self.expectIdentifier(), var_type, kind)
+        while self.at(','):
+            self.take()
+            self.symbol_table.define(self.expectIdentifier(), var_type, kind)
+        self.expect(';')
+
+    def compileSubroutine(self):
+        """
+        ('constructor' | 'function' | 'method') ('void' | type) subroutineName
+        '(' parameterList ')' subroutineBody
+        """
+        symbol_table = self.symbol_table
+        symbol_table.startSubroutine()
+        self.if_count = 0
+        self.while_count = 0
+        kind = self.take()
+        self.expectType(allow_void=True)
+        name = self.expectIdentifier()
+        if kind == 'method':
+            # argument 0はthis
+            symbol_table.define('this', self.class_name, SymbolTable.ARG)
+        self.expect('(')
+        self.compileParameterList()
+        self.expect(')')
+
+        self.expect('{')
+        while self.at('var'):
+            self.compileVarDec()
+        vm_writer = self.vm_writer
+        vm_writer.writeFunction(f"{self.class_name}.{name}",
+                                symbol_table.varCount(SymbolTable.VAR))
+        if kind == 'constructor':
+            vm_writer.writePush('constant', symbol_table.varCount(SymbolTable.FIELD))
+            vm_writer.writeCall('Memory.alloc', 1)
+            vm_writer.writePop('pointer', 0)
+        elif kind == 'method':
+            vm_writer.writePush('argument', 0)
+            vm_writer.writePop('pointer', 0)
+        self.compileStatements()
+        self.expect('}')
+
+    def compileParameterList(self):
+        if self.at(')'):
+            return
+        while True:
+            var_type = self.expectType()
+            self.symbol_table.define(self.expectIdentifier(), var_type, SymbolTable.ARG)
+            if not self.at(','):
+                return
+            self.take()
+
+    def compileVarDec(self):
+        self.take()
+        var_type = self.expectType()
+        self.symbol_table.define(self.expectIdentifier(), var_type, SymbolTable.VAR)
+        while self.at(','):
+            self.take()
+            self.symbol_table.define(self.expectIdentifier(), var_type, SymbolTable.VAR)
+        self.expect(';')
+
+    # ---- 文 ----
+
+    def compileStatements(self):
+        tokenizer = self.tokenizer
+        while tokenizer.token_type == KEYWORD and tokenizer.value in self.statement_keywords:
+            keyword = tokenizer.value
+            if keyword == 'let':
+                self.compileLet()
+            elif keyword == 'if':
+                self.compileIf()
+            elif keyword == 'while':
+                self.compileWhile()
+            elif keyword == 'do':
+                self.compileDo()
+            else:
+                self.compileReturn()
+
+    def compileLet(self):
+        """
+        'let' varName ('[' expression ']')? '=' expression ';'
+        """
+        vm_writer = self.vm_writer
+        self.take()
+        name = self.expectIdentifier()
+        segment, index = self.variable(name)
+        if self.at('['):
+            self.take()
+            vm_writer.writePush(segment, index)
+            self.compileExpression()
+            self.expect(']')
+            vm_writer.writeArithmetic('add')
+            self.expect('=')
+            self.compileExpression()
+            # 右辺でpointer 1が変わるかもしれないので, 値を退避してからthatを設定する
+            vm_writer.writePop('temp', 0)
+            vm_writer.writePop('pointer', 1)
+            vm_writer.writePush('temp', 0)
+            vm_writer.writePop('that', 0)
+        else:
+            self.expect('=')
+            self.compileExpression()
+            vm_writer.writePop(segment, index)
+        self.expect(';')
+
+    def compileIf(self):
+        """
+        'if' '(' expression ')' '{' statements '}' ('else' '{' statements '}')?
+        """
+        vm_writer = self.vm_writer
+        n = self.if_count
+        self.if_count += 1
+        self.take()
+        self.expect('(')
+        self.compileExpression()
+        self.expect(')')
+        vm_writer.writeIf(f"IF_TRUE{n}")
+        vm_writer.writeGoto(f"IF_FALSE{n}")
+        vm_writer.writeLabel(f"IF_TRUE{n}")
+        self.expect('{')
+        self.compileStatements()
+        self.expect('}')
+        if self.at('else'):
+            self.take()
+            vm_writer.writeGoto(f"IF_END{n}")
+            vm_writer.writeLabel(f"IF_FALSE{n}")
+            self.expect('{')
+            self.compileStatements()
+            self.expect('}')
+            vm_writer.writeLabel(f"IF_END{n}")
+        else:
+            vm_writer.writeLabel(f"IF_FALSE{n}")
+
+    def compileWhile(self):
+        """
+        'while' '(' expression ')' '{' statements '}'
+        """
+        vm_writer = self.vm_writer
+        n = self.while_count
+        self.while_count += 1
+        self.take()
+        vm_writer.writeLabel(f"WHILE_EXP{n}")
+        self.expect('(')
+        self.compileExpression()
+        self.expect(')')
+        vm_writer.writeArithmetic('not')
+        vm_writer.writeIf(f"WHILE_END{n}")
+        self.expect('{')
+        self.compileStatements()
+        self.expect('}')
+        vm_writer.writeGoto(f"WHILE_EXP{n}")
+        vm_writer.writeLabel(f"WHILE_END{n}")
+
+    def compileDo(self):
+        """
+        'do' subroutineCall ';'  (戻り値は捨てる)
+        """
+        self.take()
+        self.compileSubroutineCall(self.expectIdentifier())
+        self.vm_writer.writePop('temp', 0)
+        self.expect(';')
+
+    def compileReturn(self):
+        """
+        'return' expression? ';'  (voidの場合は0を返す)
+        """
+        self.take()
+        if self.at(';'):
+            self.vm_writer.writePush('constant', 0)
+        else:
+            self.compileExpression()
+        self.vm_writer.writeReturn()
+        self.expect(';')
+
+    # ---- 式 ----
+
+    def compileExpression(self):
+        """
+        term (op term)*  (優先順位はなく左から順に計算する)
+        """
+        tokenizer = self.tokenizer
+        self.compileTerm()
+        while tokenizer.token_type == SYMBOL:
+            op = tokenizer.value
+            if op in self.binary_ops:
+                self.take()
+                self.compileTerm()
+                self.vm_writer.writeArithmetic(self.binary_ops[op])
+            elif op in self.call_ops:
+                self.take()
+                self.compileTerm()
+                self.vm_writer.writeCall(self.call_ops[op], 2)
+            else:
+                return
+
+    def compileTerm(self):
+        tokenizer = self.tokenizer
+        vm_writer = self.vm_writer
+        token_type = tokenizer.token_type
+        value = tokenizer.value
+        if token_type == INT_CONST:
+            self.take()
+            vm_writer.writePush('constant', value)
+        elif token_type == STRING_CONST:
+            self.take()
+            vm_writer.writePush('constant', len(value))
+            vm_writer.writeCall('String.new', 1)
+            for c in value:
+                vm_writer.writePush('constant', ord(c))
+                vm_writer.writeCall('String.appendChar', 2)
+        elif token_type == KEYWORD:
+            self.take()
+            if value == 'true':
+                vm_writer.writePush('constant', 0)
+                vm_writer.writeArithmetic('not')
+            elif value in ['false', 'null']:
+                vm_writer.writePush('constant', 0)
+            elif value == 'this':
+                vm_writer.writePush('pointer', 0)
+            else:
+                self.error('term')
+        elif token_type == IDENTIFIER:
+            self.take()
+            if self.at('['):
+                self.take()
+                vm_writer.writePush(*self.variable(value))
+                self.compileExpression()
+                self.expect(']')
+                vm_writer.writeArithmetic('add')
+                vm_writer.writePop('pointer', 1)
+                vm_writer.writePush('that', 0)
+            elif self.at('(') or self.at('.'):
+                self.compileSubroutineCall(value)
+            else:
+                vm_writer.writePush(*self.variable(value))
+        elif token_type == SYMBOL and value == '(':
+            self.take()
+            self.compileExpression()
+            self.expect(')')
+        elif token_type == SYMBOL and value in self.unary_ops:
+            self.take()
+            self.compileTerm()
+            vm_writer.writeArithmetic(self.unary_ops[value])
+        else:
+            self.error('term')
+
+    def compileSubroutineCall(self, name: str):
+        """
+        name '(' expressionList ')' | (className | varName) '.' name '(' expressionList ')'
+        nameは読み終わっている
+        """
+        vm_writer = self.vm_writer
+        num_args = 0
+        if self.at('.'):
+            self.take()
+            method = self.expectIdentifier()
+            entry = self.symbol_table.lookup(name)
+            if entry is not None:
+                # 変数のメソッド呼び出し: 変数をthisとして渡す
+                var_type, kind, index = entry
+                vm_writer.writePush(SymbolTable.segments[kind], index)
+                num_args = 1
+                function = f"{var_type}.{method}"
+            else:
+                function = f"{name}.{method}"
+        else:
+            # 自分のクラスのメソッド呼び出し
+            vm_writer.writePush('pointer', 0)
+            num_args = 1
+            function = f"{self.class_name}.{name}"
+        self.expect('(')
+        num_args += self.compileExpressionList()
+        self.expect(')')
+        vm_writer.writeCall(function, num_args)
+
+    def compileExpressionList(self) -> int:
+        if self.at(')'):
+            return 0
+        count = 1
+        self.compileExpression()
+        while self.at(','):
+            self.take()
+            self.compileExpression()
+            count += 1
+        return count
+
+    def variable(self, name: str):
+        """
+        変数の (セグメント, 番号) を返す
+        """
+        entry = self.symbol_table.lookup(name)
+        if entry is None:
+            raise Exception("Error: undefined variable: {} (line: {})".format(
+                name, self.tokenizer.line()))
+        return SymbolTable.segments[entry[1]], entry[2]
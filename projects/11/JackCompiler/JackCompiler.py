@@ -0,0 +1,111 @@
+import CompilationEngine
+import JackTokenizer
+import VMWriter
+import argparse
+import glob
+import io
+import os
+
+# VMWriterが08/VMtranslatorをsys.pathに追加している
+import CodeWriter  # noqa: E402
+import VMtranslator  # noqa: E402
+
+
+def compileFile(jack_file: str, vm_writer: VMWriter.VMWriter):
+    """
+    1つの.jackファイル (またはソースの文字列) をvm_writerへ出力する
+    """
+    engine = CompilationEngine.CompilationEngine(
+        JackTokenizer.JackTokenizer(jack_file), vm_writer)
+    engine.compileClass()
+    vm_writer.close()
+
+
+def compileToText(jack_file: str) -> str:
+    """
+    1つの.jackファイルを.vmのテキストにして返す
+    """
+    buf = io.StringIO()
+    engine = CompilationEngine.CompilationEngine(
+        JackTokenizer.JackTokenizer(jack_file), VMWriter.VMWriter(buf))
+    engine.compileClass()
+    return buf.getvalue()
+
+
+def vmName(jack_file: str) -> str:
+    return os.path.basename(jack_file)[:-5] + '.vm'
+
+
+def osFiles(jack_files: list, os_dir: str) -> list:
+    """
+    jack_filesにないクラスの.vmファイルをos_dirから選ぶ
+    """
+    classes = {vmName(f) for f in jack_files}
+    return [f for f in sorted(glob.glob(f"{os_dir}/*.vm"))
+            if os.path.basename(f) not in classes]
+
+
+def compileToCodeWriter(code_writer: CodeWriter.CodeWriter, jack_files: list,
+                        vm_files: list = ()):
+    """
+    .jackを.vmに書き出さずにcode_writerへ直接変換し, vm_filesも続けて変換する
+    出力は.vmを書き出してからVMtranslatorで変換した場合と同じ
+    """
+    for f in jack_files:
+        command_writer = VMtranslator.CommandWriter(code_writer, vmName(f))
+        compileFile(f, VMWriter.VMWriter(command_writer=command_writer))
+    for f in vm_files:
+        VMtranslator.translateFile(code_writer, f)
+
+
+class JackCompiler():
+    def __init__(self, argv: list = None):
+        self.parser = argparse.ArgumentParser(
+            description='Compile jack file or directory to vm files (or a single asm file).')
+        self.parser.add_argument('path', type=str, help='jack file or directory')
+        self.parser.add_argument('--asm', action='store_true',
+                                 help='translate to a single asm file in-process '
+                                 'instead of writing vm files')
+        self.parser.add_argument('--os', type=str, default=None,
+                                 help='with --asm, add vm files of missing classes from this directory')
+        self.parser.add_argument('--optimize', action='store_true',
+                                 help='with --asm, run the peephole optimizer')
+        self.parser.add_argument('--trampoline', action='store_true',
+                                 help='with --asm, share one call/return subroutine')
+        self.parser.add_argument('--fold', action='store_true',
+                                 help='with --asm, fold constants within basic blocks')
+        self.parser.add_argument('--fuse', action='store_true',
+                                 help='with --asm, turn eq/gt/lt (and not) followed by if-goto into one jump')
+        args = self.parser.parse_args(argv)
+        path = args.path
+        self.args = args
+
+        if os.path.isfile(path):
+            if not path.endswith('.jack'):
+                raise Exception("path: file name should end with \".jack\".")
+            self.files = [path]
+            self.asm_file = "{}.asm".format(path[:-5])
+        elif os.path.isdir(path):
+            if path.endswith('/'):
+                path = path[:-1]
+            self.files = glob.glob(f"{path}/*.jack")
+            self.asm_file = "{}.asm".format(path)
+        else:
+            raise Exception("Unsupport File Type.")
+
+    def compile(self):
+        args = self.args
+        if not args.asm:
+            for f in self.files:
+                with open(f[:-5] + '.vm', 'w') as dst:
+                    compileFile(f, VMWriter.VMWriter(dst))
+            return
+        vm_files = osFiles(self.files, args.os) if args.os is not None else []
+        code_writer = CodeWriter.CodeWriter(
+            self.asm_file, args.optimize, args.trampoline, fold=args.fold, fuse=args.fuse)
+        compileToCodeWriter(code_writer, self.files, vm_files)
+        code_writer.close()
+
+
+if __name__ == '__main__':
+    JackCompiler().compile()
@@ -0,0 +1,97 @@
+import re
+
+KEYWORD = 'keyword'
+SYMBOL = 'symbol'
+IDENTIFIER = 'identifier'
+INT_CONST = 'integerConstant'
+STRING_CONST = 'stringConstant'
+
+KEYWORDS = frozenset([
+    'class', 'constructor', 'function', 'method', 'field', 'static', 'var',
+    'int', 'char', 'boolean', 'void', 'true', 'false', 'null', 'this',
+    'let', 'do', 'if', 'else', 'while', 'return',
+])
+MAX_INT = 32767
+
+# 空白とコメントはグループなしで読み飛ばす. どれにもマッチしない文字はerror
+TOKEN_REGREP = re.compile(r"""
+    \s+ | //[^\n]* | /\*.*?\*/
+    | (?P<integerConstant>\d+)
+    | "(?P<stringConstant>[^"\n]*)"
+    | (?P<symbol>[{}()\[\].,;+\-*/&|<>=~])
+    | (?P<word>[A-Za-z_]\w*)
+    | (?P<error>.)
+""", re.S | re.X)
+
+
+def lineOf(text: str, pos: int) -> int:
+    """
+    textのpos文字目の行番号 (エラーのときだけ数える)
+    """
+    return text.count('\n', 0, pos) + 1
+
+
+def tokenize(text: str):
+    """
+    (トークンの種類, 値, 位置) を1つずつ返す. トークンのリストは作らない
+    整数定数の値はint, それ以外はstr
+    """
+    for m in TOKEN_REGREP.finditer(text):
+        kind = m.lastgroup
+        if kind is None:
+            continue
+        value = m.group(kind)
+        if kind == 'word':
+            yield (KEYWORD if value in KEYWORDS else IDENTIFIER), value, m.start()
+        elif kind == SYMBOL or kind == STRING_CONST:
+            yield kind, value, m.start()
+        elif kind == INT_CONST:
+            if int(value) > MAX_INT:
+                raise Exception("Error: integer constant out of range: {} (line: {})".format(
+                    value, lineOf(text, m.start())))
+            yield kind, int(value), m.start()
+        else:
+            raise Exception("Error: unexpected character: {!r} (line: {})".format(
+                value, lineOf(text, m.start())))
+
+
+class JackTokenizer():
+    """
+    .jackのソースから1トークンずつ読む
+    先読みは現在のトークン1つだけ
+    """
+
+    def __init__(self, file):
+        """
+        fileには.jackのファイル名か, ソースの文字列を渡す
+        """
+        if file.endswith('.jack') and '\n' not in file:
+            with open(file, 'r') as f:
+                file = f.read()
+        self.text = file
+        self.tokens = tokenize(file)
+        self.token_type = None
+        self.value = None
+        self.pos = 0
+
+    def advance(self) -> bool:
+        """
+        次のトークンを現在のトークンにする. 終わりならFalse
+        """
+        token = next(self.tokens, None)
+        if token is None:
+            self.token_type = None
+            self.value = None
+            self.pos = len(self.text)
+            return False
+        self.token_type, self.value, self.pos = token
+        return True
+
+    def tokenType(self) -> str:
+        return self.token_type
+
+    def line(self) -> int:
+        """
+        現在のトークンの行番号
+        """
+        return lineOf(self.text, self.pos)
@@ -0,0 +1,105 @@
+import JackCompiler
+from array import array
+import argparse
+import glob
+import os
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+ASSEMBLER_DIR = os.path.join(PROJECT_DIR, '06', 'assember')
+
+# VMWriterが08/VMtranslatorをsys.pathに追加している
+import CodeWriter  # noqa: E402
+import Linker  # noqa: E402
+import ModuleLoader  # noqa: E402
+import VMtranslator  # noqa: E402
+
+# 06/assemberは08/VMtranslatorとParserを, このディレクトリとSymbolTableを共有しているので, 別名で読み込む
+Assembler = ModuleLoader.load(ASSEMBLER_DIR, 'Assembler')
+StreamAssembler = ModuleLoader.load(ASSEMBLER_DIR, 'StreamAssembler')
+
+
+def programFiles(path: str, os_dir: str = None):
+    """
+    (.jackファイルのリスト, .vmファイルのリスト) を返す
+    同じクラスの.jackと.vmがあれば.jackを使い, os_dirからは足りないクラスだけを追加する
+    """
+    if os.path.isfile(path):
+        files = [path]
+    else:
+        files = glob.glob(f"{path.rstrip('/')}/*.jack") + glob.glob(f"{path.rstrip('/')}/*.vm")
+    jack_files = [f for f in files if f.endswith('.jack')]
+    classes = {JackCompiler.vmName(f) for f in jack_files}
+    vm_files = [f for f in files if f.endswith('.vm') and os.path.basename(f) not in classes]
+    if os_dir is not None:
+        classes |= {os.path.basename(f) for f in vm_files}
+        vm_files += [f for f in sorted(glob.glob(f"{os_dir}/*.vm"))
+                     if os.path.basename(f) not in classes]
+    return jack_files, vm_files
+
+
+def build(jack_files: list, vm_files: list, optimize: bool = False, trampoline: bool = False,
+          fold: bool = False, symbol_table=None, fuse: bool = False, link: bool = False) -> array:
+    """
+    .jack -> VMコマンド -> アセンブリの命令 -> 機械語 を1つのプロセス内で順に流し,
+    中間のファイルを作らずにROMイメージを返す
+    アセンブリの命令はCodeWriterが作る行の文字列のままStreamAssemblerに渡し,
+    異なる行ごとに1回だけ解析する
+    linkがTrueの場合は, Linkerが全体を2回読むので.jackを一度.vmのテキストにする
+    """
+    assembler = StreamAssembler.StreamAssembler(symbol_table)
+    code_writer = CodeWriter.CodeWriter(assembler, optimize, trampoline, fold=fold, fuse=fuse)
+    if link:
+        sources = [(JackCompiler.vmName(f), JackCompiler.compileToText(f)) for f in jack_files]
+        sources += [(os.path.basename(f), Linker.readLines(f)) for f in vm_files]
+        VMtranslator.writeSources(code_writer, sources, link=True)
+    else:
+        JackCompiler.compileToCodeWriter(code_writer, jack_files, vm_files)
+    code_writer.close()
+    return assembler.finish()
+
+
+class Pipeline():
+    def __init__(self, argv: list = None):
+        self.parser = argparse.ArgumentParser(
+            description='Build jack/vm file or directory to a single hack file in memory.')
+        self.parser.add_argument('path', type=str, help='jack/vm file or directory')
+        self.parser.add_argument('--os', type=str, default=None,
+                                 help='add vm files of missing classes from this directory')
+        self.parser.add_argument('--optimize', action='store_true',
+                                 help='run the peephole optimizer')
+        self.parser.add_argument('--trampoline', action='store_true',
+                                 help='share one call/return subroutine between all call sites')
+        self.parser.add_argument('--fold', action='store_true',
+                                 help='fold constants within basic blocks')
+        self.parser.add_argument('--fuse', action='store_true',
+                                 help='turn eq/gt/lt (and not) followed by if-goto into one jump')
+        self.parser.add_argument('--link', action='store_true',
+                                 help='drop functions unreachable from Sys.init')
+        self.parser.add_argument('--binary', action='store_true',
+                                 help='write packed big-endian words to .bin instead of .hack')
+        args = self.parser.parse_args(argv)
+        self.args = args
+        path = args.path.rstrip('/')
+        if os.path.isfile(path):
+            if not path.endswith('.jack') and not path.endswith('.vm'):
+                raise Exception("path: file name should end with \".jack\" or \".vm\".")
+            self.dst_file = path[:path.rindex('.')]
+        elif os.path.isdir(path):
+            self.dst_file = path
+        else:
+            raise Exception("Unsupport File Type.")
+        self.jack_files, self.vm_files = programFiles(path, args.os)
+
+    def build(self) -> array:
+        args = self.args
+        words = build(self.jack_files, self.vm_files, args.optimize, args.trampoline,
+                      args.fold, fuse=args.fuse, link=args.link)
+        if args.binary:
+            Assembler.writeBinary(words, self.dst_file + '.bin')
+        else:
+            Assembler.writeHack(words, self.dst_file + '.hack')
+        return words
+
+
+if __name__ == '__main__':
+    Pipeline().build()
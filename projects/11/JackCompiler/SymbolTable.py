@@ -0,0 +1,58 @@
+class SymbolTable():
+    """
+    クラススコープ (static, field) とサブルーチンスコープ (arg, var) の変数表
+    名前 -> (型, 種類, 番号)
+    """
+    STATIC = 'static'
+    FIELD = 'field'
+    ARG = 'arg'
+    VAR = 'var'
+    # 種類 -> VMのセグメント
+    segments = {
+        STATIC: 'static',
+        FIELD:  'this',
+        ARG:    'argument',
+        VAR:    'local',
+    }
+
+    def __init__(self):
+        self.class_scope = {}
+        self.subroutine_scope = {}
+        self.counts = dict.fromkeys(self.segments, 0)
+
+    def startSubroutine(self):
+        """
+        サブルーチンスコープを空にする
+        """
+        self.subroutine_scope = {}
+        self.counts[self.ARG] = 0
+        self.counts[self.VAR] = 0
+
+    def define(self, name: str, var_type: str, kind: str):
+        scope = self.class_scope if kind in [self.STATIC, self.FIELD] else self.subroutine_scope
+        if name in scope:
+            raise Exception("Error: Dual Definition of variable: {}".format(name))
+        scope[name] = (var_type, kind, self.counts[kind])
+        self.counts[kind] += 1
+
+    def varCount(self, kind: str) -> int:
+        return self.counts[kind]
+
+    def lookup(self, name: str):
+        """
+        (型, 種類, 番号) を返す. 定義されていなければNone
+        """
+        entry = self.subroutine_scope.get(name)
+        if entry is None:
+            entry = self.class_scope.get(name)
+        return entry
+
+    def kindOf(self, name: str):
+        entry = self.lookup(name)
+        return entry[1] if entry is not None else None
+
+    def typeOf(self, name: str) -> str:
+        return self.lookup(name)[0]
+
+    def indexOf(self, name: str) -> int:
+        return self.lookup(name)[2]
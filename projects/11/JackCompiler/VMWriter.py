@@ -0,0 +1,63 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', '08', 'VMtranslator'))
+from CommandType import CommandType  # noqa: E402
+from Parser import Command  # noqa: E402
+
+
+class VMWriter():
+    """
+    VMコマンドを.vmのテキストとして書き出すか,
+    VMtranslator.CommandWriterへCommandとして直接渡す (またはその両方)
+    """
+
+    def __init__(self, dst_file=None, command_writer=None):
+        """
+        dst_fileには書き込み可能なファイルオブジェクトを渡す
+        command_writerに渡すコメントの行番号は, テキストに書き出した場合の行番号と同じ
+        """
+        self.dst_file = dst_file
+        self.command_writer = command_writer
+        self.line = 0
+
+    def write(self, cmd_type: int, text: str, arg1: str = None, arg2: int = None):
+        self.line += 1
+        if self.dst_file is not None:
+            self.dst_file.write(text + '\n')
+        if self.command_writer is not None:
+            self.command_writer.write(Command(cmd_type, arg1, arg2), text, self.line)
+
+    def writePush(self, segment: str, index: int):
+        self.write(CommandType.C_PUSH, f"push {segment} {index}", segment, index)
+
+    def writePop(self, segment: str, index: int):
+        self.write(CommandType.C_POP, f"pop {segment} {index}", segment, index)
+
+    def writeArithmetic(self, command: str):
+        self.write(CommandType.C_ARITHMETIC, command, command)
+
+    def writeLabel(self, label: str):
+        self.write(CommandType.C_LABEL, f"label {label}", label)
+
+    def writeGoto(self, label: str):
+        self.write(CommandType.C_GOTO, f"goto {label}", label)
+
+    def writeIf(self, label: str):
+        self.write(CommandType.C_IF, f"if-goto {label}", label)
+
+    def writeCall(self, name: str, num_args: int):
+        self.write(CommandType.C_CALL, f"call {name} {num_args}", name, num_args)
+
+    def writeFunction(self, name: str, num_locals: int):
+        self.write(CommandType.C_FUNCTION, f"function {name} {num_locals}", name, num_locals)
+
+    def writeReturn(self):
+        self.write(CommandType.C_RETURN, 'return')
+
+    def close(self):
+        if self.dst_file is not None:
+            self.dst_file.close()
+        if self.command_writer is not None:
+            self.command_writer.close()
@@ -0,0 +1,243 @@
+import argparse
+import glob
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import Pipeline
+import JackCompiler
+import JackTokenizer
+import VMWriter
+# JackCompilerが08/VMtranslatorをsys.pathに追加している
+import CodeWriter  # noqa: E402
+import VMtranslator  # noqa: E402
+
+# 06/assemberはPipelineが別名で読み込んでいる
+Assembler = Pipeline.Assembler
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+REPO_DIR = os.path.join(PROJECT_DIR, '..')
+TOOLS_DIR = os.path.join(REPO_DIR, 'tools')
+OS_DIR = os.path.join(TOOLS_DIR, 'OS')
+
+
+def measure(func, *args, repeat: int = 5):
+    """
+    funcを実行して (最短の実行時間[s], ピークメモリ[byte]) を返す
+    時間計測とメモリ計測は別々に実行する
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def report(name: str, elapsed: float, peak: int):
+    print("{:<20} {:>10.1f} ms {:>10.1f} KiB".format(
+        name, elapsed * 1000, peak / 1024))
+
+
+def copySources(tmp: str) -> list:
+    """
+    11/と12/の.jackを含むディレクトリをtmpにコピーし, そのリストを返す
+    (出力の.vmがリポジトリに書き込まれないように)
+    """
+    dirs = []
+    for src_dir in [os.path.join(PROJECT_DIR, '12')] + \
+            sorted(glob.glob(os.path.join(PROJECT_DIR, '1[12]', '*'))):
+        if not glob.glob(os.path.join(src_dir, '*.jack')):
+            continue
+        rel = os.path.relpath(src_dir, PROJECT_DIR)
+        dst_dir = os.path.join(tmp, rel)
+        os.makedirs(dst_dir, exist_ok=True)
+        for f in glob.glob(os.path.join(src_dir, '*.jack')):
+            shutil.copy(f, dst_dir)
+        dirs.append(dst_dir)
+    return dirs
+
+
+def compileToVM(dirs: list):
+    for d in dirs:
+        JackCompiler.JackCompiler([d]).compile()
+
+
+def compileToBuffers(files: list):
+    for f in files:
+        JackCompiler.compileFile(f, VMWriter.VMWriter(io.StringIO()))
+
+
+def compileToAsm(dirs: list):
+    for d in dirs:
+        files = glob.glob(f"{d}/*.jack")
+        code_writer = CodeWriter.CodeWriter(io.StringIO())
+        JackCompiler.compileToCodeWriter(code_writer, files)
+        code_writer.flush()
+
+
+def countTokens(texts: list) -> int:
+    count = 0
+    for text in texts:
+        for _ in JackTokenizer.tokenize(text):
+            count += 1
+    return count
+
+
+def listTokens(texts: list) -> int:
+    return sum(len(list(JackTokenizer.tokenize(text))) for text in texts)
+
+
+def compileWithJava(dirs: list) -> bool:
+    """
+    tools/JackCompiler.shをディレクトリごとに起動する. javaがなければFalse
+    """
+    if shutil.which('java') is None:
+        return False
+    for d in dirs:
+        subprocess.run(['sh', os.path.join(TOOLS_DIR, 'JackCompiler.sh'), d],
+                       stdout=subprocess.DEVNULL, check=True)
+    return True
+
+
+def benchCompile(args):
+    """
+    11/と12/の全.jackのコンパイル時間をJava版のJackCompilerと比較
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        dirs = copySources(tmp)
+        files = [f for d in dirs for f in glob.glob(f"{d}/*.jack")]
+        texts = []
+        for f in files:
+            with open(f) as src:
+                texts.append(src.read())
+        size = sum(len(text) for text in texts)
+        print("{} directories, {} files ({:.1f} KiB), {} tokens".format(
+            len(dirs), len(files), size / 1024, countTokens(texts)))
+
+        elapsed, peak = measure(countTokens, texts, repeat=args.repeat)
+        report('tokenize (stream)', elapsed, peak)
+        elapsed, peak = measure(listTokens, texts, repeat=args.repeat)
+        report('tokenize (list)', elapsed, peak)
+        elapsed, peak = measure(compileToBuffers, files, repeat=args.repeat)
+        report('compile (memory)', elapsed, peak)
+        elapsed, peak = measure(compileToVM, dirs, repeat=args.repeat)
+        report('compile -> .vm', elapsed, peak)
+        elapsed, peak = measure(compileToAsm, dirs, repeat=args.repeat)
+        report('compile -> .asm', elapsed, peak)
+
+        # Java版と同じく, ディレクトリごとにプロセスを起動する場合
+        start = time.perf_counter()
+        for d in dirs:
+            subprocess.run([sys.executable, 'JackCompiler.py', d],
+                           cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        print("{:<20} {:>10.1f} ms".format('python (cli)', (time.perf_counter() - start) * 1000))
+
+        start = time.perf_counter()
+        if compileWithJava(dirs):
+            print("{:<20} {:>10.1f} ms".format('java', (time.perf_counter() - start) * 1000))
+        else:
+            print("{:<20} {:>10}".format('java', 'skipped (java not found)'))
+
+
+def buildFiles(program_dir: str, options: list):
+    """
+    今までの手順: .jack -> .vm -> .asm -> .hackをファイルを介して順に変換する
+    """
+    JackCompiler.JackCompiler([program_dir]).compile()
+    VMtranslator.VMtranslator([program_dir] + options).translate()
+    words = Assembler.assembleSinglePass(program_dir + '.asm')
+    Assembler.writeHack(words, program_dir + '.hack')
+    return words
+
+
+def buildCLI(program_dir: str, options: list):
+    """
+    今までの手順をツールごとのプロセスで実行する
+    """
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    if glob.glob(f"{program_dir}/*.jack"):
+        subprocess.run([sys.executable, 'JackCompiler.py', program_dir],
+                       cwd=base_dir, check=True)
+    subprocess.run([sys.executable, 'VMtranslator.py', program_dir] + options,
+                   cwd=os.path.join(PROJECT_DIR, '08', 'VMtranslator'), check=True)
+    subprocess.run([sys.executable, 'Assembler.py', program_dir + '.asm'],
+                   cwd=Pipeline.ASSEMBLER_DIR, check=True)
+
+
+def buildMemory(program_dir: str, options: list):
+    return Pipeline.Pipeline([program_dir] + options).build()
+
+
+def benchPipeline(args):
+    """
+    Jack -> VM -> ASM -> HACKを, ファイルを介した変換とメモリ上のパイプラインで比較
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        programs = []
+        for src_dir in [os.path.join(PROJECT_DIR, '08', 'FunctionCalls', 'FibonacciElement'),
+                        os.path.join(PROJECT_DIR, '11', 'Pong')] + args.src:
+            program_dir = os.path.join(tmp, os.path.basename(os.path.normpath(src_dir)))
+            os.makedirs(program_dir)
+            for f in glob.glob(f"{src_dir}/*.jack") + glob.glob(f"{src_dir}/*.vm"):
+                shutil.copy(f, program_dir)
+            jack_files, vm_files = Pipeline.programFiles(program_dir, OS_DIR)
+            if jack_files:
+                # VMtranslatorはディレクトリの.vmだけを変換するのでOSをコピーしておく
+                for f in vm_files:
+                    shutil.copy(f, program_dir)
+            programs.append(program_dir)
+
+        for program_dir in programs:
+            print(os.path.basename(program_dir))
+            elapsed, peak = measure(buildFiles, program_dir, args.options, repeat=args.repeat)
+            report('files', elapsed, peak)
+            start = time.perf_counter()
+            buildCLI(program_dir, args.options)
+            print("{:<20} {:>10.1f} ms".format('files (cli)', (time.perf_counter() - start) * 1000))
+            elapsed, peak = measure(buildMemory, program_dir, args.options, repeat=args.repeat)
+            report('memory', elapsed, peak)
+            expected = buildFiles(program_dir, args.options)
+            words = buildMemory(program_dir, args.options)
+            if len(words) != len(expected):
+                raise Exception("Error: ROM size differs: {} != {}".format(
+                    len(words), len(expected)))
+            print("{:<20} {:>10} words".format('', len(words)))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Jack compiler benchmarks.')
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    subparsers = arg_parser.add_subparsers(dest='bench', required=True)
+
+    compile_ = subparsers.add_parser('compile', help=benchCompile.__doc__)
+    compile_.set_defaults(func=benchCompile)
+
+    pipeline = subparsers.add_parser('pipeline', help=benchPipeline.__doc__)
+    pipeline.add_argument('src', type=str, nargs='*',
+                          help='extra .jack/.vm directories (linked with tools/OS)')
+    pipeline.add_argument('--optimize', dest='options', action='append_const',
+                          const='--optimize', default=[], help='pass --optimize to both builds')
+    pipeline.add_argument('--trampoline', dest='options', action='append_const',
+                          const='--trampoline', help='pass --trampoline to both builds')
+    pipeline.add_argument('--fold', dest='options', action='append_const',
+                          const='--fold', help='pass --fold to both builds')
+    pipeline.add_argument('--fuse', dest='options', action='append_const',
+                          const='--fuse', help='pass --fuse to both builds')
+    pipeline.add_argument('--link', dest='options', action='append_const',
+                          const='--link', help='pass --link to both builds')
+    pipeline.set_defaults(func=benchPipeline)
+
+    args = arg_parser.parse_args()
+    args.func(args)